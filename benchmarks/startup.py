@@ -0,0 +1,93 @@
+"""
+Mesure du temps de démarrage à froid de la CLI (`python -X importtime`).
+
+Importe `ftcli.cli` dans un interpréteur neuf, plusieurs fois, et échoue (code 1) si :
+- le temps d'import cumulé médian dépasse le budget ;
+- un module lourd, qui ne doit être chargé que par les commandes qui s'en servent, est importé.
+
+    python benchmarks/startup.py [--budget-ms 250] [--runs 5] [--top 10]
+
+Le budget par défaut peut aussi être fixé par la variable FTCLI_STARTUP_BUDGET_MS
+(à relever sur les machines lentes, Termux/ARM par exemple).
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+from pathlib import Path
+from typing import Dict, Tuple
+
+ROOT = Path(__file__).resolve().parent.parent
+
+# Modules qui ne doivent pas être chargés par un simple `import ftcli.cli`
+LAZY_MODULES = [
+    "httpx",
+    "diskcache",
+    "questionary",
+    "prompt_toolkit",
+    "requests",
+    "markdown_it",
+    "numpy",
+    "scipy",
+    "pymupdf",
+    "fitz",
+    "ftcli.client",
+    "ftcli.cache",
+    "ftcli.gemini_utils",
+    "ftcli.agent_api",
+    "ftcli.agent_executor",
+    "ftcli.exporter",
+    "ftcli.ranking",
+    "ftcli.pdf_text",
+]
+
+def import_times(module: str) -> Dict[str, Tuple[int, int]]:
+    """Importe `module` dans un nouvel interpréteur ; retourne {module: (self_us, cumulative_us)}."""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=ROOT, capture_output=True, text=True, check=False,
+    )
+    if result.returncode != 0:
+        sys.exit(f"L'import de {module} a échoué :\n{result.stderr}")
+    times = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        times[name.strip()] = (int(self_us), int(cumulative_us))
+    return times
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--module", default="ftcli.cli")
+    parser.add_argument("--budget-ms", type=float, default=float(os.getenv("FTCLI_STARTUP_BUDGET_MS", "250")))
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--top", type=int, default=10, help="Nombre de modules les plus lents à afficher.")
+    args = parser.parse_args()
+
+    runs = [import_times(args.module) for _ in range(args.runs)]
+    totals_ms = [run[args.module][1] / 1000 for run in runs]
+    median_ms = statistics.median(totals_ms)
+
+    dernier = runs[-1]
+    print(f"Import de {args.module} : médiane {median_ms:.1f} ms sur {args.runs} essais "
+          f"(min {min(totals_ms):.1f} ms, max {max(totals_ms):.1f} ms), budget {args.budget_ms:.0f} ms")
+    print(f"\n{args.top} modules les plus coûteux (temps cumulé, dernier essai) :")
+    for name, (_, cumulative) in sorted(dernier.items(), key=lambda kv: kv[1][1], reverse=True)[1:args.top + 1]:
+        print(f"  {cumulative / 1000:8.1f} ms  {name}")
+
+    echec = False
+    charges = [m for m in LAZY_MODULES if m in dernier]
+    if charges:
+        echec = True
+        print(f"\n❌ Modules chargés au démarrage alors qu'ils devraient l'être à la demande : {', '.join(charges)}")
+    if median_ms > args.budget_ms:
+        echec = True
+        print(f"\n❌ Budget de démarrage dépassé : {median_ms:.1f} ms > {args.budget_ms:.0f} ms")
+    if not echec:
+        print("\n✅ Démarrage dans le budget.")
+    return 1 if echec else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -2,9 +2,7 @@ import os
 import requests
 import json
 from typing import Dict, List
-from dotenv import load_dotenv
-
-load_dotenv()
+from . import settings  # charge le fichier .env
 
 DEEPSEEK_API_KEY = os.getenv("DEEPSEEK_API_KEY")
 DEEPSEEK_API_URL = "https://api.deepseek.com/chat/completions"
@@ -35,7 +33,8 @@ def get_structured_plan(user_goal: str, profil_id: int = None) -> Dict[str, List
         'Voici les fonctions que tu peux utiliser et leurs arguments exacts:\n'
         ' - `search(mots: str, departement: str = None, max_results: int = 5)`\n'
         ' - `view(offre: str)`\n'
-        ' - `match(offre: str, profil: int)`\n'
+        ' - `match(offre: str, profil: int)` : rapport détaillé pour une offre\n'
+        ' - `compare(offres: list[str], profil: int)` : score, points forts et lacunes de plusieurs offres en un seul appel ; à préférer à plusieurs `match` pour comparer des offres\n'
         ' - `adapter(offre: str, profil: int)`\n'
         ' - `suivi save <ID_OFFRE>` (note: ceci est un argument, pas une option --offre)\n\n'
         'Exemple de sortie attendue pour une demande complexe:\n'
@@ -90,7 +89,7 @@ def get_structured_plan(user_goal: str, profil_id: int = None) -> Dict[str, List
                     return {"error": f"Action mal formée : {action}"}
                 if action["name"] == "search" and "limit" in action.get("arguments", {}):
                     return {"error": "L'option '--limit' est incorrecte. Utilise '--max-results'."}
-                if action["name"] in ["match", "adapter"] and not isinstance(action["arguments"].get("profil"), int):
+                if action["name"] in ["match", "compare", "adapter"] and not isinstance(action["arguments"].get("profil"), int):
                     return {"error": f"ID de profil invalide pour {action['name']}. Un entier est requis."}
 
             return {"plan": plan_data["plan"]}
@@ -0,0 +1,292 @@
+"""
+Exécution en processus des plans de l'agent.
+
+Chaque action du plan (`search`, `view`, `match`, ...) est envoyée directement à une fonction
+Python qui partage le même FTClient, le même cache et le même jeton OAuth que les autres
+étapes. Les résultats typés (liste d'offres, rapport...) passent d'une étape à l'autre
+sans relire l'affichage.
+
+Avec un `run_id`, chaque étape terminée est enregistrée en base (`agent_steps`) : un run
+interrompu peut être repris (`ftcli agent --resume`) sans refaire les étapes réussies.
+"""
+import asyncio
+import inspect
+import re
+from dataclasses import dataclass, field
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional, Tuple
+
+import rich.box
+from rich.console import RenderableType
+from rich.markdown import Markdown
+from rich.panel import Panel
+from rich.table import Table
+from rich.text import Text
+
+from . import database
+from . import settings
+from .client import FTClient
+from .gemini_utils import (adapter_cv_ia_async, generer_lettre_motivation_ia_async, generer_rapport_matching_ia_async,
+                           match_offres_batch_async)
+from .ui_components import offre_panel, offres_table, rapport_markdown, truncate_text
+
+PLACEHOLDER_RE = re.compile(r"<ID_A_REMPLACER(?:_(\d+))?>")
+
+# Alias tolérés dans les arguments générés par le planificateur
+ARGUMENT_ALIASES = {"offre_id": "offre", "id_offre": "offre", "profil_id": "profil", "limit": "max_results", "offre_ids": "offres"}
+
+
+class AgentStepError(Exception):
+    """Échec d'une étape du plan (argument manquant, offre introuvable, erreur IA...)."""
+
+
+@dataclass
+class StepResult:
+    action: str
+    arguments: Dict[str, Any]
+    data: Any = None
+    error: Optional[str] = None
+    offre_ids: List[str] = field(default_factory=list)
+    reprise: bool = False  # résultat relu depuis un point de reprise
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None
+
+
+Handler = Callable[..., Awaitable[Any]]
+ACTIONS: Dict[str, Handler] = {}
+
+def action(*names: str):
+    """Enregistre un gestionnaire d'action sous un ou plusieurs noms."""
+    def register(handler: Handler) -> Handler:
+        for name in names:
+            ACTIONS[name] = handler
+        return handler
+    return register
+
+def normalize_action_name(name: str) -> str:
+    return " ".join(name.replace("_", " ").split())
+
+
+def _has_placeholder(value: Any) -> bool:
+    if isinstance(value, list):
+        return any(_has_placeholder(v) for v in value)
+    return isinstance(value, str) and PLACEHOLDER_RE.search(value) is not None
+
+def plan_dependencies(plan: List[Dict]) -> List[Optional[int]]:
+    """Pour chaque étape, l'index de l'étape dont elle dépend (ou None).
+
+    Une étape qui contient un placeholder `<ID_A_REMPLACER_n>` dépend de la dernière recherche
+    qui la précède ; les autres étapes sont indépendantes.
+    """
+    dependances: List[Optional[int]] = []
+    derniere_recherche: Optional[int] = None
+    for i, action_spec in enumerate(plan):
+        arguments = action_spec.get("arguments", {}) or {}
+        utilise_ids = any(_has_placeholder(v) for v in arguments.values())
+        dependances.append(derniere_recherche if utilise_ids else None)
+        if normalize_action_name(action_spec.get("name", "")) == "search":
+            derniere_recherche = i
+    return dependances
+
+
+def _profil(profil: Any) -> Dict:
+    try:
+        profil_data = database.get_profile(int(profil))
+    except (TypeError, ValueError):
+        profil_data = None
+    if not profil_data:
+        raise AgentStepError(f"Profil {profil} non trouvé.")
+    return profil_data
+
+def _check_ia(texte: str) -> str:
+    if texte.lstrip().startswith("[ERREUR"):
+        raise AgentStepError(texte.strip())
+    return texte
+
+
+class AgentExecutor:
+    """Exécute les actions d'un plan avec un FTClient partagé."""
+
+    def __init__(self, client: FTClient, use_cache: bool = True, run_id: Optional[int] = None):
+        self.client = client
+        self.use_cache = use_cache
+        self.run_id = run_id
+        self.completed: Dict[int, StepResult] = {}
+        if run_id is not None:
+            self.completed = {
+                index: StepResult(etape["action"], etape["arguments"], data=etape["data"], offre_ids=etape["offre_ids"], reprise=True)
+                for index, etape in database.get_agent_steps(run_id).items()
+            }
+
+    def _checkpoint(self, index: int, result: StepResult):
+        if self.run_id is not None:
+            database.save_agent_step(self.run_id, index, result.action, result.arguments,
+                                     data=result.data, error=result.error, offre_ids=result.offre_ids)
+
+    async def run_indexed_step(self, index: int, action_spec: Dict, offre_ids: List[str]) -> StepResult:
+        """Comme `run_step`, mais réutilise le résultat enregistré de l'étape `index` s'il existe
+        et enregistre le nouveau résultat sinon."""
+        if index in self.completed:
+            return self.completed[index]
+        result = await self.run_step(action_spec, offre_ids)
+        self._checkpoint(index, result)
+        if result.ok:
+            self.completed[index] = result
+        return result
+
+    @staticmethod
+    def resolve_arguments(arguments: Dict[str, Any], offre_ids: List[str]) -> Dict[str, Any]:
+        """Remplace les placeholders `<ID_A_REMPLACER_n>` par le n-ième ID d'offre (1 par défaut),
+        y compris dans les listes (`compare`)."""
+        def resolve(value: Any) -> Any:
+            if isinstance(value, list):
+                return [resolve(v) for v in value]
+            if isinstance(value, str) and (m := PLACEHOLDER_RE.search(value)):
+                index = int(m.group(1) or 1) - 1
+                if not 0 <= index < len(offre_ids):
+                    raise AgentStepError(f"Placeholder '{value}' sans offre correspondante ({len(offre_ids)} ID disponible(s)).")
+                return offre_ids[index]
+            return value
+        return {ARGUMENT_ALIASES.get(key, key): resolve(value) for key, value in arguments.items()}
+
+    async def run_step(self, action_spec: Dict, offre_ids: List[str]) -> StepResult:
+        """Exécute une action ; `offre_ids` sert à résoudre les placeholders."""
+        name = normalize_action_name(action_spec.get("name", ""))
+        arguments = dict(action_spec.get("arguments", {}) or {})
+        try:
+            handler = ACTIONS.get(name)
+            if handler is None:
+                raise AgentStepError(f"Action inconnue : '{name}'.")
+            arguments = self.resolve_arguments(arguments, offre_ids)
+            try:
+                inspect.signature(handler).bind(self, **arguments)
+            except TypeError as e:
+                return StepResult(name, arguments, error=f"Arguments invalides pour '{name}' : {e}")
+            data = await handler(self, **arguments)
+        except Exception as e:
+            return StepResult(name, arguments, error=str(e))
+        ids = [o.get("id") for o in data if o.get("id")] if name == "search" else []
+        return StepResult(name, arguments, data=data, offre_ids=ids)
+
+    async def run_plan(self, plan: List[Dict], parallel: int = settings.AGENT_CONCURRENCY) -> AsyncIterator[Tuple[int, StepResult]]:
+        """Exécute le plan en parallélisant les étapes indépendantes (au plus `parallel` à la fois).
+
+        Les résultats sont produits dans l'ordre du plan. Une étape dont la recherche a échoué
+        n'est pas exécutée ; les étapes indépendantes continuent. Les étapes déjà terminées
+        d'un run repris ne sont pas réexécutées.
+        """
+        dependances = plan_dependencies(plan)
+        semaphore = asyncio.Semaphore(parallel)
+        taches: List[asyncio.Task] = []
+
+        async def one(i: int) -> StepResult:
+            if i in self.completed:
+                return self.completed[i]
+            offre_ids: List[str] = []
+            if (parent := dependances[i]) is not None:
+                resultat_parent: StepResult = await taches[parent]
+                if not resultat_parent.ok:
+                    return StepResult(normalize_action_name(plan[i].get("name", "")), dict(plan[i].get("arguments", {}) or {}),
+                                      error=f"étape ignorée, la recherche de l'étape {parent + 1} a échoué.")
+                offre_ids = resultat_parent.offre_ids
+            async with semaphore:
+                return await self.run_indexed_step(i, plan[i], offre_ids)
+
+        for i in range(len(plan)):
+            taches.append(asyncio.create_task(one(i)))
+        try:
+            for i, tache in enumerate(taches):
+                yield i, await tache
+        finally:
+            for tache in taches:
+                tache.cancel()
+            await asyncio.gather(*taches, return_exceptions=True)
+
+    # --- Actions ---
+    @action("search")
+    async def search(self, mots: str, departement: Optional[str] = None, max_results: int = 5, type_contrat: Optional[str] = None) -> List[Dict]:
+        return await self.client.search_offres(mots=mots, departement=departement, max_results=int(max_results), typeContrat=type_contrat)
+
+    @action("view")
+    async def view(self, offre: str) -> Dict:
+        return await self.client.get_offre(offre)
+
+    @action("match")
+    async def match(self, offre: str, profil: int) -> Dict:
+        profil_data = _profil(profil)
+        offre_data = await self.client.get_offre(offre)
+        resultat = await generer_rapport_matching_ia_async(profil_data["analyse"], offre_data, use_cache=self.use_cache)
+        if "error" in resultat:
+            raise AgentStepError(resultat["error"])
+        database.save_match_results(profil_data["id"], [(offre_data, resultat)], source="rapport")
+        return {**resultat, "profil_id": profil_data["id"], "offre_id": offre}
+
+    @action("compare")
+    async def compare(self, offres: List[str], profil: int) -> List[Dict]:
+        """Évalue plusieurs offres en un seul appel IA (par lots) ; résultats triés par score."""
+        profil_data = _profil(profil)
+        if isinstance(offres, str):
+            offres = [offres]
+        recuperees = await asyncio.gather(*(self.client.get_offre(o) for o in dict.fromkeys(offres)), return_exceptions=True)
+        offres_data = [o for o in recuperees if isinstance(o, dict) and o]
+        if not offres_data:
+            raise AgentStepError("Aucune des offres à comparer n'a pu être récupérée.")
+        resultats = await match_offres_batch_async(profil_data["analyse"], offres_data, use_cache=self.use_cache)
+        database.save_match_results(profil_data["id"], [(o, resultats[o["id"]]) for o in offres_data if o.get("id") in resultats], source="lot")
+        if resultats and all("error" in r for r in resultats.values()):
+            raise AgentStepError(next(iter(resultats.values()))["error"])
+        intitules = {o.get("id"): o.get("intitule", "N/A") for o in offres_data}
+        lignes = [{**r, "intitule": intitules.get(r["offre_id"], "N/A")} for r in resultats.values()]
+        return sorted(lignes, key=lambda r: r.get("score", -1), reverse=True)
+
+    @action("adapter")
+    async def adapter(self, offre: str, profil: int) -> str:
+        profil_data = _profil(profil)
+        offre_data = await self.client.get_offre(offre)
+        return _check_ia(await adapter_cv_ia_async(profil_data["texte"], offre_data, use_cache=self.use_cache))
+
+    @action("lettre")
+    async def lettre(self, offre: str, profil: int) -> str:
+        profil_data = _profil(profil)
+        offre_data = await self.client.get_offre(offre)
+        return _check_ia(await generer_lettre_motivation_ia_async(profil_data["analyse"], offre_data, use_cache=self.use_cache))
+
+    @action("suivi save", "save")
+    async def suivi_save(self, offre: str) -> Dict:
+        offre_data = await self.client.get_offre(offre)
+        title = offre_data.get("intitule", "N/A"); entreprise = offre_data.get("entreprise", {}).get("nom", "N/A")
+        database.save_tracked_offers_many([{"offre_id": offre, "offre_intitule": title, "entreprise": entreprise}])
+        return {"offre_id": offre, "offre_intitule": title, "entreprise": entreprise}
+
+
+def render_step(result: StepResult) -> RenderableType:
+    """Rendu rich du résultat d'une étape."""
+    if not result.ok:
+        return Text(f"❌ L'étape a échoué : {result.error}", style="bold red")
+    if result.action == "search":
+        if not result.data:
+            return Text("⚠️ Aucune offre trouvée.", style="yellow")
+        return offres_table(result.data, f"Résultats pour '{result.arguments.get('mots', '')}'")
+    if result.action == "view":
+        return offre_panel(result.data)
+    if result.action == "match":
+        # Les runs enregistrés avant les rapports structurés contiennent un rapport Markdown
+        rapport = result.data.get("rapport") or rapport_markdown(result.data)
+        return Panel(Markdown(rapport), title="[bold]Rapport de Compatibilité[/bold]", border_style="cyan", expand=True)
+    if result.action == "compare":
+        table = Table(title="[bold]Comparaison des offres[/bold]", box=rich.box.SIMPLE)
+        table.add_column("Score", justify="right", style="magenta"); table.add_column("ID Offre", style="cyan")
+        table.add_column("Intitulé"); table.add_column("Points forts", style="green"); table.add_column("Lacunes", style="red")
+        for r in result.data:
+            score = f"{r['score']}%" if "score" in r else "[red]échec[/red]"
+            table.add_row(score, r["offre_id"], truncate_text(r["intitule"]),
+                          truncate_text(" ; ".join(r.get("strengths", []))), truncate_text(" ; ".join(r.get("gaps", []))))
+        return table
+    if result.action == "adapter":
+        return Panel(Markdown(result.data), title="[bold]CV Adapté[/bold]", border_style="cyan", expand=True)
+    if result.action == "lettre":
+        return Panel(Markdown(result.data), title="[bold]Lettre de Motivation Suggérée[/bold]", border_style="cyan", expand=True)
+    if result.action == "suivi save":
+        return Text(f"✅ Offre '{result.data['offre_intitule']}' sauvegardée !", style="bold green")
+    return Text(str(result.data))
@@ -1,20 +1,95 @@
 import asyncio
+import base64
+import hashlib
+import json
 import os
 import time
+import weakref
+from typing import IO
 import httpx
-from dotenv import load_dotenv
+from . import settings  # charge le fichier .env
 
-# Charge les variables depuis le fichier .env
-load_dotenv(dotenv_path=".env")
+try:
+    import fcntl
+except ImportError:  # plateformes sans fcntl (Windows) : pas de verrou entre processus
+    fcntl = None
 
 TOKEN_URL = (
     "https://entreprise.francetravail.fr/connexion/"
     "oauth2/access_token?realm=/partenaire"
 )
 
+class TokenStore:
+    """Jeton OAuth persistant, partagé entre les processus ftcli.
+
+    Le jeton est chiffré (Fernet) dans `settings.SECRETS_FILE` avec une clé dérivée du secret
+    client : le fichier est illisible sans le `.env`, et un changement d'identifiants l'invalide.
+    Les accès sont sérialisés par un verrou de fichier (`fcntl.flock`). Sans le paquet
+    `cryptography`, rien n'est écrit sur disque et le jeton reste en mémoire.
+    """
+
+    def __init__(self, client_id: str, client_secret: str, scope: str, path=settings.SECRETS_FILE):
+        self.path = path
+        self.lock_path = path.with_suffix(".lock")
+        self._identity = f"{client_id}:{scope}"
+        # Le secret client est déjà une valeur à forte entropie : un simple SHA-256 suffit
+        # (pas de dérivation lente, qui coûterait à chaque lancement de la CLI).
+        digest = hashlib.sha256(f"ftcli-token-store:{client_id}:{client_secret}".encode()).digest()
+        try:
+            from cryptography.fernet import Fernet
+        except ImportError:
+            self._fernet = None
+        else:
+            self._fernet = Fernet(base64.urlsafe_b64encode(digest))
+
+    @property
+    def enabled(self) -> bool:
+        return self._fernet is not None
+
+    def acquire(self, exclusive: bool = False) -> IO:
+        """Prend le verrou de fichier (partagé pour lire, exclusif pour rafraîchir) ; bloquant."""
+        f = open(self.lock_path, "a")
+        if fcntl is not None:
+            fcntl.flock(f, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+        return f
+
+    def release(self, f: IO):
+        if fcntl is not None:
+            fcntl.flock(f, fcntl.LOCK_UN)
+        f.close()
+
+    def read(self) -> tuple[str, float] | None:
+        """Retourne `(jeton, expiration)` s'il existe un jeton pour ces identifiants."""
+        if not self.enabled:
+            return None
+        try:
+            data = json.loads(self._fernet.decrypt(self.path.read_bytes()))
+        except Exception:  # fichier absent, corrompu ou chiffré avec d'autres identifiants
+            return None
+        if data.get("identity") != self._identity:
+            return None
+        return data["access_token"], float(data["expires_at"])
+
+    def write(self, token: str, expires_at: float):
+        """Écrit le jeton de façon atomique (fichier temporaire puis renommage), en mode 0600."""
+        if not self.enabled:
+            return
+        payload = json.dumps({"identity": self._identity, "access_token": token, "expires_at": expires_at})
+        tmp = self.path.with_suffix(f".{os.getpid()}.tmp")
+        fd = os.open(tmp, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with os.fdopen(fd, "wb") as f:
+            f.write(self._fernet.encrypt(payload.encode()))
+        os.replace(tmp, self.path)
+
 class Auth:
+    """Jeton OAuth client_credentials de France Travail (singleton par processus).
+
+    Le jeton est réutilisé tant qu'il reste plus de `TOKEN_EXPIRY_MARGIN` secondes de validité,
+    y compris d'un lancement de la CLI à l'autre grâce au `TokenStore`. Dans les
+    `TOKEN_REFRESH_AHEAD` dernières secondes, il est encore servi pendant qu'un nouveau jeton
+    est demandé en tâche de fond.
+    """
     _instance = None
-    _lock = asyncio.Lock()
 
     def __new__(cls, *a, **kw):
         if cls._instance is None:
@@ -22,6 +97,8 @@ class Auth:
         return cls._instance
 
     def __init__(self):
+        if getattr(self, "_initialized", False):
+            return
         self._token: str | None = None
         self._expires_at: float = 0.0
         self._client_id = os.getenv("FT_CLIENT_ID")
@@ -31,7 +108,32 @@ class Auth:
         if not self._client_id or not self._client_secret:
             raise RuntimeError("FT_CLIENT_ID ou FT_CLIENT_SECRET manquant dans .env")
 
-    async def _refresh(self):
+        self.store = TokenStore(self._client_id, self._client_secret, self._scope)
+        # Un asyncio.Lock est lié à sa boucle (la CLI en crée une par commande) :
+        # un verrou et au plus une tâche de rafraîchissement par boucle.
+        self._locks: weakref.WeakKeyDictionary = weakref.WeakKeyDictionary()
+        self._background: weakref.WeakKeyDictionary = weakref.WeakKeyDictionary()
+        self._initialized = True
+
+    def _lock(self) -> asyncio.Lock:
+        loop = asyncio.get_running_loop()
+        if loop not in self._locks:
+            self._locks[loop] = asyncio.Lock()
+        return self._locks[loop]
+
+    def _valid(self, margin: float = settings.TOKEN_EXPIRY_MARGIN) -> bool:
+        return self._token is not None and time.time() < self._expires_at - margin
+
+    def _adopt(self, stored: tuple[str, float] | None):
+        """Reprend le jeton enregistré s'il expire plus tard que celui en mémoire."""
+        if stored and stored[1] > self._expires_at:
+            self._token, self._expires_at = stored
+
+    async def _request_token(self, http: httpx.AsyncClient | None = None) -> tuple[str, float]:
+        if http is None:
+            async with httpx.AsyncClient(timeout=10.0) as client:
+                return await self._request_token(client)
+
         payload = {
             "grant_type": "client_credentials",
             "client_id": self._client_id,
@@ -39,20 +141,73 @@ class Auth:
             "scope": self._scope,
         }
 
-        async with httpx.AsyncClient(timeout=10.0) as client:
-            resp = await client.post(
-                TOKEN_URL,
-                data=payload,
-                headers={"Content-Type": "application/x-www-form-urlencoded"},
-            )
-            resp.raise_for_status()
+        resp = await http.post(
+            TOKEN_URL,
+            data=payload,
+            headers={"Content-Type": "application/x-www-form-urlencoded"},
+            timeout=10.0,
+        )
+        resp.raise_for_status()
 
         data = resp.json()
-        self._token = data["access_token"]
-        self._expires_at = time.time() + data.get("expires_in", 3600) - 60
+        return data["access_token"], time.time() + data.get("expires_in", 3600)
+
+    async def _refresh(self, http: httpx.AsyncClient | None = None, force: bool = False):
+        """Obtient un nouveau jeton, sauf si un autre processus vient de le faire.
+
+        Le verrou exclusif est attendu dans un thread pour ne pas bloquer la boucle : un seul
+        processus interroge le serveur d'authentification, les autres relisent son résultat.
+        """
+        verrou = await asyncio.to_thread(self.store.acquire, True)
+        try:
+            if not force:
+                self._adopt(self.store.read())
+            if force or not self._valid(settings.TOKEN_REFRESH_AHEAD):
+                self._token, self._expires_at = await self._request_token(http)
+                self.store.write(self._token, self._expires_at)
+        finally:
+            self.store.release(verrou)
+
+    def _refresh_in_background(self, http: httpx.AsyncClient | None):
+        loop = asyncio.get_running_loop()
+        task = self._background.get(loop)
+        if task is not None and not task.done():
+            return
+        async def refresh():
+            try:
+                async with self._lock():
+                    if not self._valid(settings.TOKEN_REFRESH_AHEAD):
+                        await self._refresh(http)
+            except Exception:
+                pass  # le jeton courant reste valide ; nouvel essai au prochain appel
+        self._background[loop] = loop.create_task(refresh())
+
+    async def wait_refresh(self):
+        """Attend la fin du rafraîchissement en tâche de fond de la boucle courante, s'il y en a un."""
+        task = self._background.get(asyncio.get_running_loop())
+        if task is not None:
+            await asyncio.gather(task, return_exceptions=True)
+
+    async def get_token(self, http: httpx.AsyncClient | None = None) -> str:
+        """Retourne un jeton valide ; `http` permet de réutiliser le pool de connexions de l'appelant."""
+        if self._valid(settings.TOKEN_REFRESH_AHEAD):
+            return self._token
+        async with self._lock():
+            if not self._valid():
+                verrou = await asyncio.to_thread(self.store.acquire, False)
+                try:
+                    self._adopt(self.store.read())
+                finally:
+                    self.store.release(verrou)
+            if not self._valid():
+                await self._refresh(http)
+            elif not self._valid(settings.TOKEN_REFRESH_AHEAD):
+                self._refresh_in_background(http)
+            return self._token
 
-    async def get_token(self) -> str:
-        async with self._lock:
-            if self._token is None or time.time() >= self._expires_at:
-                await self._refresh()
+    async def invalidate(self, rejected: str, http: httpx.AsyncClient | None = None) -> str:
+        """Remplace le jeton `rejected`, refusé par l'API (401), et retourne le nouveau."""
+        async with self._lock():
+            if self._token == rejected:
+                await self._refresh(http, force=True)
             return self._token
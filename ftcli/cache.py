@@ -1,35 +1,128 @@
 
 """
-Abstraction simple autour de DiskCache avec TTL par clé.
+Couche de cache de ftcli : un LRU en mémoire devant DiskCache, avec TTL par espace de noms.
 """
-from contextlib import asynccontextmanager
-import hashlib, json
-from typing import Any, Dict, AsyncIterator
+import hashlib, json, threading, time
+from collections import OrderedDict
+from typing import Any, Dict, NamedTuple
 import diskcache as dc
-from .settings import CACHE_DIR, DISK_CACHE_SIZE, DEFAULT_TTL
+from .settings import (
+    CACHE_DIR, DISK_CACHE_SIZE, DEFAULT_TTL, LLM_CACHE_SIZE, LLM_CACHE_TTL,
+    CACHE_TTLS, CACHE_STALE_WHILE_REVALIDATE, CACHE_STALE_RETENTION, MEMORY_CACHE_ENTRIES,
+)
 _cache = dc.Cache(directory=CACHE_DIR, size_limit=DISK_CACHE_SIZE, disk_min_file_size=0)
 
-def _make_key(url: str, params: Dict[str, Any] | None) -> str:
-    h = hashlib.md5()
-    h.update(url.encode())
-    if params:
-        h.update(json.dumps(params, sort_keys=True).encode())
-    return h.hexdigest()
-
-def get(url: str, params: Dict[str, Any] | None = None) -> Any | None:
-    key = _make_key(url, params)
-    return _cache.get(key, default=None)
-
-def set(url: str, params: Dict[str, Any] | None, value: Any, ttl: int = DEFAULT_TTL):
-    key = _make_key(url, params)
-    _cache.set(key, value, expire=ttl)
-
-@asynccontextmanager
-async def cached_request(
-    url: str, params: Dict[str, Any] | None, coro
-) -> AsyncIterator[Any]:
-    data = get(url, params)
-    if data is None:
-        data = await coro()
-        set(url, params, data)
-    yield data
+def policy(namespace: str) -> tuple[int, int]:
+    """(TTL, fenêtre stale-while-revalidate) de l'espace de noms, en secondes."""
+    return CACHE_TTLS.get(namespace, DEFAULT_TTL), CACHE_STALE_WHILE_REVALIDATE.get(namespace, 0)
+
+class CacheEntry(NamedTuple):
+    value: Any
+    stored_at: float
+    ttl: int
+    swr: int
+
+    @property
+    def age(self) -> float:
+        return time.time() - self.stored_at
+
+    @property
+    def fresh(self) -> bool:
+        """Encore valide : à servir tel quel."""
+        return self.age < self.ttl
+
+    @property
+    def revalidatable(self) -> bool:
+        """Expirée depuis peu : servie immédiatement pendant qu'un rafraîchissement tourne en fond."""
+        return self.age < self.ttl + self.swr
+
+class TieredCache:
+    """LRU en mémoire (processus) devant le cache disque partagé.
+
+    Les entrées restent sur disque `CACHE_STALE_RETENTION` secondes après leur expiration
+    afin de pouvoir être servies, marquées comme périmées, quand l'API est injoignable.
+    """
+
+    def __init__(self, disk: dc.Cache, memory_entries: int = MEMORY_CACHE_ENTRIES):
+        self._disk = disk
+        self._memory: "OrderedDict[str, CacheEntry]" = OrderedDict()
+        self._memory_entries = memory_entries
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _key(namespace: str, key: str) -> str:
+        return f"{namespace}:{key}"
+
+    def _remember(self, full_key: str, entry: CacheEntry):
+        with self._lock:
+            self._memory[full_key] = entry
+            self._memory.move_to_end(full_key)
+            while len(self._memory) > self._memory_entries:
+                self._memory.popitem(last=False)
+
+    def get(self, namespace: str, key: str) -> CacheEntry | None:
+        """Retourne l'entrée, même expirée (voir `CacheEntry.fresh`), ou None."""
+        full_key = self._key(namespace, key)
+        with self._lock:
+            entry = self._memory.get(full_key)
+            if entry is not None:
+                self._memory.move_to_end(full_key)
+                return entry
+        stored = self._disk.get(full_key, default=None)
+        if stored is None:
+            return None
+        value, stored_at = stored
+        entry = CacheEntry(value, stored_at, *policy(namespace))
+        self._remember(full_key, entry)
+        return entry
+
+    def set(self, namespace: str, key: str, value: Any):
+        full_key = self._key(namespace, key)
+        ttl, swr = policy(namespace)
+        entry = CacheEntry(value, time.time(), ttl, swr)
+        self._disk.set(full_key, (value, entry.stored_at), expire=ttl + max(swr, CACHE_STALE_RETENTION))
+        self._remember(full_key, entry)
+
+# Cache des réponses des API France Travail ("search", "offre", "lbb")
+api_cache = TieredCache(_cache)
+
+# --- Cache des réponses LLM ---
+# Borné en taille (éviction des entrées les moins récemment lues) ; les compteurs
+# succès/échecs de diskcache sont persistants et donc cumulés entre les exécutions.
+_llm_cache = dc.Cache(
+    directory=CACHE_DIR / "llm",
+    size_limit=LLM_CACHE_SIZE,
+    eviction_policy="least-recently-used",
+)
+_llm_cache.stats(enable=True)
+
+def _normalize(value: Any) -> Any:
+    if isinstance(value, str):
+        return " ".join(value.split())
+    if isinstance(value, dict):
+        return {str(k): _normalize(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_normalize(v) for v in value]
+    return value
+
+def llm_key(operation: str, model: str, prompt_version: int, *inputs: Any) -> str:
+    """Empreinte SHA-256 du modèle, de la version du prompt et des entrées normalisées."""
+    payload = json.dumps(
+        [operation, model, prompt_version, _normalize(list(inputs))],
+        sort_keys=True, ensure_ascii=False,
+    )
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+def llm_get(key: str) -> str | None:
+    return _llm_cache.get(key, default=None)
+
+def llm_set(key: str, value: str, ttl: int = LLM_CACHE_TTL):
+    _llm_cache.set(key, value, expire=ttl)
+
+def llm_stats() -> Dict[str, int]:
+    hits, misses = _llm_cache.stats()
+    return {"hits": hits, "misses": misses, "entries": len(_llm_cache), "size": _llm_cache.volume()}
+
+def llm_clear() -> int:
+    _llm_cache.stats(reset=True)
+    return _llm_cache.clear()
@@ -1,60 +1,67 @@
 import typer
 import rich
-import asyncio
-import subprocess
-import questionary
-import re
-import json
-import os
-from pathlib import Path
+import time
+from datetime import datetime
 from rich.console import Console
 from rich.table import Table
-from rich.markdown import Markdown
 from rich.panel import Panel
 from rich.text import Text
-from rich.progress_bar import ProgressBar
 from typing import Dict, List, Optional
 
-# Imports des modules du projet
-from .client import FTClient
-from .gemini_utils import extraire_sections_cv_ia, adapter_cv_ia, generer_rapport_matching_ia, generer_lettre_motivation_ia
+# Imports des modules du projet.
+# Les dépendances lourdes (asyncio, httpx, diskcache, questionary, clients IA, rendu Markdown...) sont
+# importées dans les commandes qui s'en servent : `ftcli --help` ou `ftcli suivi list` n'en paient pas le coût.
 from . import database
-from .agent_api import get_structured_plan
-from . import exporter
-from .ui_components import create_main_menu
+from . import settings
+from .ui_components import truncate_text, contrat_style
 
 # --- Initialisation ---
 console = Console()
 app = typer.Typer(help="FTCli - Votre assistant de recherche d'emploi.", add_completion=False, no_args_is_help=False)
 profil_app = typer.Typer(help="Gérer les profils de CV.")
 suivi_app = typer.Typer(help="Suivre les candidatures.")
+cache_app = typer.Typer(help="Gérer le cache des réponses IA.")
+sync_app = typer.Typer(help="Synchroniser incrémentalement des recherches sauvegardées.")
 app.add_typer(profil_app, name="profils")
 app.add_typer(suivi_app, name="suivi")
+app.add_typer(cache_app, name="cache")
+app.add_typer(sync_app, name="sync")
 
 # --- Fonctions Helpers ---
-def truncate_text(text: str, max_len: int = 40) -> str:
-    if text and len(text) > max_len:
-        return text[: max_len - 3].strip() + "..."
-    return text
-
-def get_rapport_summary(rapport: str) -> str:
-    summary_lines = []
-    in_suggestion = False
-    for line in rapport.splitlines():
-        if "Score de Compatibilité" in line:
-            summary_lines.append(line)
-        elif "Suggestion Stratégique" in line:
-            in_suggestion = True
-            summary_lines.append("\n" + line)
-        elif in_suggestion and line.strip():
-            summary_lines.append(line)
-    return "\n".join(summary_lines)
-
-def get_score_from_rapport(rapport: str) -> int:
-    match = re.search(r"Score de Compatibilité\s*:\s*(\d+)\s*%", rapport)
-    if match:
-        return int(match.group(1))
-    return 0
+def run_ft(call, priority: str = settings.FT_PRIORITY):
+    """Exécute `call(client)` avec un FTClient dont le pool de connexions est fermé à la fin."""
+    import asyncio
+    from .client import FTClient
+    from .gemini_utils import aclose_async_client
+    async def _runner():
+        try:
+            async with FTClient(priority=priority) as client:
+                result = await call(client)
+                if client.served_stale:
+                    console.print("[yellow]⚠️ API France Travail injoignable : données en cache expirées affichées.[/yellow]")
+                return result
+        finally:
+            await aclose_async_client()
+    return asyncio.run(_runner())
+
+def stream_markdown(generer, titre: str, attente: str, transient: bool = False) -> str:
+    """Affiche une réponse de l'IA au fur et à mesure de sa génération, dans un panneau Markdown.
+
+    `generer(on_chunk)` effectue l'appel en streaming ; le Markdown n'est ré-analysé qu'à chaque
+    rafraîchissement de l'affichage, pas à chaque fragment. Retourne la réponse complète.
+    """
+    from rich.live import Live
+    from rich.markdown import Markdown
+    from rich.spinner import Spinner
+    morceaux: List[str] = []
+    def rendu():
+        if not morceaux:
+            return Spinner("dots", text=f"[bold green]{attente}[/bold green]")
+        return Panel(Markdown("".join(morceaux)), title=f"[bold]{titre}[/bold]", border_style="cyan", expand=True)
+    with Live(console=console, get_renderable=rendu, refresh_per_second=8, vertical_overflow="visible", transient=transient):
+        reponse = generer(morceaux.append)
+        morceaux[:] = [reponse]
+    return reponse
 
 # --- Définitions complètes des commandes ---
 
@@ -62,59 +69,149 @@ def get_score_from_rapport(rapport: str) -> int:
 def show_dashboard():
     """Affiche un tableau de bord avec les statistiques et les actions prioritaires."""
     console.print(Panel("[bold cyan]📊 Tableau de Bord FTCli[/bold cyan]", expand=False, border_style="cyan"))
-    all_offers = database.get_tracked_offers()
-    stats_text = Text(f"Candidatures suivies : {len(all_offers)}\n", justify="left")
-    stats_text.append(f"Entretiens prévus : {len([o for o in all_offers if o['statut'] == 'Entretien prévu'])}", style="bold green")
-    actions_necessaires = [o for o in all_offers if o['statut'] == 'Sauvegardée'][:3]
+    stats = database.get_dashboard_stats()
+    stats_text = Text(f"Candidatures suivies : {stats['total']}\n", justify="left")
+    stats_text.append(f"Entretiens prévus : {stats['par_statut'].get('Entretien prévu', 0)}", style="bold green")
+    autres = [f"{statut} : {count}" for statut, count in stats["par_statut"].items() if statut != "Entretien prévu"]
+    if autres:
+        stats_text.append("\n" + " | ".join(autres), style="dim")
     table = Table(box=None, show_header=False, padding=(0, 1))
     table.add_column(); table.add_column(style="magenta")
-    if actions_necessaires:
-        for offre in actions_necessaires:
+    if stats["a_traiter"]:
+        for offre in stats["a_traiter"]:
             table.add_row(f"[dim]ID {offre['id']}[/dim]", truncate_text(offre['offre_intitule']))
     else:
         table.add_row("✨", "Aucune action en attente.")
     console.print(Panel(stats_text, title="[bold]Statistiques[/bold]", border_style="blue"))
     console.print(Panel(table, title="[bold yellow]À Traiter en Priorité[/bold yellow]", border_style="yellow"))
 
+def _stream_search(mots: str, departement: Optional[str], max_results: int) -> List[Dict]:
+    """Affiche les offres ligne par ligne dès que chaque page de résultats arrive."""
+    async def _run(client):
+        offres = []
+        console.print(f"[bold]{'ID Offre':<10} {'Intitulé':<40} {'Lieu':<30} Type Contrat[/bold]")
+        async for offre in client.iter_offres(max_results=max_results, mots=mots, departement=departement):
+            offres.append(offre)
+            type_contrat = offre.get("typeContrat", "N/A")
+            style = contrat_style(type_contrat)
+            intitule = truncate_text(offre.get("intitule", "N/A")) or ""
+            lieu = truncate_text(offre.get("lieuTravail", {}).get("libelle", "N/A"), 30) or ""
+            console.print(f"[cyan]{offre.get('id', 'N/A'):<10}[/cyan] {intitule:<40} [yellow]{lieu:<30}[/yellow] [{style}]{type_contrat}[/{style}]", highlight=False)
+        return offres
+    offres = run_ft(_run)
+    console.print(f"[dim]{len(offres)} offre(s) reçue(s).[/dim]")
+    return offres
+
 @app.command()
-def search(mots: str = typer.Option(..., "--mots"), departement: Optional[str] = typer.Option(None, "--departement"), max_results: int = typer.Option(15, "--max-results")) -> Optional[List[Dict]]:
+def search(mots: str = typer.Option(..., "--mots"), departement: Optional[str] = typer.Option(None, "--departement"), max_results: int = typer.Option(15, "--max-results"), stream: bool = typer.Option(False, "--stream", help="Affiche les offres au fil de l'eau (pages récupérées en parallèle)."), rank_by_profile: Optional[int] = typer.Option(None, "--rank-by-profile", help="Trie les résultats par pertinence pour ce profil de CV (calcul local, sans IA).")) -> Optional[List[Dict]]:
     """Recherche des offres d'emploi et retourne les résultats."""
+    from .ui_components import offres_table
+    profil_data = None
+    if rank_by_profile is not None:
+        profil_data = database.get_profile(rank_by_profile)
+        if not profil_data:
+            console.print(f"[bold red]❌ Profil {rank_by_profile} non trouvé.[/bold red]"); return None
     console.print(f"[bold cyan]🔍 Recherche en cours pour '{mots}'...[/bold cyan]")
     try:
-        offres = asyncio.run(FTClient().search_offres(mots=mots, departement=departement, max_results=max_results))
+        if stream:
+            offres = _stream_search(mots, departement, max_results)
+        else:
+            offres = run_ft(lambda client: client.search_offres(mots=mots, departement=departement, max_results=max_results))
         if not offres:
             console.print("[yellow]⚠️ Aucune offre trouvée.[/yellow]"); return None
-        
-        table = Table(title=f"Résultats pour '{mots}'", box=rich.box.SIMPLE_HEAVY)
-        table.add_column("ID Offre", style="cyan", no_wrap=True); table.add_column("Intitulé", style="white"); table.add_column("Lieu", style="yellow"); table.add_column("Type Contrat", style="bold")
-        for offre in offres:
-            type_contrat = offre.get("typeContrat", "N/A")
-            style = "green" if type_contrat == "CDI" else "yellow" if type_contrat == "CDD" else "dim"
-            table.add_row(offre.get("id", "N/A"), truncate_text(offre.get("intitule", "N/A")), truncate_text(offre.get("lieuTravail", {}).get("libelle", "N/A")), f"[{style}]{type_contrat}[/{style}]")
-        console.print(table)
+
+        if profil_data is not None:
+            from .ranking import rank_offres
+            classement = rank_offres(profil_data, offres)
+            offres = [offre for offre, _ in classement]
+            console.print(offres_table(offres, f"Résultats pour '{mots}' classés pour le profil '{profil_data['nom']}'", scores=[score for _, score in classement]))
+        elif not stream:
+            console.print(offres_table(offres, f"Résultats pour '{mots}'"))
         return offres
     except Exception as e:
         console.print(f"[bold red]❌ Erreur lors de la recherche : {e}[/bold red]"); return None
 
+@app.command("local-search")
+def local_search(
+    query: str = typer.Argument(..., help="Mots recherchés (intitulé, description, entreprise, métier ROME)."),
+    departement: Optional[str] = typer.Option(None, "--departement"),
+    type_contrat: Optional[str] = typer.Option(None, "--type-contrat"),
+    limit: int = typer.Option(20, "--limit", min=1),
+):
+    """Recherche instantanée dans les offres déjà téléchargées, sans appel à l'API."""
+    debut = time.perf_counter()
+    offres = database.search_local_offers(query, departement=departement, type_contrat=type_contrat, limit=limit)
+    duree_ms = (time.perf_counter() - debut) * 1000
+    if not offres:
+        console.print("[yellow]⚠️ Aucune offre locale ne correspond.[/yellow]"); return
+    table = Table(title=f"Offres locales pour '{query}'", caption=f"{len(offres)} résultat(s) en {duree_ms:.0f} ms", box=rich.box.SIMPLE_HEAVY)
+    table.add_column("ID Offre", style="cyan", no_wrap=True); table.add_column("Intitulé"); table.add_column("Entreprise", style="green"); table.add_column("Lieu", style="yellow"); table.add_column("Type Contrat", style="bold"); table.add_column("Extrait", style="dim")
+    for offre in offres:
+        type_contrat_offre = offre["type_contrat"] or "N/A"
+        style = contrat_style(type_contrat_offre)
+        table.add_row(offre["offre_id"], truncate_text(offre["intitule"]), truncate_text(offre["entreprise"] or "N/A", 25), truncate_text(offre["lieu"] or "N/A", 25), f"[{style}]{type_contrat_offre}[/{style}]", Text(offre["extrait"] or ""))
+    console.print(table)
+
 @app.command()
 def view(offre_id: str = typer.Argument(...)):
     """Affiche les détails d'une offre spécifique."""
     try:
-        offre = asyncio.run(FTClient().get_offre(offre_id))
+        offre = run_ft(lambda client: client.get_offre(offre_id))
         if not offre:
             console.print(f"[bold red]❌ Offre {offre_id} non trouvée.[/bold red]"); return
-        title=offre.get("intitule","N/A"); entreprise=offre.get("entreprise",{}).get("nom","N/A"); lieu=offre.get("lieuTravail",{}).get("libelle","N/A"); contrat=offre.get("typeContrat","N/A"); salaire=offre.get("salaire",{}).get("libelle","N/A"); desc=offre.get("description","N/A")
-        md_content = f"### Entreprise: {entreprise}\n**Lieu**: {lieu}\n**Contrat**: {contrat} | **Salaire**: {salaire}\n\n{desc}"
-        console.print(Panel(Markdown(md_content), title=f"[bold]{title}[/bold]", border_style="cyan", expand=True))
+        from .ui_components import offre_panel
+        console.print(offre_panel(offre))
     except Exception as e:
         console.print(f"[bold red]❌ Erreur lors de la vue de l'offre : {e}[/bold red]")
 
+@app.command("export")
+def export(
+    fichier: str = typer.Argument(..., help="Fichier de sortie : .txt, .html, .jsonl, .csv ou .parquet."),
+    source: str = typer.Option("search", "--source", help="search (API France Travail), local (offres téléchargées) ou suivi (candidatures)."),
+    mots: Optional[str] = typer.Option(None, "--mots", help="Mots-clés (search) ou recherche plein texte (local)."),
+    departement: Optional[str] = typer.Option(None, "--departement"),
+    type_contrat: Optional[str] = typer.Option(None, "--type-contrat"),
+    statut: Optional[str] = typer.Option(None, "--statut", help="Filtre sur le statut de candidature (suivi)."),
+    max_results: int = typer.Option(150, "--max-results", min=1, help="Nombre maximal d'offres (search)."),
+    fmt: Optional[str] = typer.Option(None, "--format", help="Force le format au lieu de le déduire de l'extension."),
+):
+    """Exporte des offres au fil de l'eau, sans les charger toutes en mémoire."""
+    from . import exporter
+    if source not in ("search", "local", "suivi"):
+        console.print(f"[bold red]❌ Source inconnue : {source} (search, local ou suivi).[/bold red]"); raise typer.Exit(code=1)
+    try:
+        fmt = fmt.lower() if fmt else exporter.detect_format(fichier)
+        if fmt not in exporter.FORMATS:
+            raise ValueError(f"Format inconnu : {fmt} (formats disponibles : {', '.join(exporter.FORMATS)}).")
+    except ValueError as e:
+        console.print(f"[bold red]❌ {e}[/bold red]"); raise typer.Exit(code=1)
+    columns = exporter.COLUMNS + exporter.SUIVI_COLUMNS if source == "suivi" else exporter.COLUMNS
+
+    debut = time.perf_counter()
+    try:
+        with console.status("[bold green]Export en cours...[/bold green]") as status:
+            def on_progress(n: int):
+                if n % 100 == 0:
+                    status.update(f"[bold green]Export en cours... {n} offre(s)[/bold green]")
+            if source == "search":
+                total = run_ft(lambda client: exporter.export_offres_async(
+                    client.iter_offres(max_results=max_results, mots=mots, departement=departement, typeContrat=type_contrat),
+                    fichier, fmt, columns, on_progress), priority="bulk")
+            elif source == "local":
+                total = exporter.export_offres(database.iter_local_offers(mots, departement=departement, type_contrat=type_contrat),
+                                               fichier, fmt, columns, on_progress)
+            else:
+                total = exporter.export_offres(database.iter_tracked_offers_detailed(statut), fichier, fmt, columns, on_progress)
+    except Exception as e:
+        console.print(f"[bold red]❌ Erreur lors de l'export : {e}[/bold red]"); raise typer.Exit(code=1)
+    console.print(f"[bold green]✅ {total} offre(s) exportée(s) vers {fichier} ({fmt}) en {time.perf_counter() - debut:.1f} s.[/bold green]")
+
 @app.command("companies")
 def find_companies(job: str = typer.Option(..., "--job"), location: str = typer.Option(..., "--location")):
     """Trouve les entreprises à fort potentiel d'embauche."""
     console.print(f"\n[bold cyan]🏢 Recherche des entreprises pour '{job}' à '{location}'...[/bold cyan]")
     try:
-        companies = asyncio.run(FTClient().get_potential_companies(job_label=job, location_label=location))
+        companies = run_ft(lambda client: client.get_potential_companies(job_label=job, location_label=location))
         if not companies:
             console.print("[yellow]⚠️ Aucune entreprise trouvée.[/yellow]"); return
         table = Table(title="Entreprises à fort potentiel d'embauche", box=rich.box.MINIMAL_HEAVY_HEAD)
@@ -127,21 +224,117 @@ def find_companies(job: str = typer.Option(..., "--job"), location: str = typer.
 
 @profil_app.command("analyser")
 def profil_analyser(cv_path: str = typer.Argument(...), nom: str = typer.Option(...)):
-    """Analyse un CV PDF et sauvegarde le profil."""
+    """Analyse un CV PDF et sauvegarde le profil.
+
+    Le texte d'un PDF déjà lu est repris du cache, et l'analyse IA d'un CV au texte identique
+    à un profil existant est réutilisée sans nouvel appel.
+    """
+    from rich.markdown import Markdown
+    from .gemini_utils import extraire_sections_cv_ia
+    from .pdf_text import PdfExtractionError, extract_cv_text
     try:
-        result = subprocess.run(["pdftotext", cv_path, "-"], capture_output=True, text=True, check=False)
-        if result.returncode != 0:
-            console.print(f"[bold red]❌ Erreur pdftotext : {result.stderr}[/bold red]"); return
-        texte_cv = result.stdout.strip()
-        if not texte_cv:
-            console.print("[bold red]❌ Le CV est vide ou illisible.[/bold red]"); return
-        with console.status("[bold green]Analyse du CV par l'IA...[/bold green]"):
-            analyse_ia = extraire_sections_cv_ia(texte_cv)
+        texte_cv, _ = extract_cv_text(cv_path)
+        if (existant := database.get_profile_by_text(texte_cv)) is not None:
+            analyse_ia = existant["analyse"]
+            console.print(f"[dim]CV identique au profil '{existant['nom']}' (ID: {existant['id']}) : analyse réutilisée, sans appel à l'IA.[/dim]")
+            console.print(Panel(Markdown(analyse_ia), title=f"[bold]Analyse du CV '{nom}'[/bold]", border_style="cyan"))
+        else:
+            analyse_ia = stream_markdown(lambda on_chunk: extraire_sections_cv_ia(texte_cv, on_chunk=on_chunk),
+                                         f"Analyse du CV '{nom}'", "Analyse du CV par l'IA...")
+            if analyse_ia.lstrip().startswith("[ERREUR"):
+                console.print("[bold red]❌ L'analyse IA a échoué, profil non enregistré.[/bold red]"); return
         profil_id = database.save_cv_analysis(nom, texte_cv, analyse_ia)
-        console.print(Panel(Markdown(analyse_ia), title=f"[bold]Analyse du CV '{nom}' (ID: {profil_id})[/bold]", border_style="cyan"))
+        console.print(f"[bold green]✅ Profil '{nom}' enregistré (ID: {profil_id}).[/bold green]")
+    except PdfExtractionError as e:
+        console.print(f"[bold red]❌ {e}[/bold red]")
     except Exception as e:
         console.print(f"[bold red]❌ Erreur lors de l'analyse : {e}[/bold red]")
 
+@profil_app.command("analyser-dir")
+def profil_analyser_dir(
+    dossier: str = typer.Argument(..., help="Dossier contenant les CV."),
+    pattern: str = typer.Option("*.pdf", "--pattern", help="Motif des fichiers à analyser."),
+    workers: Optional[int] = typer.Option(None, "--workers", min=1, help="Processus d'extraction PDF (par défaut : nombre de CPU)."),
+):
+    """Analyse tous les CV PDF d'un dossier : un profil par fichier, nommé d'après le fichier.
+
+    Les PDF sont lus en parallèle dans un pool de processus ; les PDF déjà lus, les fichiers
+    identiques et les CV au texte déjà analysé ne coûtent ni extraction ni appel IA.
+    """
+    import asyncio
+    from concurrent.futures import ProcessPoolExecutor
+    from pathlib import Path
+    from .gemini_utils import aclose_async_client, extraire_sections_cv_ia_async
+    from .pdf_text import extract_for_pool, file_hash
+
+    fichiers = sorted(p for p in Path(dossier).expanduser().glob(pattern) if p.is_file())
+    if not fichiers:
+        console.print(f"[yellow]⚠️ Aucun fichier '{pattern}' dans {dossier}.[/yellow]"); return
+
+    statuts: Dict[Path, str] = {}
+    textes: Dict[Path, str] = {}
+    empreintes: Dict[Path, str] = {}
+    for f in fichiers:
+        try:
+            empreintes[f] = file_hash(f)
+        except OSError as e:
+            statuts[f] = f"[red]Fichier illisible : {e}[/red]"
+    for f in fichiers:
+        if f in statuts:
+            continue
+        if database.get_profile_by_name(f.stem):
+            statuts[f] = "[dim]profil déjà existant[/dim]"
+        elif (texte := database.get_pdf_text(empreintes[f])) is not None:
+            textes[f] = texte
+
+    # 1. Extraction en parallèle des PDF jamais lus (une seule fois par contenu)
+    a_extraire = {empreintes[f]: f for f in fichiers if f not in statuts and f not in textes}
+    extraits: Dict[str, tuple] = {}
+    if a_extraire:
+        with console.status(f"[bold green]Extraction de {len(a_extraire)} PDF...[/bold green]"):
+            with ProcessPoolExecutor(max_workers=workers) as pool:
+                for path, texte, extracteur, erreur in pool.map(extract_for_pool, [str(f) for f in a_extraire.values()]):
+                    empreinte = empreintes[Path(path)]
+                    extraits[empreinte] = (texte, erreur)
+                    if texte is not None:
+                        database.save_pdf_text(empreinte, texte, extracteur)
+    for f in fichiers:
+        if f not in statuts and f not in textes:
+            texte, erreur = extraits[empreintes[f]]
+            if texte is None:
+                statuts[f] = f"[red]{erreur}[/red]"
+            else:
+                textes[f] = texte
+
+    # 2. Analyse IA des seuls textes jamais analysés (une fois par texte distinct)
+    a_analyser = {database.text_hash(t): t for t in textes.values() if database.get_profile_by_text(t) is None}
+    analyses: Dict[str, str] = {}
+    if a_analyser:
+        async def _analyser():
+            try:
+                return await asyncio.gather(*(extraire_sections_cv_ia_async(t) for t in a_analyser.values()))
+            finally:
+                await aclose_async_client()
+        with console.status(f"[bold green]Analyse IA de {len(a_analyser)} CV...[/bold green]"):
+            analyses = dict(zip(a_analyser, asyncio.run(_analyser())))
+
+    # 3. Enregistrement, dans l'ordre des fichiers
+    profils: Dict[Path, int] = {}
+    for f, texte in textes.items():
+        existant = database.get_profile_by_text(texte)
+        analyse = existant["analyse"] if existant else analyses.get(database.text_hash(texte), "")
+        if analyse.lstrip().startswith("[ERREUR"):
+            statuts[f] = "[red]échec de l'analyse IA[/red]"; continue
+        profils[f] = database.save_cv_analysis(f.stem, texte, analyse)
+        statuts[f] = f"[cyan]analyse réutilisée ({existant['nom']})[/cyan]" if existant else "[green]analysé[/green]"
+
+    table = Table(title=f"CV de {dossier}", box=rich.box.SIMPLE)
+    table.add_column("Fichier"); table.add_column("Profil ID", style="cyan", justify="right"); table.add_column("Résultat")
+    for f in fichiers:
+        table.add_row(f.name, str(profils.get(f, "-")), statuts[f])
+    console.print(table)
+    console.print(f"[bold green]✅ {len(profils)} profil(s) enregistré(s) sur {len(fichiers)} fichier(s).[/bold green]")
+
 @profil_app.command("lister")
 def profil_lister():
     """Liste tous les profils de CV sauvegardés."""
@@ -158,7 +351,7 @@ def profil_lister():
 def suivi_save(offre_id: str = typer.Argument(...)):
     """Sauvegarde une offre dans le suivi des candidatures."""
     try:
-        offre = asyncio.run(FTClient().get_offre(offre_id))
+        offre = run_ft(lambda client: client.get_offre(offre_id))
         if not offre:
             console.print(f"[bold red]❌ Offre {offre_id} non trouvée.[/bold red]"); return
         title = offre.get("intitule", "N/A"); entreprise = offre.get("entreprise", {}).get("nom", "N/A")
@@ -167,21 +360,39 @@ def suivi_save(offre_id: str = typer.Argument(...)):
     except Exception as e:
         console.print(f"[bold red]❌ Erreur lors de la sauvegarde : {e}[/bold red]")
 
-@suivi_app.command("list")
-def suivi_list():
-    """Affiche la liste des candidatures suivies."""
-    candidatures = database.get_tracked_offers()
+def afficher_suivi(statut: Optional[str] = None, since: Optional[str] = None, limit: Optional[int] = None, offset: int = 0):
+    """Affiche une page de la liste des candidatures suivies."""
+    candidatures = database.get_tracked_offers(statut=statut, since=since, limit=limit, offset=offset)
     if not candidatures:
         console.print("[yellow]⚠️ Aucune candidature suivie.[/yellow]"); return
+    total = database.count_tracked_offers(statut=statut, since=since)
     table = Table(title="Suivi des Candidatures", box=rich.box.SIMPLE)
     table.add_column("ID Suivi", style="cyan"); table.add_column("Intitulé"); table.add_column("Entreprise"); table.add_column("Statut")
     for cand in candidatures:
         table.add_row(str(cand["id"]), truncate_text(cand["offre_intitule"]), truncate_text(cand["entreprise"]), cand["statut"])
+    if len(candidatures) < total:
+        table.caption = f"{offset + 1}-{offset + len(candidatures)} sur {total}"
     console.print(table)
-    
+
+@suivi_app.command("list")
+def suivi_list(
+    statut: Optional[str] = typer.Option(None, "--statut", help="Ne montre que ce statut."),
+    since: Optional[str] = typer.Option(None, "--since", help="Ajoutées depuis cette date (AAAA-MM-JJ)."),
+    limit: Optional[int] = typer.Option(None, "--limit", min=1, help="Nombre de lignes par page."),
+    offset: int = typer.Option(0, "--offset", min=0, help="Nombre de lignes à sauter."),
+):
+    """Affiche la liste des candidatures suivies."""
+    if since:
+        try:
+            since = datetime.fromisoformat(since).isoformat()
+        except ValueError:
+            console.print(f"[bold red]❌ Date invalide : {since} (format attendu AAAA-MM-JJ).[/bold red]"); raise typer.Exit(code=1)
+    afficher_suivi(statut=statut, since=since, limit=limit, offset=offset)
+
 @suivi_app.command("update")
 def suivi_update(id_suivi: Optional[int] = typer.Argument(None), statut: Optional[str] = typer.Argument(None)):
     """Met à jour le statut d'une candidature."""
+    import questionary
     candidatures = database.get_tracked_offers()
     if not candidatures:
         console.print("[yellow]⚠️ Aucune candidature suivie.[/yellow]"); return
@@ -194,11 +405,13 @@ def suivi_update(id_suivi: Optional[int] = typer.Argument(None), statut: Optiona
         statut = questionary.text("Nouveau statut :").ask()
         if not statut: return
     database.update_tracked_offer(id_suivi, statut)
-    console.print(f"[bold green]✅ Statut mis à jour.[/bold green]"); suivi_list()
+    console.print(f"[bold green]✅ Statut mis à jour.[/bold green]"); afficher_suivi()
     
 @suivi_app.command("notes")
 def suivi_notes(id_suivi: int = typer.Argument(...)):
     """Affiche et permet de modifier les notes d'une candidature."""
+    import questionary
+    from rich.markdown import Markdown
     candidature = database.get_tracked_offer(id_suivi)
     if not candidature:
         console.print(f"[bold red]❌ Candidature {id_suivi} non trouvée.[/bold red]"); return
@@ -210,79 +423,214 @@ def suivi_notes(id_suivi: int = typer.Argument(...)):
             database.update_tracked_offer_notes(id_suivi, new_notes)
             console.print("[bold green]✅ Notes mises à jour ![/bold green]")
 
+@cache_app.command("stats")
+def cache_stats():
+    """Affiche les statistiques du cache des réponses IA."""
+    from . import cache
+    stats = cache.llm_stats()
+    total = stats["hits"] + stats["misses"]
+    ratio = f"{100 * stats['hits'] / total:.0f}%" if total else "-"
+    table = Table(title="Cache des réponses IA", box=rich.box.SIMPLE, show_header=False)
+    table.add_column(style="cyan"); table.add_column(justify="right")
+    table.add_row("Entrées", str(stats["entries"]))
+    table.add_row("Taille", f"{stats['size'] / 1024:.0f} Ko")
+    table.add_row("Succès (hits)", str(stats["hits"]))
+    table.add_row("Échecs (misses)", str(stats["misses"]))
+    table.add_row("Taux de succès", ratio)
+    console.print(table)
+
+@cache_app.command("clear")
+def cache_clear():
+    """Vide le cache des réponses IA."""
+    from . import cache
+    removed = cache.llm_clear()
+    console.print(f"[bold green]✅ {removed} réponse(s) supprimée(s) du cache.[/bold green]")
+
+@app.command("usage")
+def llm_usage(days: Optional[int] = typer.Option(None, "--days", min=1, help="Limite aux N derniers jours.")):
+    """Affiche les tokens consommés par les appels IA, par opération."""
+    from datetime import timedelta
+    since = (datetime.now() - timedelta(days=days)).isoformat() if days else None
+    lignes = database.get_llm_usage_summary(since)
+    if not lignes:
+        console.print("[yellow]⚠️ Aucun appel IA enregistré.[/yellow]"); return
+    titre = f"Consommation IA ({days} derniers jours)" if days else "Consommation IA"
+    table = Table(title=titre, box=rich.box.SIMPLE)
+    table.add_column("Opération", style="cyan"); table.add_column("Appels", justify="right"); table.add_column("Tokens prompt", justify="right"); table.add_column("Tokens réponse", justify="right"); table.add_column("Prompt moyen", justify="right", style="dim"); table.add_column("Durée moyenne", justify="right", style="dim")
+    for l in lignes:
+        table.add_row(l["operation"], str(l["appels"]), f"{l['prompt_tokens']:,}".replace(",", " "), f"{l['response_tokens']:,}".replace(",", " "), str(l["prompt_tokens"] // l["appels"]), f"{l['duree_moyenne_ms'] / 1000:.1f} s")
+    console.print(table)
+
+@sync_app.command("add")
+def sync_add(nom: str = typer.Argument(..., help="Nom de la recherche."), mots: Optional[str] = typer.Option(None, "--mots"), departement: Optional[str] = typer.Option(None, "--departement"), type_contrat: Optional[str] = typer.Option(None, "--type-contrat")):
+    """Enregistre une recherche à synchroniser."""
+    if database.get_saved_search(nom):
+        console.print(f"[bold red]❌ La recherche '{nom}' existe déjà.[/bold red]"); raise typer.Exit(code=1)
+    database.save_search(nom, mots, departement, type_contrat)
+    console.print(f"[bold green]✅ Recherche '{nom}' enregistrée. Lancez `ftcli sync` pour la synchroniser.[/bold green]")
+
+@sync_app.command("list")
+def sync_list():
+    """Liste les recherches sauvegardées et leur filigrane."""
+    recherches = database.get_saved_searches()
+    if not recherches:
+        console.print("[yellow]⚠️ Aucune recherche sauvegardée.[/yellow]"); return
+    table = Table(title="Recherches Sauvegardées", box=rich.box.SIMPLE)
+    table.add_column("Nom", style="cyan"); table.add_column("Mots-clés"); table.add_column("Dépt."); table.add_column("Contrat"); table.add_column("Offres", justify="right"); table.add_column("Dernière synchro", style="dim")
+    for r in recherches:
+        table.add_row(r["nom"], r["mots"] or "-", r["departement"] or "-", r["type_contrat"] or "-", str(database.count_search_offers(r["id"])), (r["last_run_at"] or "jamais")[:16])
+    console.print(table)
+
+@sync_app.command("remove")
+def sync_remove(nom: str = typer.Argument(...)):
+    """Supprime une recherche sauvegardée."""
+    if not database.delete_saved_search(nom):
+        console.print(f"[bold red]❌ Recherche '{nom}' introuvable.[/bold red]"); raise typer.Exit(code=1)
+    console.print(f"[bold green]✅ Recherche '{nom}' supprimée.[/bold green]")
+
+@sync_app.callback(invoke_without_command=True)
+def sync_run(ctx: typer.Context, nom: Optional[str] = typer.Option(None, "--nom", help="Ne synchronise que cette recherche."), full: bool = typer.Option(False, "--full", help="Ignore le filigrane et retélécharge tout.")):
+    """Synchronise les recherches sauvegardées (seules les offres publiées depuis le dernier passage sont téléchargées)."""
+    if ctx.invoked_subcommand is not None:
+        return
+    import asyncio
+    from .sync import sync_search
+    recherches = database.get_saved_searches()
+    if nom:
+        recherches = [r for r in recherches if r["nom"] == nom]
+    if not recherches:
+        console.print("[yellow]⚠️ Aucune recherche à synchroniser (voir `ftcli sync add`).[/yellow]"); return
+    if full:
+        recherches = [{**r, "watermark": None} for r in recherches]
+
+    async def _run(client):
+        return await asyncio.gather(*(sync_search(client, r) for r in recherches), return_exceptions=True)
+
+    with console.status("[bold green]Synchronisation en cours...[/bold green]"):
+        rapports = run_ft(_run)
+    table = Table(title="Synchronisation", box=rich.box.SIMPLE)
+    table.add_column("Recherche", style="cyan"); table.add_column("Mode", style="dim"); table.add_column("Reçues", justify="right"); table.add_column("Nouvelles", justify="right", style="green"); table.add_column("Mises à jour", justify="right", style="yellow"); table.add_column("Expirées", justify="right", style="red"); table.add_column("Non reçues", justify="right", style="magenta")
+    a_suivre = False
+    for recherche, rapport in zip(recherches, rapports):
+        if isinstance(rapport, Exception):
+            table.add_row(recherche["nom"], "[red]erreur[/red]", "-", "-", "-", truncate_text(str(rapport)), "-"); continue
+        a_suivre = a_suivre or rapport["a_suivre"]
+        manquantes = f"{rapport['manquantes']}{'*' if rapport['a_suivre'] else ''}" if rapport["manquantes"] else "0"
+        table.add_row(rapport["nom"], "incrémental" if rapport["incremental"] else "complet", str(rapport["recues"]), str(len(rapport["new"])), str(len(rapport["updated"])), str(rapport["expired"]), manquantes)
+    if a_suivre:
+        table.caption = f"* quota de {settings.SYNC_MAX_RESULTS} offres atteint : la suite sera téléchargée au prochain passage."
+    console.print(table)
+
+@app.command()
+def watch(
+    interval: int = typer.Option(settings.WATCH_INTERVAL, "--interval", min=60, help="Secondes entre deux cycles."),
+    jitter: float = typer.Option(settings.WATCH_JITTER, "--jitter", min=0.0, max=0.9, help="Variation aléatoire du délai (fraction de l'intervalle)."),
+    concurrence: int = typer.Option(settings.WATCH_CONCURRENCY, "--concurrence", "-c", min=1, help="Recherches synchronisées en parallèle."),
+    once: bool = typer.Option(False, "--once", help="Exécute un seul cycle puis s'arrête."),
+):
+    """Surveille les recherches sauvegardées et notifie les nouvelles offres (un récapitulatif par cycle)."""
+    import asyncio
+    from .watch import run_watch
+    if not database.get_saved_searches():
+        console.print("[yellow]⚠️ Aucune recherche sauvegardée (voir `ftcli sync add`).[/yellow]"); return
+
+    def on_cycle(resultat: Dict):
+        total = sum(len(ids) for ids in resultat["nouvelles"].values())
+        heure = datetime.now().strftime("%H:%M:%S")
+        console.print(f"[dim]{heure}[/dim] Cycle terminé : [bold green]{total}[/bold green] nouvelle(s) offre(s).")
+        for nom, erreur in resultat["erreurs"].items():
+            console.print(f"  [red]❌ {nom} : {erreur}[/red]")
+        for nom, manquantes in resultat["manquantes"].items():
+            console.print(f"  [magenta]⚠️ {nom} : {manquantes} offre(s) non reçue(s) (quota atteint).[/magenta]")
+
+    console.print(f"[bold cyan]👀 Surveillance lancée (toutes les {interval} s ± {jitter:.0%}). Ctrl+C pour arrêter.[/bold cyan]")
+    try:
+        asyncio.run(run_watch(interval=interval, jitter=jitter, concurrency=concurrence, once=once, on_cycle=on_cycle))
+    except KeyboardInterrupt:
+        console.print("[yellow]Surveillance arrêtée.[/yellow]")
+
 @app.command()
-def adapter(profil: int = typer.Option(..., "--profil"), offre: str = typer.Option(..., "--offre")):
+def adapter(profil: int = typer.Option(..., "--profil"), offre: str = typer.Option(..., "--offre"), no_cache: bool = typer.Option(False, "--no-cache", help="Ignore le cache des réponses IA.")):
     """Adapte un CV pour une offre spécifique."""
+    from .gemini_utils import adapter_cv_ia
     console.print(f"[bold cyan]📝 Adaptation du CV pour l'offre {offre}...[/bold cyan]")
     try:
         profil_data = database.get_profile(profil)
         if not profil_data: console.print(f"[bold red]❌ Profil {profil} non trouvé.[/bold red]"); return
-        offre_data = asyncio.run(FTClient().get_offre(offre))
+        offre_data = run_ft(lambda client: client.get_offre(offre))
         if not offre_data: console.print(f"[bold red]❌ Offre {offre} non trouvée.[/bold red]"); return
-        with console.status("[bold green]Envoi à l'IA pour adaptation du CV...[/bold green]"):
-            cv_adapte = adapter_cv_ia(profil_data["texte"], offre_data)
-        console.print(Panel(Markdown(cv_adapte), title="[bold]CV Adapté[/bold]", border_style="cyan", expand=True))
+        stream_markdown(lambda on_chunk: adapter_cv_ia(profil_data["texte"], offre_data, use_cache=not no_cache, on_chunk=on_chunk),
+                        "CV Adapté", "Envoi à l'IA pour adaptation du CV...")
     except Exception as e:
         console.print(f"[bold red]❌ Erreur lors de l'adaptation du CV : {e}[/bold red]")
 
 @app.command("lettre")
-def generer_lettre(profil: int = typer.Option(..., "--profil"), offre: str = typer.Option(..., "--offre")):
+def generer_lettre(profil: int = typer.Option(..., "--profil"), offre: str = typer.Option(..., "--offre"), no_cache: bool = typer.Option(False, "--no-cache", help="Ignore le cache des réponses IA.")):
     """Génère une lettre de motivation adaptée à une offre via l'IA."""
+    from .gemini_utils import generer_lettre_motivation_ia
     console.print(f"\n[bold cyan]📝 Génération de la lettre de motivation pour l'offre {offre}...[/bold cyan]")
     try:
         profil_data = database.get_profile(profil)
         if not profil_data: console.print(f"[bold red]❌ Profil {profil} non trouvé.[/bold red]"); return
-        offre_data = asyncio.run(FTClient().get_offre(offre))
+        offre_data = run_ft(lambda client: client.get_offre(offre))
         if not offre_data: console.print(f"[bold red]❌ Offre {offre} non trouvée.[/bold red]"); return
-        with console.status("[bold green]Envoi à l'IA pour la rédaction...[/bold green]"):
-            lettre = generer_lettre_motivation_ia(profil_data["analyse"], offre_data)
-        console.print(Panel(Markdown(lettre), title="[bold]Lettre de Motivation Suggérée[/bold]", border_style="cyan", expand=True))
+        stream_markdown(lambda on_chunk: generer_lettre_motivation_ia(profil_data["analyse"], offre_data, use_cache=not no_cache, on_chunk=on_chunk),
+                        "Lettre de Motivation Suggérée", "Envoi à l'IA pour la rédaction...")
     except Exception as e:
         console.print(f"[bold red]❌ Erreur lors de la génération de la lettre : {e}[/bold red]")
 
 @app.command()
-def match(profil: int = typer.Option(..., "--profil"), offre: str = typer.Option(..., "--offre")) -> Optional[Dict]:
+def match(profil: int = typer.Option(..., "--profil"), offre: str = typer.Option(..., "--offre"), no_cache: bool = typer.Option(False, "--no-cache", help="Ignore le cache des réponses IA.")) -> Optional[Dict]:
     """Analyse la compatibilité (non-interactif, pour l'agent)."""
+    from rich.markdown import Markdown
+    from .gemini_utils import generer_rapport_matching_ia
+    from .ui_components import rapport_markdown
     console.print(f"[bold cyan]📊 Analyse de compatibilité pour l'offre {offre} avec le profil {profil}...[/bold cyan]")
     try:
         profil_data = database.get_profile(profil)
         if not profil_data:
             console.print(f"[bold red]❌ Profil {profil} non trouvé.[/bold red]"); raise typer.Exit(code=1)
         with console.status("[bold green]L'IA analyse le profil et l'offre...[/bold green]"):
-            offre_data = asyncio.run(FTClient().get_offre(offre))
-            rapport = generer_rapport_matching_ia(profil_data["analyse"], offre_data)
-        
-        console.print(Panel(Markdown(rapport), title="[bold]Rapport de Compatibilité[/bold]", border_style="cyan", expand=True))
-        if rapport.strip().startswith("[ERREUR"):
-             raise typer.Exit(code=1)
-        return {"rapport": rapport, "profil_id": profil, "offre_id": offre}
+            offre_data = run_ft(lambda client: client.get_offre(offre))
+            resultat = generer_rapport_matching_ia(profil_data["analyse"], offre_data, use_cache=not no_cache)
+        if "error" in resultat:
+            console.print(f"[bold red]{resultat['error']}[/bold red]"); raise typer.Exit(code=1)
+        database.save_match_results(profil, [(offre_data, resultat)], source="rapport")
+        console.print(Panel(Markdown(rapport_markdown(resultat)), title="[bold]Rapport de Compatibilité[/bold]", border_style="cyan", expand=True))
+        return {**resultat, "profil_id": profil, "offre_id": offre}
     except Exception as e:
         console.print(f"[bold red]❌ Erreur lors de l'analyse : {e}[/bold red]"); raise typer.Exit(code=1)
 
 @app.command("analyse")
-def analyse_interactive(profil: int = typer.Option(..., "--profil"), offre: str = typer.Option(..., "--offre")):
+def analyse_interactive(profil: int = typer.Option(..., "--profil"), offre: str = typer.Option(..., "--offre"), no_cache: bool = typer.Option(False, "--no-cache", help="Ignore le cache des réponses IA.")):
     """Analyse une offre et propose un menu d'actions."""
+    import questionary
+    from rich.markdown import Markdown
+    from rich.progress_bar import ProgressBar
+    from .gemini_utils import generer_rapport_matching_ia
+    from .ui_components import rapport_markdown
     console.print(f"[bold cyan]📊 Analyse de compatibilité pour l'offre {offre} avec le profil {profil}...[/bold cyan]")
     try:
         profil_data = database.get_profile(profil)
         if not profil_data: console.print(f"[bold red]❌ Profil {profil} non trouvé.[/bold red]"); return
         with console.status("[bold green]Récupération de l'offre et analyse IA...[/bold green]"):
-            offre_data = asyncio.run(FTClient().get_offre(offre))
+            offre_data = run_ft(lambda client: client.get_offre(offre))
             if not offre_data: console.print(f"[bold red]❌ Offre {offre} non trouvée.[/bold red]"); return
-            rapport = generer_rapport_matching_ia(profil_data["analyse"], offre_data)
+            resultat = generer_rapport_matching_ia(profil_data["analyse"], offre_data, use_cache=not no_cache)
         
-        if rapport.strip().startswith("[ERREUR"):
-             console.print("[bold red]L'analyse a échoué.[/bold red]"); return
+        if "error" in resultat:
+             console.print(f"[bold red]L'analyse a échoué : {resultat['error']}[/bold red]"); return
+        database.save_match_results(profil, [(offre_data, resultat)], source="rapport")
+        rapport = rapport_markdown(resultat)
         
-        score = get_score_from_rapport(rapport)
+        score = resultat["score"]
         score_color = "green" if score > 70 else "yellow" if score > 50 else "red"
         
         console.rule("[bold yellow]Résumé de l'Analyse[/bold yellow]")
         console.print("\n[bold]Score de Compatibilité :[/bold]")
         console.print(ProgressBar(total=100, completed=score), f"[{score_color}]{score}%[/{score_color}]")
         
-        summary = get_rapport_summary(rapport)
-        console.print(Panel(summary, border_style="green", title="Suggestion Stratégique"))
+        console.print(Panel(resultat["suggestion"] or "-", border_style="green", title="Suggestion Stratégique"))
 
         while True:
             action_choice = questionary.select("Que voulez-vous faire maintenant ?", choices=["📖 Voir le rapport détaillé", "📝 Adapter le CV", "✉️ Rédiger la lettre", "💾 Sauvegarder l'offre", "⬅️ Terminer"]).ask()
@@ -290,53 +638,169 @@ def analyse_interactive(profil: int = typer.Option(..., "--profil"), offre: str
             elif "détaillé" in action_choice:
                 console.print(Panel(Markdown(rapport), title="[bold]Rapport de Compatibilité Complet[/bold]", border_style="cyan", expand=True))
                 questionary.press_any_key_to_continue().ask()
-            elif "Adapter" in action_choice: adapter(profil=profil, offre=offre); break
-            elif "Rédiger" in action_choice: generer_lettre(profil=profil, offre=offre); break
+            elif "Adapter" in action_choice: adapter(profil=profil, offre=offre, no_cache=no_cache); break
+            elif "Rédiger" in action_choice: generer_lettre(profil=profil, offre=offre, no_cache=no_cache); break
             elif "Sauvegarder" in action_choice: suivi_save(offre_id=offre); break
     except Exception as e:
         console.print(f"[bold red]❌ Erreur lors de l'analyse interactive : {e}[/bold red]")
 
+def _score_cell(score: int) -> str:
+    color = "green" if score > 70 else "yellow" if score > 50 else "red"
+    return f"[{color}]{score}%[/{color}]"
+
+def _synthese_table(offres: List[str], progress: Dict[str, Dict]) -> Table:
+    """Tableau de progression de `synthese`, rempli au fur et à mesure des scores reçus."""
+    done = sum(1 for p in progress.values() if "score" in p)
+    table = Table(title=f"[bold]Analyse en cours ({done}/{len(offres)})[/bold]", box=rich.box.SIMPLE)
+    table.add_column("ID Offre", style="cyan"); table.add_column("Intitulé"); table.add_column("Score", justify="right")
+    for offre_id in offres:
+        p = progress.get(offre_id, {})
+        etat = _score_cell(p["score"]) if "score" in p else f"[dim]{p.get('etat', 'en attente')}[/dim]"
+        table.add_row(offre_id, truncate_text(p.get("intitule", "…")), etat)
+    return table
+
 @app.command(name="synthese")
-def analyse_synthetique(profil: int = typer.Option(..., "--profil"), offres: List[str] = typer.Option(..., "--offre")):
-    """Analyse plusieurs offres et génère un tableau de synthèse comparatif."""
+def analyse_synthetique(profil: int = typer.Option(..., "--profil"), offres: List[str] = typer.Option(..., "--offre"), concurrence: int = typer.Option(settings.SYNTHESE_CONCURRENCY, "--concurrence", "-c", min=1, help="Nombre d'offres récupérées en parallèle."), no_cache: bool = typer.Option(False, "--no-cache", help="Ignore le cache des réponses IA."), top_k: Optional[int] = typer.Option(None, "--top-k", min=1, help="N'envoie à l'IA que les K offres les mieux classées localement (BM25).")):
+    """Analyse plusieurs offres et génère un tableau de synthèse comparatif.
+
+    Les offres sont évaluées par lots : le profil n'est envoyé qu'une fois par appel IA.
+    """
+    import asyncio
+    from rich.live import Live
+    from .gemini_utils import match_offres_batch_async
     console.print(f"\n[bold cyan]📊 Lancement de l'analyse de synthèse pour le profil {profil} sur {len(offres)} offres...[/bold cyan]")
     profil_data = database.get_profile(profil)
     if not profil_data:
         console.print(f"[bold red]❌ Profil {profil} non trouvé.[/bold red]"); raise typer.Exit()
 
-    results = []
-    with console.status("[bold green]Analyse des offres en cours...[/bold green]") as status:
-        for i, offre_id in enumerate(offres):
-            status.update(f"Analyse de l'offre {i+1}/{len(offres)} : {offre_id}")
+    offres = list(dict.fromkeys(offres))
+    progress: Dict[str, Dict] = {}
+
+    async def _recuperer(client, semaphore, live, offre_id) -> Optional[Dict]:
+        async with semaphore:
             try:
-                offre_data = asyncio.run(FTClient().get_offre(offre_id))
-                rapport = generer_rapport_matching_ia(profil_data["analyse"], offre_data)
-                score = get_score_from_rapport(rapport)
-                results.append({"id": offre_id, "intitule": offre_data.get("intitule", "N/A"), "score": score})
+                progress[offre_id] = {"etat": "récupération..."}; live.update(_synthese_table(offres, progress))
+                offre_data = await client.get_offre(offre_id)
+                progress[offre_id] = {"etat": "en attente", "intitule": offre_data.get("intitule", "N/A")}
+                return offre_data
             except Exception:
-                results.append({"id": offre_id, "intitule": "Erreur d'analyse", "score": 0})
-    
-    results.sort(key=lambda x: x["score"], reverse=True)
+                progress[offre_id] = {"intitule": "Erreur d'analyse", "score": 0}
+                return None
+            finally:
+                live.update(_synthese_table(offres, progress))
+
+    async def _run(client):
+        semaphore = asyncio.Semaphore(concurrence)
+        with Live(_synthese_table(offres, progress), console=console, refresh_per_second=8, transient=True) as live:
+            donnees = await asyncio.gather(*(_recuperer(client, semaphore, live, offre_id) for offre_id in offres))
+            recuperees = {offre_id: d for offre_id, d in zip(offres, donnees) if d is not None}
+            a_analyser = list(recuperees)
+            if top_k is not None:
+                # Pré-classement local : seules les K meilleures offres sont envoyées à l'IA
+                from .ranking import rank_offres
+                classement = rank_offres(profil_data, list(recuperees.values()))
+                a_analyser = [d["id"] for d, _ in classement[:top_k]]
+                for offre_data, pre_score in classement:
+                    progress[offre_data["id"]]["pre_score"] = pre_score
+                for offre_id in recuperees.keys() - set(a_analyser):
+                    progress[offre_id]["etat"] = "écartée (pré-classement)"
+            for offre_id in a_analyser:
+                progress[offre_id]["etat"] = "analyse IA..."
+            live.update(_synthese_table(offres, progress))
+
+            def on_result(resultat: Dict):
+                p = progress[resultat["offre_id"]]
+                if "error" in resultat:
+                    p["etat"] = "échec de l'analyse IA"
+                else:
+                    p.update(score=resultat["score"], strengths=resultat["strengths"], gaps=resultat["gaps"])
+                live.update(_synthese_table(offres, progress))
+            resultats = await match_offres_batch_async(profil_data["analyse"], [recuperees[o] for o in a_analyser],
+                                                       use_cache=not no_cache, on_result=on_result)
+            database.save_match_results(profil, [(recuperees[o], r) for o, r in resultats.items()], source="lot")
+
+    run_ft(_run)
+
+    results = [{"id": offre_id, **progress[offre_id]} for offre_id in offres]
+    results.sort(key=lambda x: ("score" in x, x.get("score", 0), x.get("pre_score", 0)), reverse=True)
     table = Table(title="[bold]Synthèse de Compatibilité[/bold]", box=rich.box.HEAVY_HEAD)
-    table.add_column("Score", style="magenta", justify="right"); table.add_column("ID Offre", style="cyan"); table.add_column("Intitulé")
+    table.add_column("Score", style="magenta", justify="right")
+    if top_k is not None:
+        table.add_column("Pré-score", style="dim", justify="right")
+    table.add_column("ID Offre", style="cyan"); table.add_column("Intitulé")
+    table.add_column("Points forts", style="green"); table.add_column("Lacunes", style="red")
     for result in results:
-        color = "green" if result['score'] > 70 else "yellow" if result['score'] > 50 else "red"
-        table.add_row(f"[{color}]{result['score']}%[/{color}]", result["id"], truncate_text(result["intitule"]))
+        score = _score_cell(result["score"]) if "score" in result else f"[dim]{result.get('etat', 'non analysée')}[/dim]"
+        pre_score = [str(result["pre_score"]) if "pre_score" in result else "-"] if top_k is not None else []
+        table.add_row(score, *pre_score, result["id"], truncate_text(result["intitule"]),
+                      truncate_text(" ; ".join(result.get("strengths", []))), truncate_text(" ; ".join(result.get("gaps", []))))
+    console.print(table)
+
+@app.command("matches")
+def matches(profil: int = typer.Option(..., "--profil"), min_score: int = typer.Option(0, "--min-score", min=0, max=100, help="Score minimal affiché."), limit: Optional[int] = typer.Option(None, "--limit", min=1)):
+    """Liste les scores de compatibilité déjà calculés pour un profil (sans appel IA)."""
+    resultats = database.get_match_results(profil, min_score=min_score, limit=limit)
+    if not resultats:
+        console.print(f"[yellow]⚠️ Aucun résultat de matching enregistré pour le profil {profil}{f' avec un score ≥ {min_score}' if min_score else ''}.[/yellow]")
+        console.print("[dim]Lancez `ftcli match` ou `ftcli synthese` pour évaluer des offres.[/dim]"); return
+    table = Table(title=f"[bold]Offres évaluées pour le profil {profil}[/bold]", box=rich.box.HEAVY_HEAD)
+    table.add_column("Score", justify="right"); table.add_column("ID Offre", style="cyan"); table.add_column("Intitulé")
+    table.add_column("Points forts", style="green"); table.add_column("Lacunes", style="red"); table.add_column("Évaluée le", style="dim")
+    for r in resultats:
+        table.add_row(_score_cell(r["score"]), r["offre_id"], truncate_text(r["intitule"] or "N/A"),
+                      truncate_text(" ; ".join(r["strengths"])), truncate_text(" ; ".join(r["gaps"])), r["created_at"][:10])
     console.print(table)
 
 @app.command()
-def agent(goal: str = typer.Argument(...), profil_id: Optional[int] = typer.Option(None, "--profil-id", "-p"), step_by_step: bool = typer.Option(False, "--step-by-step")):
-    """L'agent IA interprète un objectif, crée un plan et l'exécute."""
-    console.print(f"[bold cyan]🤖 AgentFT analyse votre objectif :[/bold cyan] [i]'{goal}'[/i]")
-    with console.status("[bold green]Génération du plan d'action...[/bold green]"):
-        result = get_structured_plan(goal, profil_id)
-    if "error" in result:
-        console.print(f"[bold red]{result['error']}[/bold red]"); raise typer.Exit(code=1)
-    plan = result.get("plan", [])
-    if not plan:
-        console.print(f"[bold red]Erreur : L'agent n'a pas pu générer de plan.[/bold red]"); raise typer.Exit(code=1)
+def agent(
+    goal: Optional[str] = typer.Argument(None, help="Objectif en langage naturel (inutile avec --resume)."),
+    profil_id: Optional[int] = typer.Option(None, "--profil-id", "-p"),
+    step_by_step: bool = typer.Option(False, "--step-by-step"),
+    parallel: int = typer.Option(settings.AGENT_CONCURRENCY, "--parallel", min=1, help="Nombre maximal d'étapes indépendantes exécutées en parallèle."),
+    resume: Optional[int] = typer.Option(None, "--resume", help="Reprend un run interrompu : les étapes déjà réussies ne sont pas refaites."),
+    list_runs: bool = typer.Option(False, "--runs", help="Liste les derniers runs de l'agent."),
+):
+    """L'agent IA interprète un objectif, crée un plan et l'exécute.
+
+    Les étapes qui ne dépendent pas l'une de l'autre (par ex. plusieurs `match` sur les offres
+    d'une même recherche) sont exécutées en parallèle ; l'affichage suit l'ordre du plan.
+    Le plan et le résultat de chaque étape sont enregistrés : `--resume <run>` reprend un run.
+    """
+    if list_runs:
+        afficher_runs(); return
+    if not lancer_agent(goal, profil_id, step_by_step=step_by_step, parallel=parallel, resume=resume):
+        raise typer.Exit(code=1)
+
+def lancer_agent(goal: Optional[str], profil_id: Optional[int] = None, step_by_step: bool = False,
+                 parallel: int = settings.AGENT_CONCURRENCY, resume: Optional[int] = None) -> bool:
+    """Planifie puis exécute un objectif (ou reprend le run `resume`). Retourne False en cas d'erreur."""
+    import asyncio
+    import questionary
+    from .agent_api import get_structured_plan
+    from .agent_executor import AgentExecutor, plan_dependencies
+    from .client import FTClient
+    from .gemini_utils import aclose_async_client
+    if resume is not None:
+        run = database.get_agent_run(resume)
+        if not run:
+            console.print(f"[bold red]Run {resume} non trouvé.[/bold red]"); return False
+        run_id, plan = run["id"], run["plan"]
+        console.print(f"[bold cyan]🤖 Reprise du run {run_id} :[/bold cyan] [i]'{run['goal']}'[/i]")
+    else:
+        if not goal:
+            console.print("[bold red]Erreur : indiquez un objectif ou --resume <run>.[/bold red]"); return False
+        console.print(f"[bold cyan]🤖 AgentFT analyse votre objectif :[/bold cyan] [i]'{goal}'[/i]")
+        with console.status("[bold green]Génération du plan d'action...[/bold green]"):
+            result = get_structured_plan(goal, profil_id)
+        if "error" in result:
+            console.print(f"[bold red]{result['error']}[/bold red]"); return False
+        plan = result.get("plan", [])
+        if not plan:
+            console.print(f"[bold red]Erreur : L'agent n'a pas pu générer de plan.[/bold red]"); return False
+        run_id = None
 
     console.print(Panel("[bold green]✅ Voici le plan d'action proposé :[/bold green]", expand=False, border_style="green"))
+    dependances = plan_dependencies(plan)
     for i, action in enumerate(plan, 1):
         command_name = action.get("name", "inconnu").replace("_", " ")
         args = action.get("arguments", {})
@@ -344,66 +808,79 @@ def agent(goal: str = typer.Argument(...), profil_id: Optional[int] = typer.Opti
              args_str = args.get("offre", "<ID MANQUANT>")
         else:
             args_str = " ".join([f"--{k.replace('_', '-')} \"{v}\"" if " " in str(v) else f"--{k.replace('_', '-')} {v}" for k, v in args.items()])
-        console.print(f"[cyan]{i}.[/cyan] [yellow]ftcli {command_name} {args_str}[/yellow]")
+        dependance = f" [dim](après l'étape {dependances[i - 1] + 1})[/dim]" if dependances[i - 1] is not None else ""
+        console.print(f"[cyan]{i}.[/cyan] [yellow]ftcli {command_name} {args_str}[/yellow]{dependance}")
     
-    if not step_by_step and not questionary.confirm("Exécuter ce plan ?").ask():
-        console.print("[yellow]Plan annulé.[/yellow]"); return
-
-    console.print("\n" + "-" * 50); console.print("[bold cyan]🚀 Lancement de l'exécution du plan...[/bold cyan]")
-    context = {"ID_OFFRE_LIST": []}
+    if run_id is None:
+        if not step_by_step and not questionary.confirm("Exécuter ce plan ?").ask():
+            console.print("[yellow]Plan annulé.[/yellow]"); return True
+        run_id = database.create_agent_run(goal, profil_id, plan)
 
-    for i, action in enumerate(plan, 1):
+    console.print("\n" + "-" * 50); console.print(f"[bold cyan]🚀 Lancement de l'exécution du plan (run {run_id})...[/bold cyan]")
+    # Une seule boucle pour tout le plan : le client, son pool et le jeton sont partagés entre
+    # les étapes, et les confirmations questionary restent hors de la boucle asyncio.
+    loop = asyncio.new_event_loop()
+    client = FTClient()
+    executor = AgentExecutor(client, run_id=run_id)
+    if executor.completed:
+        console.print(f"[dim]{len(executor.completed)}/{len(plan)} étape(s) déjà terminée(s) : résultats enregistrés réutilisés.[/dim]")
+    resultats: List = []
+    try:
         if step_by_step:
-            if not questionary.confirm(f"Étape {i}/{len(plan)}: Prêt à exécuter '{action.get('name')}' ?", default=True).ask():
-                console.print("[yellow]Plan interrompu par l'utilisateur.[/yellow]"); break
-        
-        console.print(f"\n[bold]Étape {i}/{len(plan)} :[/bold] [yellow]{action.get('name')}[/yellow]")
-        arguments = action.get("arguments", {}).copy()
-        
-        for key, value in list(arguments.items()):
-            if isinstance(value, str) and "<ID_A_REMPLACER" in value:
-                try:
-                    index = int(value.split("_")[-1][:-1]) - 1 if "_" in value else 0
-                    if index < len(context["ID_OFFRE_LIST"]):
-                        arguments[key] = context["ID_OFFRE_LIST"][index]
-                        console.print(f"[dim]Placeholder '{value}' remplacé par l'ID: {arguments[key]}[/dim]")
-                    else:
-                        console.print(f"[bold red]❌ Échec : Index du placeholder hors limites.[/bold red]"); break
-                except (ValueError, IndexError):
-                     console.print(f"[yellow]⚠️ Placeholder mal formé, utilisation du premier ID.[/yellow]")
-                     if context["ID_OFFRE_LIST"]: arguments[key] = context["ID_OFFRE_LIST"][0]
+            offre_ids: List[str] = []
+            for i, action in enumerate(plan, 1):
+                if i - 1 not in executor.completed and not questionary.confirm(f"Étape {i}/{len(plan)}: Prêt à exécuter '{action.get('name')}' ?", default=True).ask():
+                    console.print("[yellow]Plan interrompu par l'utilisateur.[/yellow]"); break
+                step = loop.run_until_complete(executor.run_indexed_step(i - 1, action, offre_ids))
+                resultats.append(step)
+                _afficher_etape(i, plan, step)
+                if not step.ok:
+                    break
+                if step.offre_ids:
+                    offre_ids = step.offre_ids
         else:
-            command_list = ["ftcli"]
-            command_name = action.get("name").replace("_", " ")
-            command_list.extend(command_name.split())
-            if command_name == "suivi save":
-                id_to_save = arguments.get("offre", "ID_MANQUANT")
-                command_list.append(id_to_save)
-            else:
-                for key, value in arguments.items():
-                    command_list.append(f"--{key.replace('_', '-')}")
-                    command_list.append(str(value))
-            try:
-                result = subprocess.run(command_list, capture_output=True, text=True, check=False)
-                output = result.stdout.strip()
-                if output: console.print(output)
-                if result.returncode != 0:
-                    console.print(f"[bold red]❌ L'étape a échoué ! Erreur :[/bold red]\n{result.stderr.strip()}"); break
-                if action.get("name") == "search":
-                    potential_ids = re.findall(r"^\s*([0-9A-Z]{7,})\s", output, re.MULTILINE)
-                    if potential_ids:
-                        context["ID_OFFRE_LIST"] = potential_ids
-                        console.print(f"➡️ Contexte mis à jour : ID_OFFRE_LIST = {context['ID_OFFRE_LIST']}")
-            except Exception as e:
-                console.print(f"[bold red]❌ Erreur critique : {e}[/bold red]"); break
-            continue
-        break
-    console.print("\n" + "-" * 50); console.print("[bold green]🏁 Plan d'action terminé ![/bold green]")
-    
+            async def executer():
+                async for i, step in executor.run_plan(plan, parallel):
+                    resultats.append(step)
+                    _afficher_etape(i + 1, plan, step)
+            loop.run_until_complete(executer())
+    finally:
+        termine = len(resultats) == len(plan) and all(step.ok for step in resultats)
+        database.update_agent_run_status(run_id, "terminé" if termine else "interrompu")
+        loop.run_until_complete(client.aclose())
+        loop.run_until_complete(aclose_async_client())
+        loop.close()
+    console.print("\n" + "-" * 50)
+    if termine:
+        console.print("[bold green]🏁 Plan d'action terminé ![/bold green]")
+    else:
+        console.print(f"[bold yellow]⏸️ Plan incomplet. Reprenez-le avec :[/bold yellow] ftcli agent --resume {run_id}")
+    return True
+
+def afficher_runs():
+    runs = database.get_agent_runs()
+    if not runs:
+        console.print("[yellow]Aucun run enregistré.[/yellow]"); return
+    table = Table(title="Runs de l'agent", box=rich.box.SIMPLE_HEAVY)
+    table.add_column("Run", style="cyan"); table.add_column("Objectif"); table.add_column("Étapes", justify="right"); table.add_column("Statut", style="bold"); table.add_column("Mis à jour", style="dim")
+    for run in runs:
+        table.add_row(str(run["id"]), truncate_text(run["goal"] or "N/A", 50), f"{run['etapes_ok']}/{len(run['plan'])}", run["statut"] or "N/A", (run["updated_at"] or "")[:16])
+    console.print(table)
+
+def _afficher_etape(i: int, plan: List[Dict], step):
+    from .agent_executor import render_step
+    reprise = " [dim](résultat enregistré)[/dim]" if step.reprise else ""
+    console.print(f"\n[bold]Étape {i}/{len(plan)} :[/bold] [yellow]{plan[i - 1].get('name')}[/yellow]{reprise}")
+    console.print(render_step(step))
+    if step.offre_ids:
+        console.print(f"[dim]➡️ Contexte mis à jour : {len(step.offre_ids)} ID d'offre(s) disponible(s).[/dim]")
+
 # --- Menu et Point d'Entrée ---
 @app.command(name="menu")
 def interactive_menu_command():
     """Lance le menu principal interactif."""
+    import questionary
+    from .ui_components import create_main_menu
     while True:
         choice = create_main_menu()
         if not choice or "Quitter" in choice:
@@ -413,7 +890,7 @@ def interactive_menu_command():
             mots = questionary.text("Mots-clés de recherche :").ask()
             if mots:
                 dept = questionary.text("Département (optionnel) :").ask()
-                offres_trouvees = search(mots=mots, departement=dept, max_results=15)
+                offres_trouvees = search(mots=mots, departement=dept, max_results=15, stream=False, rank_by_profile=None)
                 if offres_trouvees:
                     while True:
                         action_choice = questionary.select("Que faire avec ces résultats ?", choices=["🧐 Voir les détails", "💾 Sauvegarder une offre", "📊 Analyser une offre", "⬅️ Retourner au menu"]).ask()
@@ -429,7 +906,7 @@ def interactive_menu_command():
                             profil_choice = questionary.select("Avec quel profil ?", choices=[f"ID {p['id']} - {p['nom']}" for p in profils]).ask()
                             if not profil_choice: continue
                             profil_id = int(profil_choice.split(" - ")[0].replace("ID ", ""))
-                            analyse_interactive(profil=profil_id, offre=offre_id_to_action)
+                            analyse_interactive(profil=profil_id, offre=offre_id_to_action, no_cache=False)
         
         elif "Trouver des entreprises" in choice:
             job = questionary.text("Nom du métier :").ask()
@@ -441,7 +918,7 @@ def interactive_menu_command():
             show_dashboard()
         
         elif "Gérer le suivi" in choice:
-            suivi_list()
+            afficher_suivi()
             
         elif "Gérer mes profils" in choice:
             profil_lister()
@@ -451,7 +928,7 @@ def interactive_menu_command():
             if goal:
                 profil_id_str = questionary.text("ID du profil (optionnel) :").ask()
                 profil_id = int(profil_id_str) if profil_id_str and profil_id_str.isdigit() else None
-                agent(goal=goal, profil_id=profil_id)
+                lancer_agent(goal, profil_id)
         
         questionary.press_any_key_to_continue("\nAppuyez sur une touche pour retourner au menu...").ask()
 
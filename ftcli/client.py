@@ -1,21 +1,164 @@
+import asyncio
 import httpx
-import diskcache
 import os
 import json
-from typing import Dict, List, Optional
-from dotenv import load_dotenv
+import re
+import sqlite3
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional, Tuple
 from .auth import Auth
+from . import settings
+from .ratelimit import SharedTokenBucket
+from .cache import api_cache
+from .singleflight import SingleFlight
+from . import database
 
-load_dotenv()
+MAX_RATE_LIMIT_RETRIES = 3
+
+# Budget commun à tous les processus ftcli (agent, watch, commandes lancées en parallèle...)
+rate_limiter = SharedTokenBucket(
+    "francetravail",
+    settings.RATE_LIMIT_DB,
+    rate=settings.RATE_LIMIT_PER_SEC,
+    capacity=settings.RATE_LIMIT_PER_SEC,
+    bulk_reserve=settings.RATE_LIMIT_PER_SEC * settings.RATE_LIMIT_BULK_RESERVE,
+)
+
+# Requêtes en vol, partagées par tous les FTClient du processus (clé = clé de cache)
+inflight = SingleFlight()
+
+def _http2_available() -> bool:
+    """HTTP/2 nécessite le paquet optionnel `h2` (installé avec `httpx[http2]`)."""
+    try:
+        import h2  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+def build_http_client(timeout: Optional[float] = None) -> httpx.AsyncClient:
+    """Crée un client HTTP poolé : connexions keep-alive, multiplexage HTTP/2 et pool borné."""
+    limits = httpx.Limits(
+        max_connections=settings.HTTP_MAX_CONNECTIONS,
+        max_keepalive_connections=settings.HTTP_MAX_KEEPALIVE,
+        keepalive_expiry=settings.HTTP_KEEPALIVE_EXPIRY,
+    )
+    return httpx.AsyncClient(
+        http2=settings.HTTP2 and _http2_available(),
+        limits=limits,
+        timeout=timeout or settings.HTTP_TIMEOUT,
+    )
 
 class FTClient:
-    """Client pour interagir avec les API France Travail."""
+    """Client pour interagir avec les API France Travail.
 
-    def __init__(self):
+    Toutes les requêtes (y compris l'obtention du jeton OAuth) passent par un unique
+    `httpx.AsyncClient` poolé et par le limiteur de débit partagé `rate_limiter` ; `priority`
+    vaut `"interactive"` ou `"bulk"` (traitements de fond). À utiliser de préférence avec `async with FTClient() as client:`
+    afin que les connexions soient fermées proprement.
+    """
+
+    def __init__(self, http_client: Optional[httpx.AsyncClient] = None, priority: str = settings.FT_PRIORITY):
         self.auth = Auth()
-        self.cache = diskcache.Cache("ft_cache")
-        self.offres_url = "https://api.francetravail.io/partenaire/offresdemploi/v2"
-        self.lbb_url = "https://api.francetravail.io/partenaire/labonneboite/v2"
+        self.priority = priority
+        self.cache = api_cache
+        self.offline_keys: set[str] = set()
+        self._refreshes: set[asyncio.Task] = set()
+        self.offres_url = f"{settings.BASE_URL}/offresdemploi/v2"
+        self.lbb_url = f"{settings.BASE_URL}/labonneboite/v2"
+        self._owns_http = http_client is None
+        self.http = http_client or build_http_client()
+
+    async def _get(self, url: str, params: Optional[Dict[str, Any]] = None) -> httpx.Response:
+        """Effectue un GET authentifié via le client poolé, dans le respect du débit global.
+
+        Une réponse 429 est rejouée après le délai `Retry-After` indiqué par l'API ; une
+        réponse 401 (jeton enregistré révoqué) l'est une fois avec un nouveau jeton.
+        """
+        token = await self.auth.get_token(self.http)
+        headers = {"Authorization": f"Bearer {token}"}
+        renewed = False
+        for attempt in range(MAX_RATE_LIMIT_RETRIES + 1):
+            await rate_limiter.acquire(priority=self.priority)
+            response = await self.http.get(url, headers=headers, params=params)
+            if response.status_code == 401 and not renewed:
+                renewed = True
+                token = await self.auth.invalidate(token, self.http)
+                headers = {"Authorization": f"Bearer {token}"}
+                continue
+            if response.status_code != 429 or attempt == MAX_RATE_LIMIT_RETRIES:
+                break
+            retry_after = response.headers.get("Retry-After", "")
+            await asyncio.sleep(float(retry_after) if retry_after.replace(".", "", 1).isdigit() else 1.0 + attempt)
+        response.raise_for_status()
+        return response
+
+    async def _cached(self, namespace: str, key: str, fetch: Callable[[], Awaitable[Any]], use_cache: bool = True) -> Any:
+        """Sert depuis le cache selon la politique de l'espace de noms.
+
+        Les appels concurrents sur une même clé partagent une seule requête (`inflight`).
+        Avec `use_cache=False`, l'API est toujours interrogée (la réponse reste mise en cache).
+
+        - entrée fraîche : servie directement ;
+        - entrée expirée dans la fenêtre stale-while-revalidate : servie immédiatement,
+          rafraîchie en tâche de fond ;
+        - API injoignable (réseau, 5xx, 429) : l'entrée expirée est servie et la clé
+          ajoutée à `offline_keys`.
+        """
+        entry = self.cache.get(namespace, key) if use_cache else None
+        if entry is not None and entry.fresh:
+            return entry.value
+        flight_key = f"{namespace}:{key}"
+
+        async def fetch_and_store():
+            value = await fetch()
+            self.cache.set(namespace, key, value)
+            return value
+
+        if entry is not None and entry.revalidatable:
+            self._revalidate(flight_key, fetch_and_store)
+            return entry.value
+        try:
+            return await inflight.do(flight_key, fetch_and_store)
+        except (httpx.TransportError, httpx.HTTPStatusError) as e:
+            if entry is None or not self._is_offline(e):
+                raise
+            self.offline_keys.add(flight_key)
+            return entry.value
+
+    @staticmethod
+    def _is_offline(e: Exception) -> bool:
+        """Vrai si l'erreur signale une API injoignable (réseau, 5xx, 429) plutôt qu'une requête refusée."""
+        if isinstance(e, httpx.HTTPStatusError):
+            return e.response.status_code >= 500 or e.response.status_code == 429
+        return isinstance(e, httpx.TransportError)
+
+    def _revalidate(self, flight_key: str, fetch_and_store: Callable[[], Awaitable[Any]]):
+        if inflight.in_flight(flight_key):
+            return
+        async def refresh():
+            try:
+                await inflight.do(flight_key, fetch_and_store)
+            except Exception:
+                pass  # l'entrée périmée reste en place ; nouvel essai au prochain accès
+        task = asyncio.ensure_future(refresh())
+        self._refreshes.add(task)
+        task.add_done_callback(self._refreshes.discard)
+
+    @property
+    def served_stale(self) -> bool:
+        """Vrai si des données expirées ont été servies faute de pouvoir joindre l'API."""
+        return bool(self.offline_keys)
+
+    @staticmethod
+    async def _store_offres(offres: List[Dict]):
+        """Verse les offres reçues dans l'entrepôt local (`ftcli local-search`).
+
+        L'écriture (qui peut attendre le verrou d'un autre processus `ftcli`) s'exécute dans
+        un thread pour ne pas bloquer la boucle.
+        """
+        try:
+            await asyncio.to_thread(database.upsert_offers, offres)
+        except sqlite3.Error:
+            pass  # l'entrepôt est un bonus : une base verrouillée ne doit pas faire échouer la requête
 
     async def get_potential_companies(
         self,
@@ -23,85 +166,152 @@ class FTClient:
         location_label: str,
     ) -> List[Dict]:
         """Récupère les entreprises à fort potentiel via l'API La Bonne Boite avec une recherche textuelle."""
-        token = await self.auth.get_token()
-        headers = {"Authorization": f"Bearer {token}"}
-        
         params = {
             "job": job_label,
             "location": location_label,
             "distance": 20,
             "sort": "score"
         }
-        cache_key = f"lbb_{json.dumps(params, sort_keys=True)}"
-        if cache_key in self.cache:
-            return self.cache[cache_key]
-        
-        async with httpx.AsyncClient() as client:
-            response = await client.get(
-                f"{self.lbb_url}/recherche",
-                headers=headers,
-                params=params,
-                timeout=30
-            )
-            response.raise_for_status()
-            companies = response.json().get("items", [])
-            self.cache[cache_key] = companies
-            return companies
+        async def fetch():
+            response = await self._get(f"{self.lbb_url}/recherche", params=params)
+            return response.json().get("items", [])
 
-    async def search_offres(
-        self,
+        return await self._cached("lbb", json.dumps(params, sort_keys=True), fetch)
+
+    @staticmethod
+    def _search_params(
         mots: Optional[str] = None,
         departement: Optional[str] = None,
         commune: Optional[str] = None,
-        max_results: int = 15,
         typeContrat: Optional[str] = None,
-    ) -> List[Dict]:
-        """Recherche des offres d'emploi avec des filtres."""
-        token = await self.auth.get_token()
-        headers = {"Authorization": f"Bearer {token}"}
+        **filtres: Any,
+    ) -> Dict[str, Any]:
         params = {}
-
         if mots: params["motsCles"] = mots
         if departement: params["departement"] = departement
         if commune: params["commune"] = commune
         if typeContrat: params["typeContrat"] = typeContrat
-        params["range"] = f"0-{max_results - 1}"
+        params.update({k: v for k, v in filtres.items() if v is not None})
+        return params
 
-        cache_key = json.dumps(params, sort_keys=True)
-        if cache_key in self.cache: return self.cache[cache_key]
+    async def _search_page(self, params: Dict[str, Any], start: int, end: int, use_cache: bool = True) -> Tuple[List[Dict], Optional[int]]:
+        """Récupère la page `start-end` et le nombre total de résultats annoncé par `Content-Range`."""
+        params = {**params, "range": f"{start}-{end}"}
+
+        async def fetch():
+            response = await self._get(f"{self.offres_url}/offres/search", params=params)
+            offres = response.json().get("resultats", []) if response.content else []
+            match = re.search(r"/(\d+)", response.headers.get("Content-Range", ""))
+            await self._store_offres(offres)
+            return offres, int(match.group(1)) if match else None
+
+        return await self._cached("search", json.dumps(params, sort_keys=True), fetch, use_cache)
+
+    async def count_offres(self, use_cache: bool = True, **criteres: Any) -> int:
+        """Nombre total d'offres annoncé par l'API pour ces critères (une requête d'une seule offre)."""
+        offres, total = await self._search_page(self._search_params(**criteres), 0, 0, use_cache)
+        return total if total is not None else len(offres)
+
+    async def iter_offres_pages(
+        self,
+        max_results: int = 15,
+        concurrency: Optional[int] = None,
+        use_cache: bool = True,
+        **criteres: Any,
+    ) -> AsyncIterator[Tuple[int, List[Dict]]]:
+        """Découpe la recherche en pages `range` et les récupère en parallèle (au plus `concurrency`).
+
+        Produit des couples `(index de début, offres)` dans l'ordre d'arrivée des pages.
+        `use_cache=False` ignore le cache (et le stale-while-revalidate) des pages.
+        """
+        params = self._search_params(**criteres)
+        page_size = settings.SEARCH_PAGE_SIZE
+        limit = min(max_results, settings.SEARCH_MAX_INDEX + 1)
+        if limit <= 0:
+            return
 
         try:
-            async with httpx.AsyncClient() as client:
-                response = await client.get(
-                    f"{self.offres_url}/offres/search",
-                    headers=headers, params=params, timeout=30
-                )
-                response.raise_for_status()
-                offres = response.json().get("resultats", [])
-                self.cache[cache_key] = offres
-                return offres
+            offres, total = await self._search_page(params, 0, min(page_size, limit) - 1, use_cache)
         except Exception as e:
             raise Exception(f"Erreur lors de la recherche d'offres : {e}")
+        yield 0, offres
+        if total is not None:
+            limit = min(limit, total)
+        if len(offres) < page_size or limit <= page_size:
+            return
 
-    async def get_offre(self, offre_id: str) -> Dict:
-        """Récupère les détails d'une offre spécifique."""
-        token = await self.auth.get_token()
-        headers = {"Authorization": f"Bearer {token}"}
-        cache_key = f"offre_{offre_id}"
-        if cache_key in self.cache: return self.cache[cache_key]
+        semaphore = asyncio.Semaphore(concurrency or settings.SEARCH_CONCURRENCY)
 
-        async with httpx.AsyncClient() as client:
-            response = await client.get(
-                f"{self.offres_url}/offres/{offre_id}",
-                headers=headers, timeout=30
+        async def fetch(start: int) -> Tuple[int, List[Dict]]:
+            async with semaphore:
+                page, _ = await self._search_page(params, start, min(start + page_size, limit) - 1, use_cache)
+                return start, page
+
+        tasks = [asyncio.ensure_future(fetch(start)) for start in range(page_size, limit, page_size)]
+        try:
+            for next_page in asyncio.as_completed(tasks):
+                try:
+                    yield await next_page
+                except Exception as e:
+                    raise Exception(f"Erreur lors de la recherche d'offres : {e}")
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+    async def iter_offres(self, max_results: int = 15, concurrency: Optional[int] = None, use_cache: bool = True, **criteres: Any) -> AsyncIterator[Dict]:
+        """Générateur asynchrone des offres, produites au fur et à mesure que les pages arrivent."""
+        async for _, offres in self.iter_offres_pages(max_results=max_results, concurrency=concurrency, use_cache=use_cache, **criteres):
+            for offre in offres:
+                yield offre
+
+    async def search_offres(
+        self,
+        mots: Optional[str] = None,
+        departement: Optional[str] = None,
+        commune: Optional[str] = None,
+        max_results: int = 15,
+        typeContrat: Optional[str] = None,
+    ) -> List[Dict]:
+        """Recherche des offres d'emploi avec des filtres (ordre de pertinence de l'API conservé)."""
+        pages = [
+            page async for page in self.iter_offres_pages(
+                max_results=max_results, mots=mots, departement=departement,
+                commune=commune, typeContrat=typeContrat,
             )
-            response.raise_for_status()
+        ]
+        return [offre for _, offres in sorted(pages, key=lambda p: p[0]) for offre in offres]
+
+    async def get_offre(self, offre_id: str) -> Dict:
+        """Récupère les détails d'une offre spécifique.
+
+        API injoignable et offre absente du cache : l'offre de l'entrepôt local est servie
+        (si elle a déjà été téléchargée) et `served_stale` devient vrai.
+        """
+        async def fetch():
+            response = await self._get(f"{self.offres_url}/offres/{offre_id}")
             offre = response.json()
-            self.cache[cache_key] = offre
+            await self._store_offres([offre])
             return offre
 
+        try:
+            return await self._cached("offre", offre_id, fetch)
+        except (httpx.TransportError, httpx.HTTPStatusError) as e:
+            if not self._is_offline(e) or (offre := database.get_local_offer(offre_id)) is None:
+                raise
+            self.offline_keys.add(f"offre:{offre_id}")
+            return offre
+
+    async def aclose(self):
+        """Termine les rafraîchissements en cours puis ferme le pool de connexions (s'il appartient à ce client)."""
+        if self._refreshes:
+            await asyncio.gather(*self._refreshes, return_exceptions=True)
+        await self.auth.wait_refresh()
+        if self._owns_http:
+            await self.http.aclose()
+
     async def __aenter__(self):
         return self
 
     async def __aexit__(self, exc_type, exc, tb):
-        self.cache.close()
+        await self.aclose()
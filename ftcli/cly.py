@@ -1,9 +1,10 @@
 #!/usr/bin/env python3
 import argparse
 import os
-import fitz  # PyMuPDF
 from dotenv import load_dotenv
 import google.generativeai as genai
+from ftcli import database
+from ftcli.pdf_text import extract_cv_text
 
 # Charger les variables d'environnement
 load_dotenv()
@@ -11,11 +12,9 @@ API_KEY = os.getenv("GEMINI_API_KEY")
 genai.configure(api_key=API_KEY)
 
 def extraire_texte_cv(chemin_cv):
-    """Extrait le texte d'un fichier PDF."""
-    doc = fitz.open(chemin_cv)
-    texte = ""
-    for page in doc:
-        texte += page.get_text()
+    """Extrait le texte d'un fichier PDF (même extraction, mise en cache, que `ftcli profils analyser`)."""
+    database.init_db()  # le cache des PDF vit dans la base de ftcli
+    texte, _ = extract_cv_text(chemin_cv)
     return texte
 
 def analyser_cv(texte_cv):
@@ -1,10 +1,79 @@
+import atexit
+import hashlib
+import json
+import os
+import re
+import shutil
 import sqlite3
+import threading
+from contextlib import contextmanager
 from datetime import datetime
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, List, Tuple
+from .settings import DB_FILE
 
+LEGACY_DB_FILE = Path("ftcli.db")
+
+# --- Connexion ---
+# Une seule connexion par processus (rouverte après un fork), partagée entre threads
+# sous un verrou. Le mode WAL permet aux lecteurs de ne pas bloquer l'écrivain.
+_conn: sqlite3.Connection | None = None
+_conn_pid: int | None = None
+_lock = threading.RLock()
+_has_fts5 = True
+
+def _migrate_legacy_db():
+    """Reprend l'ancienne base `./ftcli.db` du répertoire courant lors du premier lancement."""
+    if not DB_FILE.exists() and LEGACY_DB_FILE.is_file():
+        DB_FILE.parent.mkdir(parents=True, exist_ok=True)
+        shutil.copy2(LEGACY_DB_FILE, DB_FILE)
+
+def get_connection() -> sqlite3.Connection:
+    """Retourne la connexion du processus, en l'ouvrant (avec ses pragmas) au premier appel."""
+    global _conn, _conn_pid
+    with _lock:
+        if _conn is None or _conn_pid != os.getpid():
+            _migrate_legacy_db()
+            conn = sqlite3.connect(DB_FILE, timeout=10.0, check_same_thread=False, cached_statements=256)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("PRAGMA foreign_keys=ON")
+            conn.execute("PRAGMA temp_store=MEMORY")
+            _conn, _conn_pid = conn, os.getpid()
+        return _conn
+
+def close_connection():
+    global _conn, _conn_pid
+    with _lock:
+        if _conn is not None and _conn_pid == os.getpid():
+            _conn.close()
+        _conn, _conn_pid = None, None
+
+atexit.register(close_connection)
+
+@contextmanager
+def transaction():
+    """Bloc transactionnel : commit à la sortie, rollback en cas d'exception."""
+    with _lock:
+        conn = get_connection()
+        with conn:
+            yield conn.cursor()
+
+def _fetchall(sql: str, params: Tuple = ()) -> List[Tuple]:
+    with _lock:
+        return get_connection().execute(sql, params).fetchall()
+
+def _fetchone(sql: str, params: Tuple = ()) -> Tuple | None:
+    with _lock:
+        return get_connection().execute(sql, params).fetchone()
+
+# --- Schéma ---
 def init_db():
     """Initialise la base de données SQLite."""
-    conn = sqlite3.connect("ftcli.db")
-    cursor = conn.cursor()
+    with transaction() as cursor:
+        _create_schema(cursor)
+
+def _create_schema(cursor: sqlite3.Cursor):
     cursor.execute("""
         CREATE TABLE IF NOT EXISTS cv_analyses (
             id INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -14,6 +83,19 @@ def init_db():
             created_at TEXT
         )
     """)
+    if _add_column_if_missing(cursor, "cv_analyses", "texte_hash", "TEXT"):
+        rows = cursor.execute("SELECT id, texte_cv FROM cv_analyses").fetchall()
+        cursor.executemany("UPDATE cv_analyses SET texte_hash = ? WHERE id = ?", ((text_hash(t or ""), i) for i, t in rows))
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_cv_analyses_texte_hash ON cv_analyses (texte_hash)")
+    # Texte extrait des PDF de CV, par empreinte SHA-256 du fichier
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS pdf_texts (
+            pdf_hash TEXT PRIMARY KEY,
+            texte TEXT NOT NULL,
+            extracteur TEXT,
+            created_at TEXT
+        ) WITHOUT ROWID
+    """)
     cursor.execute("""
         CREATE TABLE IF NOT EXISTS tracked_offers (
             id INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -25,109 +107,698 @@ def init_db():
             created_at TEXT
         )
     """)
-    conn.commit()
-    conn.close()
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_tracked_offers_statut ON tracked_offers (statut, created_at)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_tracked_offers_created_at ON tracked_offers (created_at)")
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS offers (
+            id INTEGER PRIMARY KEY,
+            offre_id TEXT UNIQUE NOT NULL,
+            intitule TEXT,
+            description TEXT,
+            entreprise TEXT,
+            rome_code TEXT,
+            rome_libelle TEXT,
+            lieu TEXT,
+            departement TEXT,
+            type_contrat TEXT,
+            date_creation TEXT,
+            date_actualisation TEXT,
+            payload TEXT,
+            empreinte TEXT,
+            fetched_at TEXT
+        )
+    """)
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_offers_departement ON offers (departement, type_contrat)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_offers_date_creation ON offers (date_creation)")
+    _create_offers_fts(cursor)
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS saved_searches (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            nom TEXT UNIQUE NOT NULL,
+            mots TEXT,
+            departement TEXT,
+            type_contrat TEXT,
+            watermark TEXT,
+            last_run_at TEXT,
+            created_at TEXT
+        )
+    """)
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS saved_search_offers (
+            search_id INTEGER NOT NULL REFERENCES saved_searches (id) ON DELETE CASCADE,
+            offre_id TEXT NOT NULL,
+            empreinte TEXT,
+            date_creation TEXT,
+            first_seen TEXT,
+            last_seen TEXT,
+            expired_at TEXT,
+            PRIMARY KEY (search_id, offre_id)
+        )
+    """)
+    cursor.execute("CREATE TABLE IF NOT EXISTS watch_seen (offre_id TEXT PRIMARY KEY, seen_at TEXT) WITHOUT ROWID")
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS llm_usage (
+            id INTEGER PRIMARY KEY,
+            operation TEXT,
+            model TEXT,
+            prompt_tokens INTEGER,
+            response_tokens INTEGER,
+            duration_ms INTEGER,
+            created_at TEXT
+        )
+    """)
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_llm_usage_created_at ON llm_usage (created_at)")
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS agent_runs (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            goal TEXT,
+            profil_id INTEGER,
+            plan TEXT NOT NULL,
+            statut TEXT,
+            created_at TEXT,
+            updated_at TEXT
+        )
+    """)
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS agent_steps (
+            run_id INTEGER NOT NULL REFERENCES agent_runs (id) ON DELETE CASCADE,
+            step_index INTEGER NOT NULL,
+            action TEXT,
+            arguments TEXT,
+            data TEXT,
+            error TEXT,
+            offre_ids TEXT,
+            finished_at TEXT,
+            PRIMARY KEY (run_id, step_index)
+        )
+    """)
+    # Résultats de matching structurés, par version (empreinte) de l'offre
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS match_results (
+            profil_id INTEGER NOT NULL REFERENCES cv_analyses (id) ON DELETE CASCADE,
+            offre_id TEXT NOT NULL,
+            empreinte TEXT NOT NULL,
+            intitule TEXT,
+            score INTEGER NOT NULL,
+            strengths TEXT,
+            gaps TEXT,
+            keywords TEXT,
+            suggestion TEXT,
+            source TEXT,
+            created_at TEXT,
+            PRIMARY KEY (profil_id, offre_id, empreinte)
+        )
+    """)
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_match_results_score ON match_results (profil_id, score)")
+
+def _add_column_if_missing(cursor: sqlite3.Cursor, table: str, column: str, declaration: str) -> bool:
+    """Ajoute une colonne à une table d'une base existante ; retourne True si elle a été créée."""
+    if column in {row[1] for row in cursor.execute(f"PRAGMA table_info({table})")}:
+        return False
+    cursor.execute(f"ALTER TABLE {table} ADD COLUMN {column} {declaration}")
+    return True
+
+def _create_offers_fts(cursor: sqlite3.Cursor):
+    """Index plein texte FTS5 (contenu externe) sur `offers`, maintenu par triggers.
+
+    Sans FTS5 dans la build SQLite, `search_local_offers` se replie sur LIKE.
+    """
+    global _has_fts5
+    try:
+        cursor.execute("""
+            CREATE VIRTUAL TABLE IF NOT EXISTS offers_fts USING fts5(
+                intitule, description, entreprise, rome_libelle,
+                content='offers', content_rowid='id', tokenize='unicode61 remove_diacritics 2'
+            )
+        """)
+    except sqlite3.OperationalError:
+        _has_fts5 = False
+        return
+    _has_fts5 = True
+    cursor.execute("""
+        CREATE TRIGGER IF NOT EXISTS offers_fts_ai AFTER INSERT ON offers BEGIN
+            INSERT INTO offers_fts (rowid, intitule, description, entreprise, rome_libelle)
+            VALUES (new.id, new.intitule, new.description, new.entreprise, new.rome_libelle);
+        END
+    """)
+    cursor.execute("""
+        CREATE TRIGGER IF NOT EXISTS offers_fts_ad AFTER DELETE ON offers BEGIN
+            INSERT INTO offers_fts (offers_fts, rowid, intitule, description, entreprise, rome_libelle)
+            VALUES ('delete', old.id, old.intitule, old.description, old.entreprise, old.rome_libelle);
+        END
+    """)
+    cursor.execute("""
+        CREATE TRIGGER IF NOT EXISTS offers_fts_au AFTER UPDATE OF intitule, description, entreprise, rome_libelle ON offers BEGIN
+            INSERT INTO offers_fts (offers_fts, rowid, intitule, description, entreprise, rome_libelle)
+            VALUES ('delete', old.id, old.intitule, old.description, old.entreprise, old.rome_libelle);
+            INSERT INTO offers_fts (rowid, intitule, description, entreprise, rome_libelle)
+            VALUES (new.id, new.intitule, new.description, new.entreprise, new.rome_libelle);
+        END
+    """)
+
+# --- Profils ---
+def text_hash(texte: str) -> str:
+    """Empreinte d'un texte de CV, insensible aux différences d'espacement."""
+    return hashlib.sha256(" ".join(texte.split()).encode()).hexdigest()
 
 def save_cv_analysis(nom_profil: str, texte_cv: str, analyse: str) -> int:
     """Sauvegarde l'analyse d'un CV dans la base de données."""
-    conn = sqlite3.connect("ftcli.db")
-    cursor = conn.cursor()
     created_at = datetime.now().isoformat()
-    cursor.execute(
-        "INSERT INTO cv_analyses (nom_profil, texte_cv, analyse, created_at) VALUES (?, ?, ?, ?)",
-        (nom_profil, texte_cv, analyse, created_at)
+    with transaction() as cursor:
+        cursor.execute(
+            "INSERT INTO cv_analyses (nom_profil, texte_cv, analyse, created_at, texte_hash) VALUES (?, ?, ?, ?, ?)",
+            (nom_profil, texte_cv, analyse, created_at, text_hash(texte_cv))
+        )
+        return cursor.lastrowid
+
+def get_profile_by_text(texte_cv: str) -> dict | None:
+    """Profil le plus récent dont le texte de CV est identique (à l'espacement près), ou None."""
+    profile = _fetchone(
+        "SELECT id, nom_profil, texte_cv, analyse FROM cv_analyses WHERE texte_hash = ? ORDER BY id DESC LIMIT 1",
+        (text_hash(texte_cv),)
     )
-    profil_id = cursor.lastrowid
-    conn.commit()
-    conn.close()
-    return profil_id
+    if profile:
+        return {"id": profile[0], "nom": profile[1], "texte": profile[2], "analyse": profile[3]}
+    return None
 
 def get_profile_by_name(nom_profil: str) -> dict:
     """Récupère un profil par son nom."""
-    conn = sqlite3.connect("ftcli.db")
-    cursor = conn.cursor()
-    cursor.execute("SELECT * FROM cv_analyses WHERE nom_profil = ?", (nom_profil,))
-    profile = cursor.fetchone()
-    conn.close()
+    profile = _fetchone("SELECT id, nom_profil, texte_cv, analyse, created_at FROM cv_analyses WHERE nom_profil = ?", (nom_profil,))
     if profile:
         return {"id": profile[0], "nom": profile[1], "texte": profile[2], "analyse": profile[3], "created_at": profile[4]}
     return None
 
 def delete_profile(profil_id: int):
     """Supprime un profil de la base de données."""
-    conn = sqlite3.connect("ftcli.db")
-    cursor = conn.cursor()
-    cursor.execute("DELETE FROM cv_analyses WHERE id = ?", (profil_id,))
-    conn.commit()
-    conn.close()
+    with transaction() as cursor:
+        cursor.execute("DELETE FROM cv_analyses WHERE id = ?", (profil_id,))
 
 def get_all_profiles() -> list:
     """Récupère tous les profils sauvegardés."""
-    conn = sqlite3.connect("ftcli.db")
-    cursor = conn.cursor()
-    cursor.execute("SELECT id, nom_profil, created_at FROM cv_analyses")
-    profiles = [{"id": row[0], "nom": row[1], "created_at": row[2]} for row in cursor.fetchall()]
-    conn.close()
-    return profiles
+    rows = _fetchall("SELECT id, nom_profil, created_at FROM cv_analyses")
+    return [{"id": row[0], "nom": row[1], "created_at": row[2]} for row in rows]
+
+def get_profile(profil_id: int) -> dict:
+    """Récupère un profil par son ID."""
+    profile = _fetchone("SELECT id, nom_profil, texte_cv, analyse FROM cv_analyses WHERE id = ?", (profil_id,))
+    if profile:
+        return {"id": profile[0], "nom": profile[1], "texte": profile[2], "analyse": profile[3]}
+    return None
 
+def get_pdf_text(pdf_hash: str) -> str | None:
+    row = _fetchone("SELECT texte FROM pdf_texts WHERE pdf_hash = ?", (pdf_hash,))
+    return row[0] if row else None
+
+def save_pdf_text(pdf_hash: str, texte: str, extracteur: str):
+    with transaction() as cursor:
+        cursor.execute("INSERT OR REPLACE INTO pdf_texts (pdf_hash, texte, extracteur, created_at) VALUES (?, ?, ?, ?)",
+                       (pdf_hash, texte, extracteur, datetime.now().isoformat()))
+
+def get_profiles_by_ids(profil_ids: Iterable[int]) -> Dict[int, dict]:
+    """Récupère plusieurs profils en une requête, indexés par ID (les ID inconnus sont absents)."""
+    ids = list(dict.fromkeys(profil_ids))
+    if not ids:
+        return {}
+    placeholders = ", ".join("?" * len(ids))
+    rows = _fetchall(f"SELECT id, nom_profil, texte_cv, analyse FROM cv_analyses WHERE id IN ({placeholders})", tuple(ids))
+    return {row[0]: {"id": row[0], "nom": row[1], "texte": row[2], "analyse": row[3]} for row in rows}
+
+# --- Suivi des candidatures ---
 def save_tracked_offer(offre_id: str, offre_intitule: str, entreprise: str, statut: str):
     """Sauvegarde une offre dans le suivi des candidatures."""
-    conn = sqlite3.connect("ftcli.db")
-    cursor = conn.cursor()
     created_at = datetime.now().isoformat()
-    cursor.execute(
-        "INSERT INTO tracked_offers (offre_id, offre_intitule, entreprise, statut, created_at) VALUES (?, ?, ?, ?, ?)",
-        (offre_id, offre_intitule, entreprise, statut, created_at)
+    with transaction() as cursor:
+        cursor.execute(
+            "INSERT INTO tracked_offers (offre_id, offre_intitule, entreprise, statut, created_at) VALUES (?, ?, ?, ?, ?)",
+            (offre_id, offre_intitule, entreprise, statut, created_at)
+        )
+
+def save_tracked_offers_many(offers: Iterable[Dict], statut: str = "Sauvegardée") -> int:
+    """Ajoute plusieurs offres au suivi en une transaction ; les offres déjà suivies sont ignorées.
+
+    Chaque élément fournit `offre_id`, `offre_intitule`, `entreprise` et éventuellement `statut`.
+    Retourne le nombre d'offres réellement ajoutées.
+    """
+    created_at = datetime.now().isoformat()
+    rows = (
+        (o["offre_id"], o.get("offre_intitule"), o.get("entreprise"), o.get("statut", statut), created_at)
+        for o in offers
     )
-    conn.commit()
-    conn.close()
-
-def get_tracked_offers() -> list:
-    """Récupère toutes les candidatures suivies."""
-    conn = sqlite3.connect("ftcli.db")
-    cursor = conn.cursor()
-    cursor.execute("SELECT id, offre_id, offre_intitule, entreprise, statut, notes, created_at FROM tracked_offers")
-    offers = [
+    with transaction() as cursor:
+        cursor.executemany(
+            "INSERT OR IGNORE INTO tracked_offers (offre_id, offre_intitule, entreprise, statut, created_at) VALUES (?, ?, ?, ?, ?)",
+            rows
+        )
+        return cursor.rowcount
+
+def _tracked_filters(statut: str | None, since: str | None) -> Tuple[str, Tuple]:
+    clauses, params = [], []
+    if statut:
+        clauses.append("statut = ?"); params.append(statut)
+    if since:
+        clauses.append("created_at >= ?"); params.append(since)
+    return (" WHERE " + " AND ".join(clauses)) if clauses else "", tuple(params)
+
+def get_tracked_offers(statut: str | None = None, since: str | None = None, limit: int | None = None, offset: int = 0) -> list:
+    """Récupère les candidatures suivies, filtrées par statut / date d'ajout (ISO) et paginées."""
+    where, params = _tracked_filters(statut, since)
+    sql = f"SELECT id, offre_id, offre_intitule, entreprise, statut, notes, created_at FROM tracked_offers{where} ORDER BY created_at, id"
+    if limit is not None or offset:
+        sql += " LIMIT ? OFFSET ?"
+        params += (-1 if limit is None else limit, offset)
+    rows = _fetchall(sql, params)
+    return [
         {"id": row[0], "offre_id": row[1], "offre_intitule": row[2], "entreprise": row[3], "statut": row[4], "notes": row[5], "created_at": row[6]}
-        for row in cursor.fetchall()
+        for row in rows
     ]
-    conn.close()
-    return offers
+
+def count_tracked_offers(statut: str | None = None, since: str | None = None) -> int:
+    """Compte les candidatures correspondant aux mêmes filtres que `get_tracked_offers`."""
+    where, params = _tracked_filters(statut, since)
+    return _fetchone(f"SELECT COUNT(*) FROM tracked_offers{where}", params)[0]
+
+def get_dashboard_stats(statut_a_traiter: str = "Sauvegardée", top_n: int = 3) -> Dict:
+    """Statistiques du tableau de bord calculées en SQL : total, nombre par statut et
+    les `top_n` candidatures les plus anciennes encore au statut `statut_a_traiter`."""
+    par_statut = {
+        statut: count
+        for statut, count in _fetchall("SELECT statut, COUNT(*) FROM tracked_offers GROUP BY statut ORDER BY COUNT(*) DESC")
+    }
+    rows = _fetchall(
+        "SELECT id, offre_id, offre_intitule, entreprise, created_at FROM tracked_offers WHERE statut = ? ORDER BY created_at LIMIT ?",
+        (statut_a_traiter, top_n)
+    )
+    return {
+        "total": sum(par_statut.values()),
+        "par_statut": par_statut,
+        "a_traiter": [
+            {"id": row[0], "offre_id": row[1], "offre_intitule": row[2], "entreprise": row[3], "created_at": row[4]}
+            for row in rows
+        ],
+    }
 
 def update_tracked_offer(id_suivi: int, statut: str):
     """Met à jour le statut d'une candidature."""
-    conn = sqlite3.connect("ftcli.db")
-    cursor = conn.cursor()
-    cursor.execute("UPDATE tracked_offers SET statut = ? WHERE id = ?", (statut, id_suivi))
-    conn.commit()
-    conn.close()
+    with transaction() as cursor:
+        cursor.execute("UPDATE tracked_offers SET statut = ? WHERE id = ?", (statut, id_suivi))
+
+def update_tracked_offers_many(updates: Iterable[Tuple[int, str]]) -> int:
+    """Met à jour le statut de plusieurs candidatures (`(id_suivi, statut)`) en une transaction."""
+    with transaction() as cursor:
+        cursor.executemany("UPDATE tracked_offers SET statut = ? WHERE id = ?", ((statut, id_suivi) for id_suivi, statut in updates))
+        return cursor.rowcount
 
 def update_tracked_offer_notes(id_suivi: int, notes: str):
     """Met à jour les notes d'une candidature."""
-    conn = sqlite3.connect("ftcli.db")
-    cursor = conn.cursor()
-    cursor.execute("UPDATE tracked_offers SET notes = ? WHERE id = ?", (notes, id_suivi))
-    conn.commit()
-    conn.close()
+    with transaction() as cursor:
+        cursor.execute("UPDATE tracked_offers SET notes = ? WHERE id = ?", (notes, id_suivi))
 
 def get_tracked_offer(id_suivi: int) -> dict:
     """Récupère une candidature par son ID."""
-    conn = sqlite3.connect("ftcli.db")
-    cursor = conn.cursor()
-    cursor.execute("SELECT id, offre_id, offre_intitule, entreprise, statut, notes FROM tracked_offers WHERE id = ?", (id_suivi,))
-    offer = cursor.fetchone()
-    conn.close()
+    offer = _fetchone("SELECT id, offre_id, offre_intitule, entreprise, statut, notes FROM tracked_offers WHERE id = ?", (id_suivi,))
     if offer:
         return {"id": offer[0], "offre_id": offer[1], "offre_intitule": offer[2], "entreprise": offer[3], "statut": offer[4], "notes": offer[5]}
     return None
 
-def get_profile(profil_id: int) -> dict:
-    """Récupère un profil par son ID."""
-    conn = sqlite3.connect("ftcli.db")
-    cursor = conn.cursor()
-    cursor.execute("SELECT id, nom_profil, texte_cv, analyse FROM cv_analyses WHERE id = ?", (profil_id,))
-    profile = cursor.fetchone()
-    conn.close()
-    if profile:
-        return {"id": profile[0], "nom": profile[1], "texte": profile[2], "analyse": profile[3]}
-    return None
+# --- Entrepôt local des offres ---
+_UPSERT_CHUNK = 500
+
+def _offer_row(offre: Dict, fetched_at: str) -> Tuple:
+    entreprise = offre.get("entreprise", {}) or {}
+    lieu = offre.get("lieuTravail", {}) or {}
+    libelle_lieu = lieu.get("libelle") or ""
+    departement = libelle_lieu.split(" - ")[0].strip() if " - " in libelle_lieu else (lieu.get("codePostal") or "")[:2]
+    payload = json.dumps(offre, ensure_ascii=False, sort_keys=True)
+    return (
+        offre["id"], offre.get("intitule"), offre.get("description"),
+        entreprise.get("nom") or entreprise.get("description"),
+        offre.get("romeCode"), offre.get("romeLibelle"), libelle_lieu or None, departement or None,
+        offre.get("typeContrat"), offre.get("dateCreation"), offre.get("dateActualisation"),
+        payload, _fingerprint(payload), fetched_at,
+    )
+
+def _fingerprint(payload: str) -> str:
+    return hashlib.sha1(payload.encode()).hexdigest()
+
+def offer_fingerprint(offre: Dict) -> str:
+    """Empreinte du contenu d'une offre (identique à la colonne `offers.empreinte`)."""
+    return _fingerprint(json.dumps(offre, ensure_ascii=False, sort_keys=True))
+
+def upsert_offers(offres: Iterable[Dict]) -> Dict[str, int]:
+    """Insère ou met à jour des offres de l'API dans l'entrepôt local (et son index plein texte).
+
+    Une offre dont le contenu n'a pas changé ne touche que `fetched_at` (pas de réindexation).
+    Retourne les compteurs `new`, `updated` et `unchanged`.
+    """
+    fetched_at = datetime.now().isoformat()
+    rows = list({o["id"]: _offer_row(o, fetched_at) for o in offres if o.get("id")}.values())
+    counts = {"new": 0, "updated": 0, "unchanged": 0}
+    with transaction() as cursor:
+        for i in range(0, len(rows), _UPSERT_CHUNK):
+            chunk = rows[i:i + _UPSERT_CHUNK]
+            placeholders = ", ".join("?" * len(chunk))
+            existing = dict(cursor.execute(
+                f"SELECT offre_id, empreinte FROM offers WHERE offre_id IN ({placeholders})",
+                tuple(row[0] for row in chunk)
+            ).fetchall())
+            changed = [row for row in chunk if existing.get(row[0]) != row[12]]
+            unchanged = [(fetched_at, row[0]) for row in chunk if existing.get(row[0]) == row[12]]
+            cursor.executemany("""
+                INSERT INTO offers (offre_id, intitule, description, entreprise, rome_code, rome_libelle, lieu,
+                                    departement, type_contrat, date_creation, date_actualisation, payload, empreinte, fetched_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT(offre_id) DO UPDATE SET
+                    intitule = excluded.intitule, description = excluded.description, entreprise = excluded.entreprise,
+                    rome_code = excluded.rome_code, rome_libelle = excluded.rome_libelle, lieu = excluded.lieu,
+                    departement = excluded.departement, type_contrat = excluded.type_contrat,
+                    date_creation = excluded.date_creation, date_actualisation = excluded.date_actualisation,
+                    payload = excluded.payload, empreinte = excluded.empreinte, fetched_at = excluded.fetched_at
+            """, changed)
+            cursor.executemany("UPDATE offers SET fetched_at = ? WHERE offre_id = ?", unchanged)
+            counts["new"] += sum(1 for row in changed if row[0] not in existing)
+            counts["updated"] += sum(1 for row in changed if row[0] in existing)
+            counts["unchanged"] += len(unchanged)
+    return counts
+
+def get_local_offer(offre_id: str) -> dict | None:
+    """Retourne l'offre stockée localement (payload complet de l'API), ou None."""
+    row = _fetchone("SELECT payload FROM offers WHERE offre_id = ?", (offre_id,))
+    return json.loads(row[0]) if row else None
+
+def _fts_query(query: str) -> str:
+    """Convertit une saisie libre en requête FTS5 sûre : chaque mot devient un préfixe, tous requis."""
+    return " ".join(f'"{mot}"*' for mot in re.findall(r"\w+", query))
+
+def search_local_offers(
+    query: str,
+    departement: str | None = None,
+    type_contrat: str | None = None,
+    limit: int = 20,
+) -> List[Dict]:
+    """Recherche plein texte dans les offres déjà téléchargées, classée par pertinence (BM25).
+
+    L'intitulé pèse le plus, puis le libellé ROME, l'entreprise et la description.
+    """
+    filters, params = [], []
+    if departement:
+        filters.append("o.departement = ?"); params.append(departement)
+    if type_contrat:
+        filters.append("o.type_contrat = ?"); params.append(type_contrat)
+    where = "".join(f" AND {f}" for f in filters)
+    columns = "o.offre_id, o.intitule, o.entreprise, o.lieu, o.type_contrat, o.date_creation"
+
+    fts_query = _fts_query(query)
+    if not fts_query:
+        return []
+    if _has_fts5:
+        rows = _fetchall(f"""
+            SELECT {columns}, bm25(offers_fts, 10.0, 1.0, 3.0, 5.0) AS rang,
+                   snippet(offers_fts, 1, '[', ']', '…', 12)
+            FROM offers_fts JOIN offers o ON o.id = offers_fts.rowid
+            WHERE offers_fts MATCH ?{where}
+            ORDER BY rang LIMIT ?
+        """, (fts_query, *params, limit))
+    else:
+        mots = re.findall(r"\w+", query)
+        like = " AND ".join("(o.intitule LIKE ? OR o.description LIKE ? OR o.entreprise LIKE ? OR o.rome_libelle LIKE ?)" for _ in mots)
+        like_params = [f"%{m}%" for m in mots for _ in range(4)]
+        rows = _fetchall(f"""
+            SELECT {columns}, 0.0, substr(o.description, 1, 80)
+            FROM offers o WHERE {like}{where}
+            ORDER BY o.date_creation DESC LIMIT ?
+        """, (*like_params, *params, limit))
+    return [
+        {"offre_id": r[0], "intitule": r[1], "entreprise": r[2], "lieu": r[3], "type_contrat": r[4],
+         "date_creation": r[5], "score": -r[6], "extrait": r[7]}
+        for r in rows
+    ]
+
+_EXPORT_BATCH = 500
+
+def iter_local_offers(
+    query: str | None = None,
+    departement: str | None = None,
+    type_contrat: str | None = None,
+    batch_size: int = _EXPORT_BATCH,
+) -> Iterator[Dict]:
+    """Parcourt les offres de l'entrepôt local (payload complet), par lots de `batch_size`.
+
+    La pagination se fait par clé (`id > dernier id`) : la mémoire reste constante quel que soit
+    le nombre d'offres, et la connexion n'est pas monopolisée entre deux lots.
+    """
+    filters, params = [], []
+    if query:
+        if _has_fts5:
+            if not (fts_query := _fts_query(query)):
+                return
+            filters.append("o.id IN (SELECT rowid FROM offers_fts WHERE offers_fts MATCH ?)"); params.append(fts_query)
+        else:
+            for mot in re.findall(r"\w+", query):
+                filters.append("(o.intitule LIKE ? OR o.description LIKE ? OR o.entreprise LIKE ? OR o.rome_libelle LIKE ?)")
+                params.extend([f"%{mot}%"] * 4)
+    if departement:
+        filters.append("o.departement = ?"); params.append(departement)
+    if type_contrat:
+        filters.append("o.type_contrat = ?"); params.append(type_contrat)
+    where = "".join(f" AND {f}" for f in filters)
+    dernier = 0
+    while True:
+        rows = _fetchall(f"SELECT o.id, o.payload FROM offers o WHERE o.id > ?{where} ORDER BY o.id LIMIT ?",
+                         (dernier, *params, batch_size))
+        for row in rows:
+            yield json.loads(row[1])
+        if len(rows) < batch_size:
+            return
+        dernier = rows[-1][0]
+
+def iter_tracked_offers_detailed(statut: str | None = None, batch_size: int = _EXPORT_BATCH) -> Iterator[Dict]:
+    """Parcourt les candidatures suivies sous forme d'offres : payload local s'il existe (sinon
+    intitulé et entreprise du suivi), complété d'une clé `suivi` (statut, notes, date d'ajout)."""
+    where, params = (" AND t.statut = ?", (statut,)) if statut else ("", ())
+    dernier = 0
+    while True:
+        rows = _fetchall(f"""
+            SELECT t.id, t.offre_id, t.offre_intitule, t.entreprise, t.statut, t.notes, t.created_at, o.payload
+            FROM tracked_offers t LEFT JOIN offers o ON o.offre_id = t.offre_id
+            WHERE t.id > ?{where} ORDER BY t.id LIMIT ?
+        """, (dernier, *params, batch_size))
+        for r in rows:
+            offre = json.loads(r[7]) if r[7] else {"id": r[1], "intitule": r[2], "entreprise": {"nom": r[3]}}
+            offre["suivi"] = {"id": r[0], "statut": r[4], "notes": r[5], "created_at": r[6]}
+            yield offre
+        if len(rows) < batch_size:
+            return
+        dernier = rows[-1][0]
+
+# --- Recherches sauvegardées (synchronisation incrémentale) ---
+_SAVED_SEARCH_COLUMNS = "id, nom, mots, departement, type_contrat, watermark, last_run_at, created_at"
+
+def _saved_search(row: Tuple) -> Dict:
+    return {"id": row[0], "nom": row[1], "mots": row[2], "departement": row[3], "type_contrat": row[4],
+            "watermark": row[5], "last_run_at": row[6], "created_at": row[7]}
+
+def save_search(nom: str, mots: str | None, departement: str | None = None, type_contrat: str | None = None) -> int:
+    """Enregistre une recherche à synchroniser."""
+    with transaction() as cursor:
+        cursor.execute(
+            "INSERT INTO saved_searches (nom, mots, departement, type_contrat, created_at) VALUES (?, ?, ?, ?, ?)",
+            (nom, mots, departement, type_contrat, datetime.now().isoformat())
+        )
+        return cursor.lastrowid
+
+def get_saved_searches() -> List[Dict]:
+    return [_saved_search(row) for row in _fetchall(f"SELECT {_SAVED_SEARCH_COLUMNS} FROM saved_searches ORDER BY id")]
+
+def get_saved_search(nom: str) -> Dict | None:
+    row = _fetchone(f"SELECT {_SAVED_SEARCH_COLUMNS} FROM saved_searches WHERE nom = ?", (nom,))
+    return _saved_search(row) if row else None
+
+def delete_saved_search(nom: str) -> bool:
+    with transaction() as cursor:
+        cursor.execute("DELETE FROM saved_searches WHERE nom = ?", (nom,))
+        return cursor.rowcount > 0
+
+def update_search_watermark(search_id: int, watermark: str | None, last_run_at: str | None = None):
+    """Met à jour le filigrane (date de création minimale de la prochaine synchronisation)."""
+    with transaction() as cursor:
+        cursor.execute("UPDATE saved_searches SET watermark = ?, last_run_at = ? WHERE id = ?", (watermark, last_run_at, search_id))
+
+def record_search_offers(search_id: int, offres: Iterable[Dict]) -> Dict[str, List[str]]:
+    """Associe les offres reçues à la recherche et les classe en `new` (jamais vues par cette
+    recherche), `updated` (contenu modifié depuis la dernière fois) et `unchanged`."""
+    seen_at = datetime.now().isoformat()
+    rows = {o["id"]: (search_id, o["id"], offer_fingerprint(o), o.get("dateCreation"), seen_at, seen_at) for o in offres if o.get("id")}
+    result = {"new": [], "updated": [], "unchanged": []}
+    with transaction() as cursor:
+        ids = list(rows)
+        known = {}
+        for i in range(0, len(ids), _UPSERT_CHUNK):
+            chunk = ids[i:i + _UPSERT_CHUNK]
+            known.update(cursor.execute(
+                f"SELECT offre_id, empreinte FROM saved_search_offers WHERE search_id = ? AND offre_id IN ({', '.join('?' * len(chunk))})",
+                (search_id, *chunk)
+            ).fetchall())
+        for offre_id, row in rows.items():
+            etat = "new" if offre_id not in known else "updated" if known[offre_id] != row[2] else "unchanged"
+            result[etat].append(offre_id)
+        cursor.executemany("""
+            INSERT INTO saved_search_offers (search_id, offre_id, empreinte, date_creation, first_seen, last_seen)
+            VALUES (?, ?, ?, ?, ?, ?)
+            ON CONFLICT(search_id, offre_id) DO UPDATE SET
+                empreinte = excluded.empreinte, date_creation = excluded.date_creation,
+                last_seen = excluded.last_seen, expired_at = NULL
+        """, rows.values())
+    return result
+
+def mark_offers_seen(offre_ids: Iterable[str]) -> List[str]:
+    """Ajoute les offres à l'ensemble persistant des offres déjà notifiées par `ftcli watch`
+    et retourne celles qui n'y figuraient pas encore."""
+    ids = list(dict.fromkeys(offre_ids))
+    seen_at = datetime.now().isoformat()
+    nouvelles = []
+    with transaction() as cursor:
+        for offre_id in ids:
+            cursor.execute("INSERT OR IGNORE INTO watch_seen (offre_id, seen_at) VALUES (?, ?)", (offre_id, seen_at))
+            if cursor.rowcount:
+                nouvelles.append(offre_id)
+    return nouvelles
+
+def get_offer_titles(offre_ids: Iterable[str]) -> Dict[str, str]:
+    """Intitulés des offres de l'entrepôt local, indexés par ID."""
+    ids = list(dict.fromkeys(offre_ids))
+    titles = {}
+    for i in range(0, len(ids), _UPSERT_CHUNK):
+        chunk = ids[i:i + _UPSERT_CHUNK]
+        titles.update(_fetchall(f"SELECT offre_id, intitule FROM offers WHERE offre_id IN ({', '.join('?' * len(chunk))})", tuple(chunk)))
+    return titles
+
+def expire_search_offers(search_id: int, created_before: str) -> int:
+    """Marque comme expirées les offres de la recherche créées avant `created_before` (ISO)."""
+    with transaction() as cursor:
+        cursor.execute(
+            "UPDATE saved_search_offers SET expired_at = ? WHERE search_id = ? AND expired_at IS NULL AND date_creation < ?",
+            (datetime.now().isoformat(), search_id, created_before)
+        )
+        return cursor.rowcount
+
+def count_search_offers(search_id: int) -> int:
+    """Nombre d'offres actives (non expirées) associées à la recherche."""
+    return _fetchone("SELECT COUNT(*) FROM saved_search_offers WHERE search_id = ? AND expired_at IS NULL", (search_id,))[0]
+
+# --- Exécutions de l'agent (points de reprise) ---
+_AGENT_RUN_COLUMNS = "id, goal, profil_id, plan, statut, created_at, updated_at"
+
+def _agent_run(row: Tuple) -> Dict:
+    return {"id": row[0], "goal": row[1], "profil_id": row[2], "plan": json.loads(row[3]), "statut": row[4],
+            "created_at": row[5], "updated_at": row[6]}
+
+def create_agent_run(goal: str | None, profil_id: int | None, plan: List[Dict]) -> int:
+    """Enregistre un plan de l'agent avant son exécution et retourne l'identifiant du run."""
+    now = datetime.now().isoformat()
+    with transaction() as cursor:
+        cursor.execute(
+            "INSERT INTO agent_runs (goal, profil_id, plan, statut, created_at, updated_at) VALUES (?, ?, ?, 'en cours', ?, ?)",
+            (goal, profil_id, json.dumps(plan, ensure_ascii=False), now, now)
+        )
+        return cursor.lastrowid
+
+def get_agent_run(run_id: int) -> Dict | None:
+    row = _fetchone(f"SELECT {_AGENT_RUN_COLUMNS} FROM agent_runs WHERE id = ?", (run_id,))
+    return _agent_run(row) if row else None
+
+def get_agent_runs(limit: int = 20) -> List[Dict]:
+    """Derniers runs, du plus récent au plus ancien, avec le nombre d'étapes réussies."""
+    rows = _fetchall(f"""
+        SELECT {_AGENT_RUN_COLUMNS},
+               (SELECT COUNT(*) FROM agent_steps s WHERE s.run_id = r.id AND s.error IS NULL)
+        FROM agent_runs r ORDER BY id DESC LIMIT ?
+    """, (limit,))
+    return [dict(_agent_run(row), etapes_ok=row[7]) for row in rows]
+
+def update_agent_run_status(run_id: int, statut: str):
+    with transaction() as cursor:
+        cursor.execute("UPDATE agent_runs SET statut = ?, updated_at = ? WHERE id = ?", (statut, datetime.now().isoformat(), run_id))
+
+def save_agent_step(run_id: int, step_index: int, action: str, arguments: Dict, data=None,
+                    error: str | None = None, offre_ids: List[str] | None = None):
+    """Enregistre (ou remplace) le résultat d'une étape ; `data` doit être sérialisable en JSON."""
+    with transaction() as cursor:
+        cursor.execute(
+            "INSERT OR REPLACE INTO agent_steps (run_id, step_index, action, arguments, data, error, offre_ids, finished_at) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            (run_id, step_index, action, json.dumps(arguments, ensure_ascii=False),
+             json.dumps(data, ensure_ascii=False) if error is None else None, error,
+             json.dumps(offre_ids or []), datetime.now().isoformat())
+        )
+        cursor.execute("UPDATE agent_runs SET updated_at = ? WHERE id = ?", (datetime.now().isoformat(), run_id))
+
+def get_agent_steps(run_id: int, completed_only: bool = True) -> Dict[int, Dict]:
+    """Résultats enregistrés des étapes d'un run, indexés par position dans le plan."""
+    sql = "SELECT step_index, action, arguments, data, error, offre_ids FROM agent_steps WHERE run_id = ?"
+    if completed_only:
+        sql += " AND error IS NULL"
+    return {
+        row[0]: {"action": row[1], "arguments": json.loads(row[2]), "data": json.loads(row[3]) if row[3] is not None else None,
+                 "error": row[4], "offre_ids": json.loads(row[5] or "[]")}
+        for row in _fetchall(sql, (run_id,))
+    }
+
+# --- Consommation de tokens des appels IA ---
+def record_llm_usage(operation: str, model: str, prompt_tokens: int, response_tokens: int, duration_ms: int):
+    with transaction() as cursor:
+        cursor.execute(
+            "INSERT INTO llm_usage (operation, model, prompt_tokens, response_tokens, duration_ms, created_at) VALUES (?, ?, ?, ?, ?, ?)",
+            (operation, model, prompt_tokens, response_tokens, duration_ms, datetime.now().isoformat())
+        )
+
+def get_llm_usage_summary(since: str | None = None) -> List[Dict]:
+    """Appels, tokens (prompt / réponse) et durée moyenne par opération depuis `since` (ISO)."""
+    where, params = ("WHERE created_at >= ?", (since,)) if since else ("", ())
+    rows = _fetchall(f"""
+        SELECT operation, COUNT(*), SUM(prompt_tokens), SUM(response_tokens), AVG(duration_ms)
+        FROM llm_usage {where} GROUP BY operation ORDER BY SUM(prompt_tokens) + SUM(response_tokens) DESC
+    """, params)
+    return [
+        {"operation": r[0], "appels": r[1], "prompt_tokens": r[2] or 0, "response_tokens": r[3] or 0, "duree_moyenne_ms": r[4] or 0}
+        for r in rows
+    ]
+
+# --- Résultats de matching ---
+def save_match_results(profil_id: int, resultats: Iterable[Tuple[Dict, Dict]], source: str) -> int:
+    """Enregistre des paires `(offre, résultat)` ; `source` vaut "rapport" (`match`) ou "lot" (`synthese`).
+
+    La clé inclut l'empreinte de l'offre : une offre modifiée obtient une nouvelle ligne, et une
+    nouvelle évaluation de la même version remplace l'ancienne. Les résultats en erreur sont ignorés.
+    """
+    now = datetime.now().isoformat()
+    rows = [
+        (profil_id, offre["id"], offer_fingerprint(offre), offre.get("intitule"), resultat["score"],
+         json.dumps(resultat.get("strengths", []), ensure_ascii=False), json.dumps(resultat.get("gaps", []), ensure_ascii=False),
+         json.dumps(resultat.get("keywords", []), ensure_ascii=False), resultat.get("suggestion"), source, now)
+        for offre, resultat in resultats if offre.get("id") and "score" in resultat
+    ]
+    if not rows:
+        return 0
+    with transaction() as cursor:
+        cursor.executemany("""
+            INSERT OR REPLACE INTO match_results (profil_id, offre_id, empreinte, intitule, score, strengths, gaps,
+                                                  keywords, suggestion, source, created_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        """, rows)
+    return len(rows)
+
+def get_match_results(profil_id: int, min_score: int = 0, limit: int | None = None) -> List[Dict]:
+    """Résultat le plus récent de chaque offre évaluée pour le profil, par score décroissant."""
+    rows = _fetchall("""
+        SELECT offre_id, intitule, score, strengths, gaps, keywords, suggestion, source, created_at
+        FROM (
+            SELECT *, ROW_NUMBER() OVER (PARTITION BY offre_id ORDER BY created_at DESC) AS rang
+            FROM match_results WHERE profil_id = ?
+        )
+        WHERE rang = 1 AND score >= ? ORDER BY score DESC, created_at DESC LIMIT ?
+    """, (profil_id, min_score, -1 if limit is None else limit))
+    return [
+        {"offre_id": r[0], "intitule": r[1], "score": r[2], "strengths": json.loads(r[3] or "[]"), "gaps": json.loads(r[4] or "[]"),
+         "keywords": json.loads(r[5] or "[]"), "suggestion": r[6], "source": r[7], "created_at": r[8]}
+        for r in rows
+    ]
@@ -1,57 +1,215 @@
-from typing import List, Dict
-
-def export_to_txt(data: List[Dict], filename: str):
-    with open(filename, "w", encoding="utf-8") as f:
-        for i, offre in enumerate(data, 1):
-            lieu = offre.get("lieuTravail", {}).get("libelle", "?")
-            contrat = offre.get("typeContratLibelle", "?")
-            date = offre.get("dateCreation", "")[:10]
-            entreprise = offre.get("entreprise", {}).get("nom") or offre.get("entreprise", {}).get("description", "?")
-            url = offre.get("origineOffre", {}).get("urlOrigine", "-")
-            salaire = offre.get("salaire", {}).get("libelle") or "Non précisé"
-            rome = f"{offre.get('romeCode','')} - {offre.get('romeLibelle','')}"
-            appel = offre.get("appellationlibelle", "")
-            desc = offre.get("description", "").replace("\n", " ").strip()
-            desc_short = desc[:200] + ("..." if len(desc) > 200 else "")
-            f.write(f"""{i}. {offre.get("intitule", "?")}
-Lieu : {lieu}
-Type de contrat : {contrat}
-Date publication : {date}
-Entreprise : {entreprise}
-Salaire : {salaire}
-ROME : {rome} | {appel}
-Description : {desc_short}
-Lien : {url}
-{'-'*70}
-""")
-
-def export_to_html(data: List[Dict], filename: str):
-    with open(filename, "w", encoding="utf-8") as f:
-        f.write("<html><head><meta charset='utf-8'><title>Offres d'emploi</title></head><body>")
-        f.write("<h1>Offres d'emploi exportées</h1>")
-        for i, offre in enumerate(data, 1):
-            lieu = offre.get("lieuTravail", {}).get("libelle", "?")
-            contrat = offre.get("typeContratLibelle", "?")
-            date = offre.get("dateCreation", "")[:10]
-            entreprise = offre.get("entreprise", {}).get("nom") or offre.get("entreprise", {}).get("description", "?")
-            url = offre.get("origineOffre", {}).get("urlOrigine", "-")
-            salaire = offre.get("salaire", {}).get("libelle") or "Non précisé"
-            rome = f"{offre.get('romeCode','')} - {offre.get('romeLibelle','')}"
-            appel = offre.get("appellationlibelle", "")
-            desc = offre.get("description", "").replace("\n", " ").strip()
-            desc_short = desc[:400] + ("..." if len(desc) > 400 else "")
-            f.write(f"""
-<h2>{i}. {offre.get("intitule", "?")}</h2>
-<ul>
-<li><b>Lieu :</b> {lieu}</li>
-<li><b>Type de contrat :</b> {contrat}</li>
-<li><b>Date publication :</b> {date}</li>
-<li><b>Entreprise :</b> {entreprise}</li>
-<li><b>Salaire :</b> {salaire}</li>
-<li><b>ROME :</b> {rome} | {appel}</li>
-<li><b>Description :</b> {desc_short}</li>
-<li><b>Lien :</b> <a href="{url}">{url}</a></li>
-</ul>
-<hr>
-""")
-        f.write("</body></html>")
+"""
+Export des offres en flux, vers TXT, HTML, JSONL, CSV ou Parquet.
+
+Les offres sont consommées une à une depuis un itérable (ou un générateur asynchrone, comme
+`FTClient.iter_offres`) et écrites au fil de l'eau : la mémoire ne dépend pas du nombre
+d'offres exportées. JSONL conserve l'offre complète de l'API ; les autres formats écrivent
+une ligne « à plat » (`offre_row`). Parquet nécessite pyarrow (`pip install ftcli[parquet]`)
+et écrit un groupe de lignes toutes les `PARQUET_BATCH` offres.
+"""
+import abc
+import csv
+import html
+import json
+from pathlib import Path
+from typing import AsyncIterable, Callable, Dict, Iterable, List, Optional, Sequence
+
+FORMATS = ("txt", "html", "jsonl", "csv", "parquet")
+
+# Colonnes des formats tabulaires ; SUIVI_COLUMNS s'y ajoutent pour l'export du suivi
+COLUMNS = [
+    "id", "intitule", "entreprise", "lieu", "type_contrat", "contrat", "date_creation", "date_actualisation",
+    "salaire", "experience", "rome_code", "rome_libelle", "appellation", "url", "description",
+]
+SUIVI_COLUMNS = ["statut", "notes", "suivi_le"]
+
+PARQUET_BATCH = 5000
+
+def offre_row(offre: Dict, columns: Sequence[str] = COLUMNS) -> Dict[str, str]:
+    """Champs d'une offre sous forme de chaînes, une par colonne (chaîne vide si absent)."""
+    entreprise = offre.get("entreprise") or {}
+    suivi = offre.get("suivi") or {}
+    valeurs = {
+        "id": offre.get("id"),
+        "intitule": offre.get("intitule"),
+        "entreprise": entreprise.get("nom") or entreprise.get("description"),
+        "lieu": (offre.get("lieuTravail") or {}).get("libelle"),
+        "type_contrat": offre.get("typeContrat"),
+        "contrat": offre.get("typeContratLibelle"),
+        "date_creation": (offre.get("dateCreation") or "")[:10],
+        "date_actualisation": (offre.get("dateActualisation") or "")[:10],
+        "salaire": (offre.get("salaire") or {}).get("libelle"),
+        "experience": offre.get("experienceLibelle"),
+        "rome_code": offre.get("romeCode"),
+        "rome_libelle": offre.get("romeLibelle"),
+        "appellation": offre.get("appellationlibelle"),
+        "url": (offre.get("origineOffre") or {}).get("urlOrigine"),
+        "description": " ".join((offre.get("description") or "").split()),
+        "statut": suivi.get("statut"),
+        "notes": suivi.get("notes"),
+        "suivi_le": (suivi.get("created_at") or "")[:10],
+    }
+    return {c: "" if valeurs.get(c) is None else str(valeurs[c]) for c in columns}
+
+def _extrait(texte: str, longueur: int) -> str:
+    return texte[:longueur] + ("..." if len(texte) > longueur else "")
+
+# --- Écrivains ---
+class _Writer(abc.ABC):
+    """Écrit les offres une à une dans `path` ; à utiliser comme gestionnaire de contexte."""
+
+    def __init__(self, path: Path, columns: Sequence[str] = COLUMNS):
+        self.path = path
+        self.columns = list(columns)
+        self.count = 0
+        self._file = open(path, "w", encoding="utf-8", newline="")
+
+    def write(self, offre: Dict):
+        self.count += 1
+        self._write(offre)
+
+    @abc.abstractmethod
+    def _write(self, offre: Dict):
+        """Écrit une offre (`self.count` est déjà incrémenté)."""
+
+    def close(self):
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+class TxtWriter(_Writer):
+    def _write(self, offre: Dict):
+        r = offre_row(offre, COLUMNS + SUIVI_COLUMNS)
+        lignes = [
+            f"{self.count}. {r['intitule'] or '?'}",
+            f"Lieu : {r['lieu'] or '?'}",
+            f"Type de contrat : {r['contrat'] or '?'}",
+            f"Date publication : {r['date_creation']}",
+            f"Entreprise : {r['entreprise'] or '?'}",
+            f"Salaire : {r['salaire'] or 'Non précisé'}",
+            f"ROME : {r['rome_code']} - {r['rome_libelle']} | {r['appellation']}",
+            f"Description : {_extrait(r['description'], 200)}",
+            f"Lien : {r['url'] or '-'}",
+        ]
+        if r["statut"]:
+            lignes.append(f"Suivi : {r['statut']}" + (f" — {r['notes']}" if r["notes"] else ""))
+        self._file.write("\n".join(lignes) + f"\n{'-' * 70}\n")
+
+class HtmlWriter(_Writer):
+    """Page HTML ; toutes les valeurs sont échappées, seuls les liens http(s) sont cliquables."""
+
+    def __init__(self, path: Path, columns: Sequence[str] = COLUMNS):
+        super().__init__(path, columns)
+        self._file.write("<!DOCTYPE html>\n<html><head><meta charset='utf-8'><title>Offres d'emploi</title></head><body>\n"
+                         "<h1>Offres d'emploi exportées</h1>\n")
+
+    def _write(self, offre: Dict):
+        r = offre_row(offre, COLUMNS + SUIVI_COLUMNS)
+        r["description"] = _extrait(r["description"], 400)  # avant échappement, pour ne pas couper une entité
+        r = {k: html.escape(v) for k, v in r.items()}
+        url = r["url"]
+        lien = f'<a href="{url}">{url}</a>' if url.startswith(("http://", "https://")) else (url or "-")
+        items = [
+            ("Lieu", r["lieu"] or "?"), ("Type de contrat", r["contrat"] or "?"), ("Date publication", r["date_creation"]),
+            ("Entreprise", r["entreprise"] or "?"), ("Salaire", r["salaire"] or "Non précisé"),
+            ("ROME", f"{r['rome_code']} - {r['rome_libelle']} | {r['appellation']}"),
+            ("Description", r["description"]), ("Lien", lien),
+        ]
+        if r["statut"]:
+            items.append(("Suivi", r["statut"] + (f" — {r['notes']}" if r["notes"] else "")))
+        lis = "\n".join(f"<li><b>{label} :</b> {valeur}</li>" for label, valeur in items)
+        self._file.write(f"<h2>{self.count}. {r['intitule'] or '?'}</h2>\n<ul>\n{lis}\n</ul>\n<hr>\n")
+
+    def close(self):
+        if not self._file.closed:
+            self._file.write("</body></html>\n")
+        super().close()
+
+class JsonlWriter(_Writer):
+    """Une offre complète (telle que renvoyée par l'API) par ligne."""
+
+    def _write(self, offre: Dict):
+        self._file.write(json.dumps(offre, ensure_ascii=False) + "\n")
+
+class CsvWriter(_Writer):
+    def __init__(self, path: Path, columns: Sequence[str] = COLUMNS):
+        super().__init__(path, columns)
+        self._csv = csv.DictWriter(self._file, fieldnames=self.columns)
+        self._csv.writeheader()
+
+    def _write(self, offre: Dict):
+        self._csv.writerow(offre_row(offre, self.columns))
+
+class ParquetWriter(_Writer):
+    """Colonnes texte, écrites par groupes de `PARQUET_BATCH` lignes."""
+
+    def __init__(self, path: Path, columns: Sequence[str] = COLUMNS, batch_size: int = PARQUET_BATCH):
+        try:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+        except ImportError:
+            raise RuntimeError("L'export Parquet nécessite pyarrow : pip install \"ftcli[parquet]\"") from None
+        self.path = path
+        self.columns = list(columns)
+        self.count = 0
+        self._pa = pa
+        self._schema = pa.schema([(c, pa.string()) for c in self.columns])
+        self._parquet = pq.ParquetWriter(str(path), self._schema, compression="zstd")
+        self._batch_size = batch_size
+        self._buffer: Dict[str, List[str]] = {c: [] for c in self.columns}
+
+    def _write(self, offre: Dict):
+        for c, v in offre_row(offre, self.columns).items():
+            self._buffer[c].append(v)
+        if len(self._buffer[self.columns[0]]) >= self._batch_size:
+            self._flush()
+
+    def _flush(self):
+        if self._buffer[self.columns[0]]:
+            self._parquet.write_table(self._pa.Table.from_pydict(self._buffer, schema=self._schema))
+            self._buffer = {c: [] for c in self.columns}
+
+    def close(self):
+        if self._parquet is not None:
+            self._flush()
+            self._parquet.close()
+            self._parquet = None
+
+WRITERS = {"txt": TxtWriter, "html": HtmlWriter, "jsonl": JsonlWriter, "csv": CsvWriter, "parquet": ParquetWriter}
+
+def detect_format(filename: str) -> str:
+    """Format déduit de l'extension du fichier (`.htm` -> html, `.ndjson` -> jsonl...)."""
+    extension = Path(filename).suffix.lower().lstrip(".")
+    fmt = {"htm": "html", "ndjson": "jsonl", "pq": "parquet"}.get(extension, extension)
+    if fmt not in WRITERS:
+        raise ValueError(f"Format inconnu pour '{filename}' (formats disponibles : {', '.join(FORMATS)}).")
+    return fmt
+
+def open_writer(filename: str, fmt: Optional[str] = None, columns: Sequence[str] = COLUMNS) -> _Writer:
+    return WRITERS[fmt or detect_format(filename)](Path(filename), columns)
+
+# --- Export ---
+def export_offres(offres: Iterable[Dict], filename: str, fmt: Optional[str] = None, columns: Sequence[str] = COLUMNS,
+                  on_progress: Optional[Callable[[int], None]] = None) -> int:
+    """Écrit les offres de l'itérable au fil de l'eau ; retourne le nombre d'offres exportées."""
+    with open_writer(filename, fmt, columns) as writer:
+        for offre in offres:
+            writer.write(offre)
+            if on_progress is not None:
+                on_progress(writer.count)
+        return writer.count
+
+async def export_offres_async(offres: AsyncIterable[Dict], filename: str, fmt: Optional[str] = None,
+                              columns: Sequence[str] = COLUMNS, on_progress: Optional[Callable[[int], None]] = None) -> int:
+    """Comme `export_offres`, pour un générateur asynchrone (les pages suivantes sont récupérées
+    pendant l'écriture des premières)."""
+    with open_writer(filename, fmt, columns) as writer:
+        async for offre in offres:
+            writer.write(offre)
+            if on_progress is not None:
+                on_progress(writer.count)
+        return writer.count
@@ -1,62 +1,129 @@
+import asyncio
+import json
 import os
-import requests
+import re
 import time
-import json
-from collections import deque
-from dotenv import load_dotenv
+import sqlite3
+from typing import Callable, Dict, List, Optional, Tuple
+import httpx
+from . import settings  # charge le fichier .env
+from .client import build_http_client
+from .ratelimit import TokenBucket
+from . import cache
+from . import database
+from .prompts import (format_offre, prompt_adapter_cv, prompt_batch_matching, prompt_lettre_motivation,
+                      prompt_rapport_matching, prompt_sections_cv)
 
-load_dotenv()
 API_KEY = os.getenv("GEMINI_API_KEY")
 
 GEMINI_MODEL = "gemini-2.0-flash"
+GEMINI_TIMEOUT = 90
 
 # --- Système de gestion de quota ---
+# Un seul seau à jetons partagé par les appels synchrones et asynchrones.
 REQUESTS_PER_MINUTE = 60
-TIME_WINDOW = 60
-request_timestamps = deque()
-
-def wait_for_quota():
-    """Fait une pause si nécessaire pour respecter le quota de l'API."""
-    now = time.time()
-    
-    while request_timestamps and now - request_timestamps[0] > TIME_WINDOW:
-        request_timestamps.popleft()
-    
-    if len(request_timestamps) >= REQUESTS_PER_MINUTE:
-        time_to_wait = (request_timestamps[0] + TIME_WINDOW) - now
-        if time_to_wait > 0:
-            # Ce print peut être commenté si vous ne voulez pas voir les messages de pause
-            # print(f"[bold yellow]⚠️ Limite de quota atteinte. Pause de {time_to_wait:.1f} secondes...[/bold yellow]")
-            time.sleep(time_to_wait)
-    
-    request_timestamps.append(time.time())
-
-def _call_gemini_api(prompt: str) -> str:
-    """Fonction helper pour appeler l'API Gemini avec gestion d'erreurs et de quota."""
+quota = TokenBucket(rate=REQUESTS_PER_MINUTE / 60, capacity=REQUESTS_PER_MINUTE)
+
+# À incrémenter à chaque modification d'un prompt : invalide les réponses mises en cache.
+PROMPT_VERSIONS = {
+    "sections_cv": 1,
+    "adapter_cv": 2,
+    "rapport_matching": 3,
+    "lettre_motivation": 2,
+    "match_batch": 1,
+}
+
+MAX_RETRIES = 3
+RETRY_DELAY = 5
+
+def _gemini_url() -> str:
+    return f"https://generativelanguage.googleapis.com/v1beta/models/{GEMINI_MODEL}:generateContent?key={API_KEY}"
+
+def _request_body(prompt: str, json_mode: bool = False) -> dict:
+    data = {"contents": [{"parts": [{"text": prompt}]}]}
+    if json_mode:
+        data["generationConfig"] = {"responseMimeType": "application/json"}
+    return data
+
+def _gemini_stream_url() -> str:
+    return f"https://generativelanguage.googleapis.com/v1beta/models/{GEMINI_MODEL}:streamGenerateContent?alt=sse&key={API_KEY}"
+
+def _extract_text(payload: dict) -> str:
+    candidates = payload.get("candidates", [])
+    if not candidates:
+        return "[ERREUR Gemini] Réponse vide ou malformée de l'API."
+    return candidates[0]["content"]["parts"][0]["text"]
+
+def _record_usage(operation: str, payload: dict, started: float):
+    """Enregistre les tokens consommés par un appel (`usageMetadata` de la réponse Gemini)."""
+    usage = payload.get("usageMetadata") or {}
+    try:
+        database.record_llm_usage(
+            operation, GEMINI_MODEL,
+            prompt_tokens=usage.get("promptTokenCount", 0),
+            response_tokens=usage.get("candidatesTokenCount", 0),
+            duration_ms=int((time.perf_counter() - started) * 1000),
+        )
+    except sqlite3.Error:
+        pass  # la comptabilité ne doit jamais faire échouer un appel
+
+def _chunk_text(payload: dict) -> str:
+    candidates = payload.get("candidates") or [{}]
+    parts = (candidates[0].get("content") or {}).get("parts") or []
+    return "".join(part.get("text", "") for part in parts)
+
+def _read_stream(resp, on_chunk: Callable[[str], None]) -> tuple[str, dict]:
+    """Lit une réponse SSE de `streamGenerateContent` : transmet chaque fragment de texte à
+    `on_chunk` et retourne le texte complet avec le dernier événement (qui porte `usageMetadata`)."""
+    resp.encoding = "utf-8"
+    morceaux, dernier = [], {}
+    for ligne in resp.iter_lines(decode_unicode=True):
+        if not ligne or not ligne.startswith("data:"):
+            continue
+        dernier = json.loads(ligne[len("data:"):])
+        if texte := _chunk_text(dernier):
+            morceaux.append(texte)
+            on_chunk(texte)
+    if not morceaux:
+        return "[ERREUR Gemini] Réponse vide ou malformée de l'API.", dernier
+    return "".join(morceaux), dernier
+
+def _call_gemini_api(prompt: str, operation: str = "autre", on_chunk: Optional[Callable[[str], None]] = None,
+                     json_mode: bool = False) -> str:
+    """Fonction helper pour appeler l'API Gemini avec gestion d'erreurs et de quota.
+
+    Avec `on_chunk`, la réponse est demandée en streaming (`streamGenerateContent`, SSE) et
+    chaque fragment de texte est transmis à `on_chunk` dès sa réception ; le texte complet est
+    retourné à la fin, comme en mode normal. `json_mode` demande une réponse JSON.
+    """
+    import requests
     if not API_KEY:
         return "[ERREUR] La clé API Gemini (GEMINI_API_KEY) n'est pas configurée."
 
-    wait_for_quota()
+    quota.acquire_blocking()
 
-    url = f"https://generativelanguage.googleapis.com/v1beta/models/{GEMINI_MODEL}:generateContent?key={API_KEY}"
     headers = {"Content-Type": "application/json"}
-    data = {"contents": [{"parts": [{"text": prompt}]}]}
+    data = _request_body(prompt, json_mode)
 
-    max_retries = 3
-    delay = 5
-
-    for attempt in range(max_retries):
+    for attempt in range(MAX_RETRIES):
         try:
-            resp = requests.post(url, headers=headers, json=data, timeout=90)
+            started = time.perf_counter()
+            if on_chunk is not None:
+                with requests.post(_gemini_stream_url(), headers=headers, json=data, timeout=GEMINI_TIMEOUT, stream=True) as resp:
+                    if not resp.ok:
+                        resp.content  # lit le corps de l'erreur avant la fermeture de la réponse
+                    resp.raise_for_status()
+                    texte, payload = _read_stream(resp, on_chunk)
+                _record_usage(operation, payload, started)
+                return texte
+            resp = requests.post(_gemini_url(), headers=headers, json=data, timeout=GEMINI_TIMEOUT)
             resp.raise_for_status()
-            candidates = resp.json().get("candidates", [])
-            if not candidates:
-                return "[ERREUR Gemini] Réponse vide ou malformée de l'API."
-            return candidates[0]["content"]["parts"][0]["text"]
+            payload = resp.json()
+            _record_usage(operation, payload, started)
+            return _extract_text(payload)
         except requests.exceptions.HTTPError as e:
-            if e.response.status_code >= 500 and attempt < max_retries - 1:
-                # print(f"[AVERTISSEMENT] Erreur serveur Gemini ({e.response.status_code}). Nouvel essai...")
-                time.sleep(delay)
+            if e.response.status_code >= 500 and attempt < MAX_RETRIES - 1:
+                time.sleep(RETRY_DELAY)
                 continue
             else:
                 return f"[ERREUR Gemini] Problème de connexion : {e}\n{getattr(e.response, 'text', '')}"
@@ -64,27 +131,287 @@ def _call_gemini_api(prompt: str) -> str:
             return f"[ERREUR Gemini] Erreur inattendue : {e}"
     return "[ERREUR Gemini] Échec de l'appel API après plusieurs tentatives."
 
-def extraire_sections_cv_ia(texte_cv: str) -> str:
-    prompt = ("Lis attentivement ce texte de CV et extrais de façon structurée les sections suivantes au format Markdown :\n"
-              "1. **Compétences**\n"
-              "2. **Expériences professionnelles**\n"
-              "3. **Formations**\n"
-              "Voici le texte :\n\n" + texte_cv)
-    return _call_gemini_api(prompt)
-
-def adapter_cv_ia(texte_cv: str, description_offre: dict) -> str:
-    prompt = f"""Adapte le CV suivant pour qu'il corresponde parfaitement à l'offre d'emploi. Mets en avant les compétences et expériences pertinentes.\n\n---CV---\n{texte_cv}\n\n---OFFRE---\n{json.dumps(description_offre, indent=2, ensure_ascii=False)}\n\n---CV ADAPTÉ---"""
-    return _call_gemini_api(prompt)
-
-def generer_rapport_matching_ia(analyse_cv: str, description_offre: dict) -> str:
-    prompt = f"""En tant qu'expert en recrutement, analyse la compatibilité entre ce CV et cette offre. Fournis un rapport Markdown avec :
-    1.  **📊 Score de Compatibilité** (en %).
-    2.  **✅ Points Forts** (3-4 points clés du CV qui matchent l'offre).
-    3.  **❌ Points Faibles** (2-3 compétences manquantes).
-    4.  **🔑 Mots-clés à intégrer**.
-    5.  **💬 Suggestion Stratégique**.\n\n---CV---\n{analyse_cv}\n\n---OFFRE---\n{json.dumps(description_offre, indent=2, ensure_ascii=False)}\n\n---RAPPORT---"""
-    return _call_gemini_api(prompt)
-
-def generer_lettre_motivation_ia(analyse_cv: str, description_offre: dict) -> str:
-    prompt = f"""Rédige une lettre de motivation percutante et professionnelle basée sur ce CV et cette offre.\n\n---CV---\n{analyse_cv}\n\n---OFFRE---\n{json.dumps(description_offre, indent=2, ensure_ascii=False)}\n\n---LETTRE---"""
-    return _call_gemini_api(prompt)
+# --- Client asynchrone ---
+# Le pool httpx est lié à la boucle asyncio qui l'a créé : il est recréé si la boucle change
+# (chaque `asyncio.run` de la CLI démarre une nouvelle boucle).
+_async_client: httpx.AsyncClient | None = None
+_async_client_loop: asyncio.AbstractEventLoop | None = None
+
+def _get_async_client() -> httpx.AsyncClient:
+    global _async_client, _async_client_loop
+    loop = asyncio.get_running_loop()
+    if _async_client is None or _async_client.is_closed or _async_client_loop is not loop:
+        _async_client = build_http_client(timeout=GEMINI_TIMEOUT)
+        _async_client_loop = loop
+    return _async_client
+
+async def aclose_async_client() -> None:
+    """Ferme le pool Gemini de la boucle courante (à appeler avant la fin de `asyncio.run`)."""
+    global _async_client, _async_client_loop
+    if _async_client is not None and _async_client_loop is asyncio.get_running_loop():
+        await _async_client.aclose()
+    _async_client, _async_client_loop = None, None
+
+async def _call_gemini_api_async(prompt: str, operation: str = "autre", json_mode: bool = False) -> str:
+    """Équivalent asynchrone de `_call_gemini_api` : n'occupe pas la boucle pendant l'attente.
+
+    `json_mode` demande au modèle une réponse JSON (`responseMimeType: application/json`).
+    """
+    if not API_KEY:
+        return "[ERREUR] La clé API Gemini (GEMINI_API_KEY) n'est pas configurée."
+
+    await quota.acquire()
+
+    data = _request_body(prompt, json_mode)
+
+    for attempt in range(MAX_RETRIES):
+        try:
+            started = time.perf_counter()
+            resp = await _get_async_client().post(_gemini_url(), json=data)
+            resp.raise_for_status()
+            payload = resp.json()
+            _record_usage(operation, payload, started)
+            return _extract_text(payload)
+        except httpx.HTTPStatusError as e:
+            if e.response.status_code >= 500 and attempt < MAX_RETRIES - 1:
+                await asyncio.sleep(RETRY_DELAY)
+                continue
+            else:
+                return f"[ERREUR Gemini] Problème de connexion : {e}\n{e.response.text}"
+        except Exception as e:
+            return f"[ERREUR Gemini] Erreur inattendue : {e}"
+    return "[ERREUR Gemini] Échec de l'appel API après plusieurs tentatives."
+
+# --- Appels mis en cache ---
+def _is_error(reponse: str) -> bool:
+    return reponse.lstrip().startswith("[ERREUR")
+
+def _cache_key(operation: str, *inputs) -> str:
+    return cache.llm_key(operation, GEMINI_MODEL, PROMPT_VERSIONS[operation], *inputs)
+
+def _cached_call(operation: str, prompt: str, inputs: tuple, use_cache: bool,
+                 on_chunk: Optional[Callable[[str], None]] = None) -> str:
+    """Réponse en cache ou appel à Gemini. En streaming (`on_chunk`), une réponse déjà en cache
+    est transmise d'un bloc ; une réponse reçue par fragments est mise en cache une fois complète."""
+    key = _cache_key(operation, *inputs)
+    if use_cache and (cached := cache.llm_get(key)) is not None:
+        if on_chunk is not None:
+            on_chunk(cached)
+        return cached
+    reponse = _call_gemini_api(prompt, operation, on_chunk)
+    if not _is_error(reponse):
+        cache.llm_set(key, reponse)
+    return reponse
+
+async def _cached_call_async(operation: str, prompt: str, inputs: tuple, use_cache: bool) -> str:
+    key = _cache_key(operation, *inputs)
+    if use_cache and (cached := cache.llm_get(key)) is not None:
+        return cached
+    reponse = await _call_gemini_api_async(prompt, operation)
+    if not _is_error(reponse):
+        cache.llm_set(key, reponse)
+    return reponse
+
+# --- Réponses JSON ---
+_FENCE_RE = re.compile(r"^```(?:json)?\s*|\s*```$")
+
+def _load_json(texte: str):
+    try:
+        return json.loads(_FENCE_RE.sub("", texte.strip()))
+    except json.JSONDecodeError as e:
+        raise ValueError(f"réponse JSON invalide ({e})") from None
+
+def _as_list(valeur) -> List[str]:
+    if isinstance(valeur, str):
+        valeur = [valeur]
+    if not isinstance(valeur, list):
+        return []
+    return [str(v).strip() for v in valeur if str(v).strip()]
+
+def _score(valeur) -> Optional[int]:
+    """Score entier ramené entre 0 et 100 (« 85 », « 85% », 85.4...) ; None s'il n'est pas numérique."""
+    try:
+        return max(0, min(100, round(float(str(valeur).strip().rstrip("%").strip()))))
+    except (TypeError, ValueError):
+        return None
+
+def parse_rapport_matching(texte: str) -> Dict:
+    """Valide le rapport de compatibilité JSON : `{score, strengths, gaps, keywords, suggestion}`.
+
+    Lève ValueError si la réponse n'est pas un objet JSON avec un score numérique.
+    """
+    data = _load_json(texte)
+    if isinstance(data, list) and len(data) == 1:
+        data = data[0]
+    if not isinstance(data, dict) or (score := _score(data.get("score"))) is None:
+        raise ValueError("rapport sans score numérique")
+    return {
+        "score": score,
+        "strengths": _as_list(data.get("strengths")),
+        "gaps": _as_list(data.get("gaps")),
+        "keywords": _as_list(data.get("keywords")),
+        "suggestion": str(data.get("suggestion") or "").strip(),
+    }
+
+def _rapport(reponse: str) -> Dict:
+    if _is_error(reponse):
+        return {"error": reponse.strip()}
+    try:
+        return parse_rapport_matching(reponse)
+    except ValueError as e:
+        return {"error": f"[ERREUR Gemini] {e}"}
+
+# Les offres sont projetées sur leurs champs utiles (`prompts.format_offre`) ; la clé de cache
+# porte sur cette projection, si bien qu'un changement d'un champ ignoré ne l'invalide pas.
+def extraire_sections_cv_ia(texte_cv: str, use_cache: bool = True, on_chunk=None) -> str:
+    return _cached_call("sections_cv", prompt_sections_cv(texte_cv), (texte_cv,), use_cache, on_chunk)
+
+# `on_chunk` active le streaming : chaque fragment de la réponse lui est transmis à sa réception.
+def adapter_cv_ia(texte_cv: str, description_offre: dict, use_cache: bool = True, on_chunk=None) -> str:
+    offre = format_offre(description_offre)
+    return _cached_call("adapter_cv", prompt_adapter_cv(texte_cv, offre), (texte_cv, offre), use_cache, on_chunk)
+
+# Le rapport de compatibilité est demandé en JSON (voir `parse_rapport_matching`) : il n'est pas
+# diffusé en streaming. En cas d'échec, le dictionnaire retourné ne contient qu'une clé "error".
+def generer_rapport_matching_ia(analyse_cv: str, description_offre: dict, use_cache: bool = True) -> Dict:
+    offre = format_offre(description_offre)
+    key = _cache_key("rapport_matching", analyse_cv, offre)
+    if use_cache and (cached := cache.llm_get(key)) is not None:
+        return json.loads(cached)
+    resultat = _rapport(_call_gemini_api(prompt_rapport_matching(analyse_cv, offre), "rapport_matching", json_mode=True))
+    if "error" not in resultat:
+        cache.llm_set(key, json.dumps(resultat, ensure_ascii=False))
+    return resultat
+
+def generer_lettre_motivation_ia(analyse_cv: str, description_offre: dict, use_cache: bool = True, on_chunk=None) -> str:
+    offre = format_offre(description_offre)
+    return _cached_call("lettre_motivation", prompt_lettre_motivation(analyse_cv, offre), (analyse_cv, offre), use_cache, on_chunk)
+
+async def extraire_sections_cv_ia_async(texte_cv: str, use_cache: bool = True) -> str:
+    return await _cached_call_async("sections_cv", prompt_sections_cv(texte_cv), (texte_cv,), use_cache)
+
+async def adapter_cv_ia_async(texte_cv: str, description_offre: dict, use_cache: bool = True) -> str:
+    offre = format_offre(description_offre)
+    return await _cached_call_async("adapter_cv", prompt_adapter_cv(texte_cv, offre), (texte_cv, offre), use_cache)
+
+async def generer_rapport_matching_ia_async(analyse_cv: str, description_offre: dict, use_cache: bool = True) -> Dict:
+    offre = format_offre(description_offre)
+    key = _cache_key("rapport_matching", analyse_cv, offre)
+    if use_cache and (cached := cache.llm_get(key)) is not None:
+        return json.loads(cached)
+    resultat = _rapport(await _call_gemini_api_async(prompt_rapport_matching(analyse_cv, offre), "rapport_matching", json_mode=True))
+    if "error" not in resultat:
+        cache.llm_set(key, json.dumps(resultat, ensure_ascii=False))
+    return resultat
+
+async def generer_lettre_motivation_ia_async(analyse_cv: str, description_offre: dict, use_cache: bool = True) -> str:
+    offre = format_offre(description_offre)
+    return await _cached_call_async("lettre_motivation", prompt_lettre_motivation(analyse_cv, offre), (analyse_cv, offre), use_cache)
+
+
+# --- Matching par lots ---
+# Le profil n'est envoyé qu'une fois pour N offres, qui reviennent sous forme d'un tableau JSON
+# `[{offre_id, score, strengths, gaps}]`. Chaque résultat est mis en cache par (profil, offre) :
+# seules les offres jamais évaluées sont envoyées, quel que soit le lot dans lequel elles arrivent.
+def parse_match_batch(texte: str, offre_ids: List[str]) -> Dict[str, Dict]:
+    """Valide la réponse JSON d'un lot ; retourne les résultats bien formés, par ID d'offre.
+
+    Lève ValueError si la réponse n'est pas un tableau JSON. Les éléments dont l'ID n'était pas
+    demandé ou dont le score n'est pas un nombre sont ignorés ; le score est ramené entre 0 et 100.
+    """
+    data = _load_json(texte)
+    if isinstance(data, dict) and len(data) == 1:  # tableau enveloppé : {"offres": [...]}
+        data = next(iter(data.values()))
+    if not isinstance(data, list):
+        raise ValueError("la réponse n'est pas un tableau JSON")
+    attendus = set(offre_ids)
+    resultats: Dict[str, Dict] = {}
+    for item in data:
+        if not isinstance(item, dict) or str(item.get("offre_id", "")).strip() not in attendus:
+            continue
+        if (score := _score(item.get("score"))) is None:
+            continue
+        offre_id = str(item["offre_id"]).strip()
+        resultats[offre_id] = {
+            "offre_id": offre_id,
+            "score": score,
+            "strengths": _as_list(item.get("strengths")),
+            "gaps": _as_list(item.get("gaps")),
+        }
+    return resultats
+
+def _lots(offres: List[Tuple[str, str]], max_offres: int, max_chars: int) -> List[List[Tuple[str, str]]]:
+    """Découpe les offres projetées en lots d'au plus `max_offres` offres et `max_chars` caractères."""
+    lots: List[List[Tuple[str, str]]] = []
+    lot: List[Tuple[str, str]] = []
+    taille = 0
+    for offre_id, offre in offres:
+        if lot and (len(lot) >= max_offres or taille + len(offre) > max_chars):
+            lots.append(lot)
+            lot, taille = [], 0
+        lot.append((offre_id, offre))
+        taille += len(offre)
+    if lot:
+        lots.append(lot)
+    return lots
+
+async def _match_lot(analyse_cv: str, lot: List[Tuple[str, str]], on_result: Callable[[Dict], None]):
+    reponse = await _call_gemini_api_async(prompt_batch_matching(analyse_cv, [offre for _, offre in lot]),
+                                           "match_batch", json_mode=True)
+    if _is_error(reponse):
+        for offre_id, _ in lot:
+            on_result({"offre_id": offre_id, "error": reponse.strip()})
+        return
+    try:
+        resultats = parse_match_batch(reponse, [offre_id for offre_id, _ in lot])
+        erreur = "offre absente de la réponse de l'IA"
+    except ValueError as e:
+        resultats, erreur = {}, f"[ERREUR Gemini] {e}"
+    manquantes = []
+    for offre_id, offre in lot:
+        if offre_id in resultats:
+            cache.llm_set(_cache_key("match_batch", analyse_cv, offre), json.dumps(resultats[offre_id], ensure_ascii=False))
+            on_result(resultats[offre_id])
+        else:
+            manquantes.append((offre_id, offre))
+    if len(manquantes) == 1 and len(lot) == 1:
+        on_result({"offre_id": manquantes[0][0], "error": erreur})
+    elif manquantes:
+        # Réponse tronquée ou incomplète : les offres restantes sont renvoyées en deux demi-lots
+        moitie = (len(manquantes) + 1) // 2
+        await asyncio.gather(*(_match_lot(analyse_cv, partie, on_result)
+                               for partie in (manquantes[:moitie], manquantes[moitie:]) if partie))
+
+async def match_offres_batch_async(
+    analyse_cv: str,
+    offres: List[dict],
+    use_cache: bool = True,
+    on_result: Optional[Callable[[Dict], None]] = None,
+    batch_size: int = settings.MATCH_BATCH_SIZE,
+    max_chars: int = settings.MATCH_BATCH_MAX_CHARS,
+) -> Dict[str, Dict]:
+    """Évalue le profil face à plusieurs offres en aussi peu d'appels IA que possible.
+
+    Retourne `{offre_id: {"offre_id", "score", "strengths", "gaps"}}` ; une offre qui n'a pas pu
+    être évaluée a à la place une clé `"error"`. `on_result` est appelé pour chaque résultat
+    dès qu'il est connu (affichage de la progression).
+    """
+    resultats: Dict[str, Dict] = {}
+    def recevoir(resultat: Dict):
+        resultats[resultat["offre_id"]] = resultat
+        if on_result is not None:
+            on_result(resultat)
+
+    a_envoyer: List[Tuple[str, str]] = []
+    vues = set()
+    for offre_data in offres:
+        if not (offre_id := offre_data.get("id")) or offre_id in vues:
+            continue
+        vues.add(offre_id)
+        offre = format_offre(offre_data)
+        if use_cache and (cached := cache.llm_get(_cache_key("match_batch", analyse_cv, offre))) is not None:
+            recevoir(json.loads(cached))
+        else:
+            a_envoyer.append((offre_id, offre))
+    await asyncio.gather(*(_match_lot(analyse_cv, lot, recevoir) for lot in _lots(a_envoyer, batch_size, max_chars)))
+    return resultats
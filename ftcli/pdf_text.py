@@ -0,0 +1,78 @@
+"""
+Extraction du texte des CV PDF, en processus, avec cache par empreinte du fichier.
+
+PyMuPDF (`pip install ftcli[pdf]`) lit le PDF sans lancer de sous-processus ; sans lui,
+`pdftotext` (poppler) sert de repli. Le texte extrait est enregistré en base sous l'empreinte
+SHA-256 du fichier : un PDF déjà lu n'est jamais ré-extrait.
+"""
+import hashlib
+import subprocess
+from typing import Optional, Tuple
+
+from . import database
+
+_HASH_CHUNK = 1024 * 1024
+
+class PdfExtractionError(Exception):
+    """PDF illisible, vide ou aucun extracteur disponible."""
+
+def file_hash(path) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        while chunk := f.read(_HASH_CHUNK):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def _extract_pymupdf(path) -> Optional[str]:
+    try:
+        import pymupdf
+    except ImportError:
+        try:
+            import fitz as pymupdf  # anciennes versions de PyMuPDF
+        except ImportError:
+            return None
+    try:
+        with pymupdf.open(path) as doc:
+            return "\n".join(page.get_text() for page in doc)
+    except Exception as e:
+        raise PdfExtractionError(f"PDF illisible : {e}") from None
+
+def _extract_pdftotext(path) -> str:
+    try:
+        result = subprocess.run(["pdftotext", str(path), "-"], capture_output=True, text=True, check=False)
+    except FileNotFoundError:
+        raise PdfExtractionError("Aucun extracteur PDF : installez PyMuPDF (pip install \"ftcli[pdf]\") ou pdftotext.") from None
+    if result.returncode != 0:
+        raise PdfExtractionError(f"Erreur pdftotext : {result.stderr.strip()}")
+    return result.stdout
+
+def extract_text(path) -> Tuple[str, str]:
+    """Texte brut du PDF et nom de l'extracteur utilisé (sans cache). Lève PdfExtractionError."""
+    texte = _extract_pymupdf(path)
+    extracteur = "pymupdf"
+    if texte is None:
+        texte, extracteur = _extract_pdftotext(path), "pdftotext"
+    texte = texte.strip()
+    if not texte:
+        raise PdfExtractionError("Le CV est vide ou illisible (PDF scanné ?).")
+    return texte, extracteur
+
+def extract_for_pool(path: str) -> Tuple[str, Optional[str], Optional[str], Optional[str]]:
+    """Variante de `extract_text` pour un ProcessPoolExecutor : ne lève pas d'exception et ne
+    touche pas à la base. Retourne `(path, texte, extracteur, erreur)`."""
+    try:
+        texte, extracteur = extract_text(path)
+        return path, texte, extracteur, None
+    except PdfExtractionError as e:
+        return path, None, None, str(e)
+    except OSError as e:
+        return path, None, None, f"Fichier illisible : {e}"
+
+def extract_cv_text(path, pdf_hash: Optional[str] = None) -> Tuple[str, bool]:
+    """Texte du CV, depuis le cache si ce PDF a déjà été lu. Retourne `(texte, depuis_le_cache)`."""
+    pdf_hash = pdf_hash or file_hash(path)
+    if (texte := database.get_pdf_text(pdf_hash)) is not None:
+        return texte, True
+    texte, extracteur = extract_text(path)
+    database.save_pdf_text(pdf_hash, texte, extracteur)
+    return texte, False
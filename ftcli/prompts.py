@@ -0,0 +1,104 @@
+"""
+Construction des prompts envoyés à Gemini.
+
+Les offres ne sont plus envoyées en JSON brut (`json.dumps(offre, indent=2)`) : elles sont
+projetées sur les champs utiles au modèle (intitulé, entreprise, lieu, contrat, compétences,
+description...) et mises en forme en lignes compactes. Les blocs de contact, URL d'origine,
+codes internes et l'indentation JSON, qui coûtaient des tokens sans rien apporter, disparaissent.
+"""
+import re
+from typing import Dict, List
+
+from . import settings
+
+_ESPACES_RE = re.compile(r"[ \t\u00a0]+")
+_LIGNES_VIDES_RE = re.compile(r"\n\s*\n+")
+_FIN_PHRASE_RE = re.compile(r"(?<=[.!?;:])\s")
+
+def truncate_description(texte: str, max_chars: int = settings.PROMPT_MAX_DESCRIPTION) -> str:
+    """Normalise les espaces et coupe la description à `max_chars` caractères.
+
+    La coupe se fait en fin de phrase (ou à défaut en fin de mot) pour ne pas laisser de
+    fragment, et est signalée par « […] ».
+    """
+    texte = _LIGNES_VIDES_RE.sub("\n", _ESPACES_RE.sub(" ", texte or "")).strip()
+    if len(texte) <= max_chars:
+        return texte
+    extrait = texte[:max_chars]
+    fins = [m.start() for m in _FIN_PHRASE_RE.finditer(extrait)]
+    if fins and fins[-1] > max_chars // 2:
+        extrait = extrait[:fins[-1]]
+    else:
+        extrait = extrait.rsplit(" ", 1)[0]
+    return extrait.rstrip() + " […]"
+
+def _libelles(elements, cle: str = "libelle") -> List[str]:
+    return [e[cle] for e in elements or [] if isinstance(e, dict) and e.get(cle)]
+
+def project_offre(offre: Dict, max_description: int = settings.PROMPT_MAX_DESCRIPTION) -> Dict[str, str]:
+    """Champs d'une offre utiles au modèle, sous forme de libellés (les champs vides sont omis)."""
+    entreprise = offre.get("entreprise") or {}
+    salaire = offre.get("salaire") or {}
+    formations = [
+        " ".join(filter(None, [f.get("niveauLibelle"), f.get("domaineLibelle")]))
+        for f in offre.get("formations") or []
+    ]
+    champs = {
+        "ID": offre.get("id"),
+        "Intitulé": offre.get("intitule"),
+        "Métier": offre.get("appellationlibelle") or offre.get("romeLibelle"),
+        "Entreprise": entreprise.get("nom"),
+        "Secteur": offre.get("secteurActiviteLibelle"),
+        "Lieu": (offre.get("lieuTravail") or {}).get("libelle"),
+        "Contrat": offre.get("typeContratLibelle") or offre.get("typeContrat"),
+        "Durée du travail": offre.get("dureeTravailLibelle"),
+        "Salaire": salaire.get("libelle"),
+        "Expérience": offre.get("experienceLibelle"),
+        "Formation": ", ".join(f for f in formations if f),
+        "Compétences": ", ".join(_libelles(offre.get("competences"))),
+        "Savoir-être": ", ".join(_libelles(offre.get("qualitesProfessionnelles"))),
+        "Langues": ", ".join(_libelles(offre.get("langues"))),
+        "Permis": ", ".join(_libelles(offre.get("permis"))),
+        "Description": truncate_description(offre.get("description", ""), max_description),
+    }
+    return {cle: valeur for cle, valeur in champs.items() if valeur}
+
+def format_offre(offre: Dict, max_description: int = settings.PROMPT_MAX_DESCRIPTION) -> str:
+    """Offre projetée, une ligne « Champ : valeur » par champ."""
+    return "\n".join(f"{cle} : {valeur}" for cle, valeur in project_offre(offre, max_description).items())
+
+# --- Prompts ---
+def prompt_sections_cv(texte_cv: str) -> str:
+    return ("Lis attentivement ce texte de CV et extrais de façon structurée les sections suivantes au format Markdown :\n"
+            "1. **Compétences**\n"
+            "2. **Expériences professionnelles**\n"
+            "3. **Formations**\n"
+            "Voici le texte :\n\n" + texte_cv)
+
+def prompt_adapter_cv(texte_cv: str, offre: str) -> str:
+    return f"""Adapte le CV suivant pour qu'il corresponde parfaitement à l'offre d'emploi. Mets en avant les compétences et expériences pertinentes.\n\n---CV---\n{texte_cv}\n\n---OFFRE---\n{offre}\n\n---CV ADAPTÉ---"""
+
+def prompt_rapport_matching(analyse_cv: str, offre: str) -> str:
+    return f"""En tant qu'expert en recrutement, analyse la compatibilité entre ce CV et cette offre. Réponds uniquement par un objet JSON :
+{{"score": <compatibilité de 0 à 100>, "strengths": ["3 à 4 points clés du CV qui correspondent à l'offre"], "gaps": ["2 à 3 compétences manquantes"], "keywords": ["mots-clés de l'offre à intégrer au CV"], "suggestion": "suggestion stratégique pour la candidature"}}
+
+---CV---
+{analyse_cv}
+
+---OFFRE---
+{offre}"""
+
+def prompt_lettre_motivation(analyse_cv: str, offre: str) -> str:
+    return f"""Rédige une lettre de motivation percutante et professionnelle basée sur ce CV et cette offre.\n\n---CV---\n{analyse_cv}\n\n---OFFRE---\n{offre}\n\n---LETTRE---"""
+
+def prompt_batch_matching(analyse_cv: str, offres: List[str]) -> str:
+    """Un seul prompt pour évaluer le CV face à plusieurs offres (déjà mises en forme par `format_offre`)."""
+    blocs = "\n\n".join(f"---OFFRE {i}---\n{offre}" for i, offre in enumerate(offres, 1))
+    return f"""En tant qu'expert en recrutement, évalue la compatibilité de ce CV avec chacune des {len(offres)} offres ci-dessous.
+Réponds uniquement par un tableau JSON contenant un objet par offre, dans l'ordre des offres :
+[{{"offre_id": "<ID de l'offre>", "score": <compatibilité de 0 à 100>, "strengths": ["2 à 4 points forts du CV pour cette offre"], "gaps": ["1 à 3 compétences manquantes"]}}]
+
+---CV---
+{analyse_cv}
+
+{blocs}"""
@@ -0,0 +1,108 @@
+"""
+Pré-classement local des offres par rapport à un profil de CV (BM25), sans appel à l'IA.
+
+Le profil (analyse IA + texte du CV) sert de requête ; les offres forment le corpus. Avec
+NumPy/SciPy (`pip install ftcli[ranking]`), tout le corpus est noté en une multiplication
+matrice creuse × vecteur ; sans eux, un calcul équivalent en Python pur est utilisé.
+"""
+import math
+import re
+import unicodedata
+from collections import Counter
+from typing import Dict, List, Sequence, Tuple
+
+# Paramètres BM25 usuels
+BM25_K1 = 1.5
+BM25_B = 0.75
+
+_TOKEN_RE = re.compile(r"[a-z0-9][a-z0-9+#.]*[a-z0-9+#]|[a-z0-9]")
+
+STOPWORDS = frozenset("""
+a afin ai au aux avec ce ces cet cette dans de des du elle en et etc être il ils je la le les leur
+leurs lui ma mais me mes mon ne nos notre nous on ou où par pas pour qu que qui sa se ses si son
+sur ta te tes ton tu un une vos votre vous y h f hf poste profil mission missions entreprise
+sera serez êtes etes avez ainsi plus très tres bien
+""".split())
+
+def tokenize(texte: str) -> List[str]:
+    """Mots en minuscules, sans accents ni mots vides (« Développeur » -> « developpeur »)."""
+    texte = texte.lower().replace("œ", "oe").replace("æ", "ae")
+    texte = unicodedata.normalize("NFKD", texte).encode("ascii", "ignore").decode("ascii")
+    return [t for t in _TOKEN_RE.findall(texte) if t not in STOPWORDS and len(t) > 1]
+
+def offre_text(offre: Dict) -> str:
+    """Texte indexé d'une offre : l'intitulé (compté deux fois), le métier, les compétences, la description."""
+    competences = " ".join(c.get("libelle") or "" for c in offre.get("competences") or [])
+    intitule = offre.get("intitule") or ""  # l'API envoie parfois des champs à null
+    return " ".join([
+        intitule, intitule,
+        offre.get("romeLibelle") or "", offre.get("appellationlibelle") or "",
+        competences, offre.get("description") or "",
+    ])
+
+def profil_text(profil: Dict) -> str:
+    return f"{profil.get('analyse') or ''}\n{profil.get('texte') or ''}"
+
+def _numpy_backend():
+    try:
+        import numpy as np
+        from scipy import sparse
+    except ImportError:
+        return None
+    return np, sparse
+
+def bm25_scores(requete: str, documents: Sequence[str]) -> List[float]:
+    """Score BM25 de chaque document pour la requête (0 si aucun terme commun).
+
+    Chaque terme distinct de la requête compte pour 1 + log(fréquence) : un CV répète souvent
+    les mêmes mots, sans que cela doive écraser les autres compétences.
+    """
+    docs = [tokenize(d) for d in documents]
+    termes = Counter(tokenize(requete))
+    if not docs or not termes:
+        return [0.0] * len(docs)
+    vocabulaire = {t: i for i, t in enumerate(termes)}
+    longueurs = [len(d) for d in docs]
+    longueur_moyenne = (sum(longueurs) / len(docs)) or 1.0
+    poids_requete = [1.0 + math.log(n) for n in termes.values()]
+
+    backend = _numpy_backend()
+    if backend is not None:
+        return _bm25_sparse(backend, docs, vocabulaire, longueurs, longueur_moyenne, poids_requete)
+
+    # Repli en Python pur : même formule, document par document
+    frequences = [Counter(t for t in d if t in vocabulaire) for d in docs]
+    df = Counter(t for f in frequences for t in f)
+    n = len(docs)
+    idf = {t: math.log(1 + (n - df[t] + 0.5) / (df[t] + 0.5)) for t in df}
+    scores = []
+    for f, longueur in zip(frequences, longueurs):
+        norme = BM25_K1 * (1 - BM25_B + BM25_B * longueur / longueur_moyenne)
+        scores.append(sum(poids_requete[vocabulaire[t]] * idf[t] * tf * (BM25_K1 + 1) / (tf + norme) for t, tf in f.items()))
+    return scores
+
+def _bm25_sparse(backend, docs, vocabulaire, longueurs, longueur_moyenne, poids_requete) -> List[float]:
+    np, sparse = backend
+    lignes, colonnes, valeurs = [], [], []
+    for i, d in enumerate(docs):
+        for t, tf in Counter(t for t in d if t in vocabulaire).items():
+            lignes.append(i); colonnes.append(vocabulaire[t]); valeurs.append(tf)
+    tf = sparse.csr_matrix((np.asarray(valeurs, dtype=np.float64), (lignes, colonnes)),
+                           shape=(len(docs), len(vocabulaire)))
+    n = len(docs)
+    df = np.bincount(tf.indices, minlength=len(vocabulaire))
+    idf = np.log1p((n - df + 0.5) / (df + 0.5))
+    norme = BM25_K1 * (1 - BM25_B + BM25_B * np.asarray(longueurs, dtype=np.float64) / longueur_moyenne)
+    # Saturation BM25 appliquée aux seules valeurs non nulles de la matrice creuse
+    lignes_nnz = np.repeat(np.arange(n), np.diff(tf.indptr))
+    tf.data = tf.data * (BM25_K1 + 1) / (tf.data + norme[lignes_nnz])
+    return (tf @ (idf * np.asarray(poids_requete))).tolist()
+
+def rank_offres(profil: Dict, offres: List[Dict]) -> List[Tuple[Dict, int]]:
+    """Offres triées par pertinence décroissante pour le profil, avec un score relatif de 0 à 100
+    (100 = meilleure offre du lot)."""
+    scores = bm25_scores(profil_text(profil), [offre_text(o) for o in offres])
+    meilleur = max(scores, default=0.0) or 1.0
+    # Tri sur le score brut : deux scores distincts peuvent s'arrondir au même entier
+    classement = sorted(zip(offres, scores), key=lambda x: x[1], reverse=True)
+    return [(offre, round(100 * score / meilleur)) for offre, score in classement]
@@ -0,0 +1,103 @@
+"""
+Limiteurs de débit (seau à jetons) utilisables depuis du code synchrone comme asynchrone.
+"""
+import asyncio
+import sqlite3
+import threading
+import time
+from pathlib import Path
+
+INTERACTIVE = "interactive"
+BULK = "bulk"
+
+
+class TokenBucket:
+    """Seau à jetons : `rate` jetons par seconde, au plus `capacity` jetons en réserve.
+
+    `acquire()` s'attend sans bloquer la boucle asyncio ; `acquire_blocking()` est destiné
+    au code synchrone. Les deux partagent le même budget. Les appels de priorité `BULK`
+    laissent toujours `bulk_reserve` jetons disponibles pour les commandes interactives.
+    """
+
+    def __init__(self, rate: float, capacity: float | None = None, bulk_reserve: float = 0.0):
+        if rate <= 0:
+            raise ValueError(f"Le débit d'un seau à jetons doit être strictement positif (reçu : {rate}).")
+        self.rate = float(rate)
+        self.capacity = float(capacity or max(1.0, rate))
+        self.bulk_reserve = min(float(bulk_reserve), self.capacity - 1.0) if self.capacity > 1 else 0.0
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _take(self, available: float, elapsed: float, tokens: float, priority: str) -> tuple[float, float]:
+        """Calcule le nouveau solde et le délai d'attente (0 si les jetons ont été pris)."""
+        available = min(self.capacity, available + max(elapsed, 0.0) * self.rate)
+        needed = tokens + (self.bulk_reserve if priority == BULK else 0.0)
+        if available >= needed:
+            return available - tokens, 0.0
+        return available, (needed - available) / self.rate
+
+    def _reserve(self, tokens: float = 1.0, priority: str = INTERACTIVE) -> float:
+        """Prend `tokens` jetons si possible et retourne 0, sinon le délai d'attente en secondes."""
+        with self._lock:
+            now = time.monotonic()
+            self._tokens, delay = self._take(self._tokens, now - self._updated, tokens, priority)
+            self._updated = now
+            return delay
+
+    async def acquire(self, tokens: float = 1.0, priority: str = INTERACTIVE) -> None:
+        while (delay := self._reserve(tokens, priority)) > 0:
+            await asyncio.sleep(delay)
+
+    def acquire_blocking(self, tokens: float = 1.0, priority: str = INTERACTIVE) -> None:
+        while (delay := self._reserve(tokens, priority)) > 0:
+            time.sleep(delay)
+
+
+class SharedTokenBucket(TokenBucket):
+    """Seau à jetons dont l'état est stocké dans SQLite, donc partagé par tous les processus `ftcli`.
+
+    Chaque prise de jetons est une transaction `BEGIN IMMEDIATE` : deux processus ne peuvent
+    pas consommer le même jeton. Côté asyncio, la transaction (qui peut attendre le verrou
+    d'un autre processus) s'exécute dans un thread pour ne pas bloquer la boucle.
+    """
+
+    def __init__(self, name: str, path: Path, rate: float, capacity: float | None = None, bulk_reserve: float = 0.0):
+        super().__init__(rate, capacity, bulk_reserve)
+        self.name = name
+        self.path = Path(path)
+        self._conn: sqlite3.Connection | None = None
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._conn is None:
+            conn = sqlite3.connect(self.path, timeout=5.0, isolation_level=None, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS buckets (name TEXT PRIMARY KEY, tokens REAL NOT NULL, updated REAL NOT NULL)"
+            )
+            self._conn = conn
+        return self._conn
+
+    def _reserve(self, tokens: float = 1.0, priority: str = INTERACTIVE) -> float:
+        with self._lock:
+            conn = self._connect()
+            now = time.time()
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = conn.execute("SELECT tokens, updated FROM buckets WHERE name = ?", (self.name,)).fetchone()
+                available, updated = row if row else (self.capacity, now)
+                remaining, delay = self._take(available, now - updated, tokens, priority)
+                conn.execute(
+                    "INSERT INTO buckets (name, tokens, updated) VALUES (?, ?, ?) "
+                    "ON CONFLICT(name) DO UPDATE SET tokens = excluded.tokens, updated = excluded.updated",
+                    (self.name, remaining, now),
+                )
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+            return delay
+
+    async def acquire(self, tokens: float = 1.0, priority: str = INTERACTIVE) -> None:
+        while (delay := await asyncio.to_thread(self._reserve, tokens, priority)) > 0:
+            await asyncio.sleep(delay)
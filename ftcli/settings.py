@@ -3,6 +3,12 @@ Paramètres globaux de ftcli, regroupés ici pour être modifiables sans toucher
 """
 from pathlib import Path
 import os
+from dotenv import find_dotenv, load_dotenv
+
+# Fichier .env chargé une seule fois, avant la lecture des paramètres : celui du répertoire
+# courant, puis celui trouvé en remontant depuis le paquet (installation en mode éditable).
+load_dotenv(Path.cwd() / ".env")
+load_dotenv(find_dotenv())
 APP_DIR = Path(os.environ.get("FTCLI_HOME", Path.home() / ".ftcli")).expanduser()
 APP_DIR.mkdir(parents=True, exist_ok=True)
 CACHE_DIR = APP_DIR / "cache"
@@ -13,7 +19,76 @@ TOKEN_URL = (
     "oauth2/access_token?realm=/partenaire"
 )
 RATE_LIMIT_PER_SEC = int(os.getenv("FTCLI_RATE_LIMIT", "10"))
+if RATE_LIMIT_PER_SEC <= 0:
+    raise ValueError(f"FTCLI_RATE_LIMIT doit être un nombre de requêtes par seconde strictement positif (reçu : {RATE_LIMIT_PER_SEC}).")
 DEFAULT_TTL = 60 * 45
 DISK_CACHE_SIZE = 1024 * 1024 * 256
-SECRETS_FILE = APP_DIR / "secrets.enc"
+SECRETS_FILE = APP_DIR / "secrets.enc"  # jeton OAuth France Travail chiffré, partagé entre processus
+# Un jeton est réutilisé jusqu'à TOKEN_EXPIRY_MARGIN s de son expiration, et renouvelé
+# en tâche de fond dès qu'il lui reste moins de TOKEN_REFRESH_AHEAD s.
+TOKEN_EXPIRY_MARGIN = 60
+TOKEN_REFRESH_AHEAD = 60 * 5
+
+# Client HTTP partagé (pool de connexions keep-alive, HTTP/2)
+HTTP_TIMEOUT = float(os.getenv("FTCLI_HTTP_TIMEOUT", "30"))
+HTTP_MAX_CONNECTIONS = int(os.getenv("FTCLI_HTTP_MAX_CONNECTIONS", "20"))
+HTTP_MAX_KEEPALIVE = int(os.getenv("FTCLI_HTTP_MAX_KEEPALIVE", "10"))
+HTTP_KEEPALIVE_EXPIRY = float(os.getenv("FTCLI_HTTP_KEEPALIVE_EXPIRY", "30"))
+HTTP2 = os.getenv("FTCLI_HTTP2", "1") != "0"
+
+# Pagination de la recherche d'offres (l'API limite une page à 150 offres et l'index final à 3149)
+SEARCH_PAGE_SIZE = 150
+SEARCH_MAX_INDEX = 3149
+SEARCH_CONCURRENCY = int(os.getenv("FTCLI_SEARCH_CONCURRENCY", "4"))
+
+# Nombre d'offres analysées simultanément par `synthese`
+SYNTHESE_CONCURRENCY = int(os.getenv("FTCLI_SYNTHESE_CONCURRENCY", "5"))
+
+# Limiteur de débit France Travail partagé entre processus (RATE_LIMIT_PER_SEC requêtes/s au total).
+# Les traitements de fond (priorité "bulk") laissent cette fraction du budget aux commandes interactives.
+RATE_LIMIT_DB = APP_DIR / "ratelimit.db"
+RATE_LIMIT_BULK_RESERVE = float(os.getenv("FTCLI_RATE_LIMIT_BULK_RESERVE", "0.3"))
+FT_PRIORITY = os.getenv("FTCLI_PRIORITY", "interactive")
+
+# Cache des réponses LLM (clé = modèle + version du prompt + entrées normalisées)
+LLM_CACHE_TTL = int(os.getenv("FTCLI_LLM_CACHE_TTL", str(60 * 60 * 24 * 7)))
+LLM_CACHE_SIZE = int(os.getenv("FTCLI_LLM_CACHE_SIZE", str(1024 * 1024 * 64)))
+
+# Cache des API France Travail : TTL et fenêtre stale-while-revalidate par espace de noms (secondes).
+# Une entrée expirée reste sur disque CACHE_STALE_RETENTION secondes pour le mode hors-ligne.
+CACHE_TTLS = {
+    "search": int(os.getenv("FTCLI_TTL_SEARCH", str(60 * 15))),
+    "offre": int(os.getenv("FTCLI_TTL_OFFRE", str(60 * 60 * 6))),
+    "lbb": int(os.getenv("FTCLI_TTL_LBB", str(60 * 60 * 24 * 7))),
+}
+CACHE_STALE_WHILE_REVALIDATE = {
+    "search": 60 * 15,
+    "offre": 60 * 60 * 24,
+    "lbb": 60 * 60 * 24 * 7,
+}
+CACHE_STALE_RETENTION = 60 * 60 * 24 * 30
+MEMORY_CACHE_ENTRIES = 512
+
+# Base SQLite (profils, suivi des candidatures...)
+DB_FILE = Path(os.getenv("FTCLI_DB", APP_DIR / "ftcli.db")).expanduser()
+
+# Synchronisation incrémentale des recherches sauvegardées (`ftcli sync`)
+SYNC_MAX_RESULTS = int(os.getenv("FTCLI_SYNC_MAX_RESULTS", "1000"))
+SYNC_OVERLAP = 60 * 10  # marge (s) retirée du filigrane pour ne rien rater des offres indexées en retard
+SYNC_OFFER_LIFETIME_DAYS = int(os.getenv("FTCLI_SYNC_OFFER_LIFETIME_DAYS", "60"))
+
+# Mode surveillance (`ftcli watch`)
+WATCH_INTERVAL = int(os.getenv("FTCLI_WATCH_INTERVAL", str(60 * 30)))
+WATCH_JITTER = float(os.getenv("FTCLI_WATCH_JITTER", "0.1"))
+WATCH_CONCURRENCY = int(os.getenv("FTCLI_WATCH_CONCURRENCY", "3"))
+
+# Nombre d'étapes indépendantes d'un plan de l'agent exécutées simultanément
+AGENT_CONCURRENCY = int(os.getenv("FTCLI_AGENT_CONCURRENCY", "4"))
+
+# Prompts IA : longueur maximale (caractères) de la description d'offre envoyée au modèle
+PROMPT_MAX_DESCRIPTION = int(os.getenv("FTCLI_PROMPT_MAX_DESCRIPTION", "2500"))
 
+# Matching par lots (`synthese`, action `compare` de l'agent) : nombre maximal d'offres et taille
+# maximale (caractères d'offres projetées) d'un même appel IA ; un lot plus gros est découpé.
+MATCH_BATCH_SIZE = int(os.getenv("FTCLI_MATCH_BATCH_SIZE", "10"))
+MATCH_BATCH_MAX_CHARS = int(os.getenv("FTCLI_MATCH_BATCH_MAX_CHARS", "30000"))
@@ -0,0 +1,36 @@
+"""
+Regroupement des appels concurrents identiques ("single-flight").
+"""
+import asyncio
+from typing import Any, Awaitable, Callable, Dict
+
+
+class SingleFlight:
+    """Un seul appel en vol par clé : les appelants concurrents attendent le même résultat.
+
+    Le travail tourne dans une tâche indépendante, protégée par `asyncio.shield` : l'annulation
+    d'un appelant n'interrompt pas la requête pour les autres. Le résultat ou l'exception est
+    partagé par tous ; la clé est libérée dès la fin de l'appel (rien n'est mémorisé au-delà).
+    """
+
+    def __init__(self):
+        self._inflight: Dict[str, asyncio.Task] = {}
+
+    def in_flight(self, key: str) -> bool:
+        task = self._inflight.get(key)
+        return task is not None and not task.done()
+
+    async def do(self, key: str, fn: Callable[[], Awaitable[Any]]) -> Any:
+        loop = asyncio.get_running_loop()
+        task = self._inflight.get(key)
+        if task is None or task.done() or task.get_loop() is not loop:
+            task = loop.create_task(fn())
+            self._inflight[key] = task
+            task.add_done_callback(lambda t: self._forget(key, t))
+        return await asyncio.shield(task)
+
+    def _forget(self, key: str, task: asyncio.Task):
+        if self._inflight.get(key) is task:
+            del self._inflight[key]
+        if not task.cancelled():
+            task.exception()  # évite l'avertissement "exception was never retrieved"
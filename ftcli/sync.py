@@ -0,0 +1,107 @@
+"""
+Synchronisation incrémentale des recherches sauvegardées.
+
+Chaque recherche conserve un filigrane (`watermark`) : la date de création minimale des offres
+à demander au prochain passage. Seules les offres publiées depuis sont téléchargées
+(filtres `minCreationDate` / `maxCreationDate` de l'API), puis fusionnées dans l'entrepôt local.
+
+L'API plafonne une recherche à `SEARCH_MAX_INDEX + 1` résultats et la synchronisation à
+`SYNC_MAX_RESULTS` : quand une fenêtre annonce plus d'offres, elle est coupée en deux et les
+moitiés sont parcourues de la plus ancienne à la plus récente. Le filigrane n'avance que
+jusqu'à la fin de la dernière fenêtre entièrement reçue ; le reste vient au passage suivant.
+Le cache des recherches est ignoré : une synchronisation interroge toujours l'API.
+"""
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List, Optional, Tuple
+
+from . import database
+from . import settings
+from .client import FTClient
+
+API_DATE_FORMAT = "%Y-%m-%dT%H:%M:%SZ"
+SORT_BY_DATE = 1  # date de création décroissante (l'ordre par défaut est la pertinence)
+MIN_WINDOW = timedelta(minutes=1)  # en deçà, une fenêtre n'est plus coupée
+
+def _api_date(date: datetime) -> str:
+    return date.strftime(API_DATE_FORMAT)
+
+def _window(debut: datetime, fin: datetime) -> Dict[str, str]:
+    return {"minCreationDate": _api_date(debut), "maxCreationDate": _api_date(fin)}
+
+async def _fetch(client: FTClient, criteres: Dict[str, Any], limit: int) -> List[Dict]:
+    return [offre async for offre in client.iter_offres(max_results=limit, use_cache=False, sort=SORT_BY_DATE, **criteres)]
+
+async def _sync_windows(client: FTClient, criteres: Dict[str, Any], debut: datetime, fin: datetime,
+                        max_results: int) -> Tuple[List[Dict], datetime, int]:
+    """Parcourt `[debut, fin]` par fenêtres, des plus anciennes aux plus récentes.
+
+    Retourne les offres reçues, la date jusqu'à laquelle tout a été reçu et le nombre d'offres
+    annoncées mais non téléchargées (quota `max_results` épuisé).
+    """
+    offres: List[Dict] = []
+    fenetres = [(debut, fin)]
+    couvert, manquantes = debut, 0
+    while fenetres:
+        reste = max_results - len(offres)
+        if reste <= 0:
+            manquantes += await client.count_offres(use_cache=False, **criteres, **_window(fenetres[0][0], fin))
+            break
+        a, b = fenetres[0]
+        limit = min(reste, settings.SEARCH_MAX_INDEX + 1)
+        total = await client.count_offres(use_cache=False, **criteres, **_window(a, b))
+        if total > limit and b - a > MIN_WINDOW:
+            milieu = a + (b - a) / 2
+            fenetres[0:1] = [(a, milieu), (milieu, b)]
+            continue
+        fenetres.pop(0)
+        if total:
+            offres.extend(await _fetch(client, {**criteres, **_window(a, b)}, limit))
+        manquantes += max(0, total - limit)  # fenêtre d'une minute plus fournie que le quota
+        couvert = b
+    return offres, couvert, manquantes
+
+async def sync_search(client: FTClient, recherche: Dict, max_results: int = settings.SYNC_MAX_RESULTS) -> Dict:
+    """Synchronise une recherche sauvegardée et retourne son rapport.
+
+    Le rapport contient `recues`, les listes d'ID `new` / `updated`, et `expired` : le nombre
+    d'offres de la recherche dont la date de création dépasse `SYNC_OFFER_LIFETIME_DAYS`.
+    L'API ne signale pas les offres retirées : l'expiration est une estimation par l'âge.
+    `manquantes` compte les offres annoncées mais non reçues : en mode incrémental, elles
+    seront téléchargées au prochain passage (`a_suivre`) ; en mode complet, seules les
+    `max_results` plus récentes sont conservées.
+    """
+    debut = datetime.now(timezone.utc)
+    criteres = {
+        "mots": recherche["mots"],
+        "departement": recherche["departement"],
+        "typeContrat": recherche["type_contrat"],
+    }
+    watermark: Optional[str] = recherche["watermark"]
+    if watermark:
+        depuis = datetime.strptime(watermark, API_DATE_FORMAT).replace(tzinfo=timezone.utc)
+        offres, couvert, manquantes = await _sync_windows(client, criteres, depuis, debut, max_results)
+        if couvert > depuis:
+            watermark = _api_date(max(depuis, couvert - timedelta(seconds=settings.SYNC_OVERLAP)))
+    else:
+        limit = min(max_results, settings.SEARCH_MAX_INDEX + 1)
+        total = await client.count_offres(use_cache=False, **criteres)
+        offres = await _fetch(client, criteres, limit) if total else []
+        manquantes = max(0, total - len(offres))
+        couvert = debut
+        watermark = _api_date(debut - timedelta(seconds=settings.SYNC_OVERLAP))
+
+    offres = list({offre["id"]: offre for offre in offres if offre.get("id")}.values())  # bornes des fenêtres incluses
+    changements = database.record_search_offers(recherche["id"], offres)
+    limite = debut - timedelta(days=settings.SYNC_OFFER_LIFETIME_DAYS)
+    expired = database.expire_search_offers(recherche["id"], limite.strftime(API_DATE_FORMAT))
+    database.update_search_watermark(recherche["id"], watermark, debut.isoformat())
+    return {
+        "nom": recherche["nom"],
+        "recues": len(offres),
+        "new": changements["new"],
+        "updated": changements["updated"],
+        "expired": expired,
+        "incremental": bool(recherche["watermark"]),
+        "manquantes": manquantes,
+        "a_suivre": couvert < debut,
+    }
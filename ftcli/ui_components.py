@@ -1,23 +1,27 @@
+import rich.box
 from rich.console import Console
 from rich.panel import Panel
 from rich.align import Align
 from rich.text import Text
-import questionary
-from questionary import Style
+from rich.table import Table
+from typing import Dict, List, Optional
 
+# questionary (prompt_toolkit) et le rendu Markdown sont importés à l'usage : ce module est
+# chargé par toutes les commandes de la CLI.
 console = Console()
 
-custom_style = Style([
+CUSTOM_STYLE = [
     ('qmark', 'fg:#673ab7 bold'),
     ('question', 'bold'),
     ('answer', 'fg:#f44336 bold'),
     ('pointer', 'fg:#673ab7 bold'),
     ('highlighted', 'fg:#673ab7 bold'),
     ('selected', 'fg:#cc5454'),
-])
+]
 
 def create_main_menu() -> str:
     """Crée et affiche un menu principal interactif."""
+    import questionary
     
     ascii_logo = """
    ╔═╗╔╦╗╔═╗┬ ┬ 
@@ -42,9 +46,55 @@ def create_main_menu() -> str:
     choice = questionary.select(
         "Que souhaitez-vous faire ?",
         choices=choices,
-        style=custom_style,
+        style=questionary.Style(CUSTOM_STYLE),
         qmark="➜",
         pointer="▶",
     ).ask()
     
     return choice if choice else "Quitter"
+
+def truncate_text(text: str, max_len: int = 40) -> str:
+    if text and len(text) > max_len:
+        return text[: max_len - 3].strip() + "..."
+    return text
+
+def rapport_markdown(resultat: Dict) -> str:
+    """Rapport de compatibilité structuré (`score`, `strengths`, `gaps`, `keywords`, `suggestion`) en Markdown."""
+    def puces(elements: List[str]) -> str:
+        return "\n".join(f"- {e}" for e in elements) or "- _aucun_"
+    sections = [
+        f"### 📊 Score de Compatibilité : {resultat['score']}%",
+        f"### ✅ Points Forts\n{puces(resultat.get('strengths', []))}",
+        f"### ❌ Points Faibles\n{puces(resultat.get('gaps', []))}",
+    ]
+    if resultat.get("keywords"):
+        sections.append(f"### 🔑 Mots-clés à intégrer\n{', '.join(resultat['keywords'])}")
+    if resultat.get("suggestion"):
+        sections.append(f"### 💬 Suggestion Stratégique\n{resultat['suggestion']}")
+    return "\n\n".join(sections)
+
+def contrat_style(type_contrat: str) -> str:
+    return "green" if type_contrat == "CDI" else "yellow" if type_contrat == "CDD" else "dim"
+
+def offres_table(offres: List[Dict], title: str, scores: Optional[List[int]] = None) -> Table:
+    """Tableau des résultats de recherche (ID, intitulé, lieu, type de contrat).
+
+    `scores` (un par offre, de 0 à 100) ajoute une colonne de pertinence.
+    """
+    table = Table(title=title, box=rich.box.SIMPLE_HEAVY)
+    if scores is not None:
+        table.add_column("Pertinence", style="magenta", justify="right")
+    table.add_column("ID Offre", style="cyan", no_wrap=True); table.add_column("Intitulé", style="white"); table.add_column("Lieu", style="yellow"); table.add_column("Type Contrat", style="bold")
+    for i, offre in enumerate(offres):
+        type_contrat = offre.get("typeContrat", "N/A")
+        style = contrat_style(type_contrat)
+        pertinence = [f"{scores[i]}%"] if scores is not None else []
+        table.add_row(*pertinence, offre.get("id", "N/A"), truncate_text(offre.get("intitule", "N/A")), truncate_text(offre.get("lieuTravail", {}).get("libelle", "N/A")), f"[{style}]{type_contrat}[/{style}]")
+    return table
+
+def offre_panel(offre: Dict) -> Panel:
+    """Fiche détaillée d'une offre."""
+    from rich.markdown import Markdown
+    title=offre.get("intitule","N/A"); entreprise=offre.get("entreprise",{}).get("nom","N/A"); lieu=offre.get("lieuTravail",{}).get("libelle","N/A"); contrat=offre.get("typeContrat","N/A"); salaire=offre.get("salaire",{}).get("libelle","N/A"); desc=offre.get("description","N/A")
+    md_content = f"### Entreprise: {entreprise}\n**Lieu**: {lieu}\n**Contrat**: {contrat} | **Salaire**: {salaire}\n\n{desc}"
+    return Panel(Markdown(md_content), title=f"[bold]{title}[/bold]", border_style="cyan", expand=True)
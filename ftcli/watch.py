@@ -0,0 +1,82 @@
+"""
+Surveillance en continu des recherches sauvegardées (`ftcli watch`).
+
+Un seul processus longue durée synchronise périodiquement les recherches (voir `sync.py`),
+écarte les offres déjà notifiées (ensemble persistant `watch_seen`) et regroupe les nouveautés
+de chaque cycle dans une seule notification.
+"""
+import asyncio
+import random
+from typing import Callable, Dict, List, Optional
+
+from . import database
+from . import settings
+from .client import FTClient
+from .notify import notifier
+from .ratelimit import BULK
+from .sync import sync_search
+
+DIGEST_MAX_LINES = 5
+
+def _digest(nouvelles: Dict[str, List[str]]) -> Optional[tuple[str, str]]:
+    """Titre et texte de la notification récapitulative, ou None s'il n'y a rien de nouveau."""
+    total = sum(len(ids) for ids in nouvelles.values())
+    if not total:
+        return None
+    titres = database.get_offer_titles(id_ for ids in nouvelles.values() for id_ in ids)
+    lignes = [
+        f"• {titres.get(offre_id) or offre_id} ({nom})"
+        for nom, ids in nouvelles.items() for offre_id in ids
+    ]
+    if len(lignes) > DIGEST_MAX_LINES:
+        lignes = lignes[:DIGEST_MAX_LINES] + [f"… et {len(lignes) - DIGEST_MAX_LINES} autre(s)"]
+    return f"FTCli : {total} nouvelle(s) offre(s)", "\n".join(lignes)
+
+async def run_cycle(client: FTClient, concurrency: int = settings.WATCH_CONCURRENCY) -> Dict:
+    """Synchronise toutes les recherches sauvegardées et envoie un récapitulatif des nouveautés.
+
+    Lors de la première synchronisation d'une recherche, ses offres sont marquées comme vues
+    sans être notifiées. Retourne `{"nouvelles": {nom: [ids]}, "erreurs": {nom: message},
+    "manquantes": {nom: nombre}}` ; les offres manquantes d'une recherche incrémentale sont
+    téléchargées aux cycles suivants.
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+    nouvelles: Dict[str, List[str]] = {}
+    erreurs: Dict[str, str] = {}
+    manquantes: Dict[str, int] = {}
+
+    async def one(recherche: Dict):
+        async with semaphore:
+            try:
+                rapport = await sync_search(client, recherche)
+            except Exception as e:
+                erreurs[recherche["nom"]] = str(e)
+                return
+        if rapport["manquantes"]:
+            manquantes[recherche["nom"]] = rapport["manquantes"]
+        inedites = database.mark_offers_seen(rapport["new"])
+        if rapport["incremental"] and inedites:
+            nouvelles[recherche["nom"]] = inedites
+
+    await asyncio.gather(*(one(r) for r in database.get_saved_searches()))
+    if (digest := _digest(nouvelles)) is not None:
+        notifier(*digest)
+    return {"nouvelles": nouvelles, "erreurs": erreurs, "manquantes": manquantes}
+
+async def run_watch(
+    interval: int = settings.WATCH_INTERVAL,
+    jitter: float = settings.WATCH_JITTER,
+    concurrency: int = settings.WATCH_CONCURRENCY,
+    once: bool = False,
+    on_cycle: Callable[[Dict], None] | None = None,
+):
+    """Boucle de surveillance. Le délai entre deux cycles varie de ±`jitter` (fraction de
+    `interval`) pour étaler la charge ; les requêtes sont en priorité `bulk`."""
+    async with FTClient(priority=BULK) as client:
+        while True:
+            resultat = await run_cycle(client, concurrency)
+            if on_cycle:
+                on_cycle(resultat)
+            if once:
+                return
+            await asyncio.sleep(max(1.0, interval * (1 + random.uniform(-jitter, jitter))))